@@ -8,13 +8,12 @@ import sys, inspect
 #-------------------------------------------------------------------------------
 def PYB11GenerateClassAttributes(klass, klassinst, klassattrs, ss):
 
-    globs, locs = globals(), locals()
-    PYB11attrs = [x for x in dir(klass) if isinstance(eval("klass.%s" % x, globs, locs), PYB11ClassAttribute) and x in klass.__dict__]
-    if PYB11attrs:
+    attributes = PYB11getClassIndex(klass).attributes
+    if attributes:
         ss("\n  // Properties\n")
 
-    for attrname in PYB11attrs:
-        exec('klassinst.%s("%s", klassattrs, ss)' % (attrname, attrname))
+    for attrname, attr in attributes:
+        attr(attrname, klassattrs, ss)
     ss("\n")
 
     return
@@ -90,3 +89,59 @@ class PYB11readonly(PYB11ClassAttribute):
                  doc = None):
         PYB11ClassAttribute.__init__(self, static, pyname, cppname, returnpolicy, doc, "readonly")
 
+
+#-------------------------------------------------------------------------------
+# numpy_view
+#
+# A read only attribute giving a NumPy array (py::array_t) viewing the storage
+# of a contiguous member (std::vector, std::array, raw array) without copying
+# it.  The array keeps the owning object alive, and is itself read only if
+# readonly is set or the elements are const.  The element type defaults to that of the member, and
+# structured types need registering with PYBIND11_NUMPY_DTYPE.  cppname may
+# also be an expression of the object giving the storage, such as "data()".
+#-------------------------------------------------------------------------------
+class PYB11numpy_view(PYB11ClassAttribute):
+
+    def __init__(self,
+                 dtype = None,
+                 readonly = False,
+                 pyname = None,
+                 cppname = None,
+                 doc = None):
+        PYB11ClassAttribute.__init__(self, False, pyname, cppname, None, doc, "numpy_view")
+        self.dtype = dtype
+        self.readonly = readonly
+        return
+
+    def __call__(self,
+                 name,
+                 klassattrs,
+                 ss):
+        if self.pyname:
+            pyname = self.pyname
+        else:
+            pyname = name
+        if self.cppname:
+            cppname = self.cppname
+        else:
+            cppname = name
+        ss('  obj.def_property_readonly("%s", [](py::object& pyself) -> py::array {\n' % pyname)
+        ss('    auto& self = pyself.cast<%(namespace)s%(cppname)s&>();\n' % klassattrs)
+        ss('    auto& storage = self.%s;\n' % cppname)
+        if self.dtype:
+            ss('    using PYB11value = %s;\n' % self.dtype)
+        else:
+            ss('    using PYB11value = std::remove_cv_t<std::remove_reference_t<decltype(*std::begin(storage))>>;\n')
+        ss('''    const auto n = static_cast<py::ssize_t>(std::distance(std::begin(storage), std::end(storage)));
+    py::array_t<PYB11value> result(n, n > 0 ? &(*std::begin(storage)) : nullptr, pyself);
+''')
+        if self.readonly:
+            ss('    result.attr("flags").attr("writeable") = false;\n')
+        else:
+            ss('    if (std::is_const<std::remove_reference_t<decltype(*std::begin(storage))>>::value) result.attr("flags").attr("writeable") = false;\n')
+        ss('    return result;\n  }')
+        if self.doc:
+            ss(', ')
+            PYB11docstring(self.doc, ss)
+        ss(");\n")
+        return
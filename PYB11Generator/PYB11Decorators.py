@@ -4,12 +4,14 @@
 # from functools import wraps as PYB11wraps    # Add PYB11 to screen out in generation
 # import decorator as PYB11decorator           # To preserve wrapped functions args
 # import types
+from .PYB11cache import PYB11invalidateAttrs
 
 #-------------------------------------------------------------------------------
 # ignore
 #-------------------------------------------------------------------------------
 def PYB11ignore(thing):
     thing.PYB11ignore = True
+    PYB11invalidateAttrs(thing)
     return thing
 
 #-------------------------------------------------------------------------------
@@ -31,6 +33,7 @@ class PYB11template:
         else:
             thing.PYB11ignore = False
         thing.PYB11template = self.template
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -44,6 +47,7 @@ class PYB11template_dict:
         return
     def __call__(self, thing):
         thing.PYB11template_dict = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -51,6 +55,7 @@ class PYB11template_dict:
 #-------------------------------------------------------------------------------
 def PYB11singleton(cls):
     cls.PYB11singleton = True
+    PYB11invalidateAttrs(cls)
     return cls
 
 #-------------------------------------------------------------------------------
@@ -62,6 +67,7 @@ class PYB11holder:
         return
     def __call__(self, thing):
         thing.PYB11holder = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -69,8 +75,24 @@ class PYB11holder:
 #-------------------------------------------------------------------------------
 def PYB11dynamic_attr(cls):
     cls.PYB11dynamic_attr = True
+    PYB11invalidateAttrs(cls)
     return cls
 
+#-------------------------------------------------------------------------------
+# buffer (class)
+#-------------------------------------------------------------------------------
+class PYB11buffer:
+    def __init__(self, data = "data", size = "size", dtype = None, readonly = False):
+        self.val = {"data"     : data,
+                    "size"     : size,
+                    "dtype"    : dtype,
+                    "readonly" : readonly}
+        return
+    def __call__(self, thing):
+        thing.PYB11buffer = self.val
+        PYB11invalidateAttrs(thing)
+        return thing
+
 #-------------------------------------------------------------------------------
 # namespace (class or method)
 #-------------------------------------------------------------------------------
@@ -82,6 +104,7 @@ class PYB11namespace:
         return
     def __call__(self, thing):
         thing.PYB11namespace = self.namespace
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -94,6 +117,7 @@ class PYB11pycppname:
     def __call__(self, thing):
         thing.PYB11cppname = self.x
         thing.PYB11pyname = self.x
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -105,6 +129,7 @@ class PYB11cppname:
         return
     def __call__(self, thing):
         thing.PYB11cppname = self.cppname
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -116,6 +141,7 @@ class PYB11pyname:
         return
     def __call__(self, thing):
         thing.PYB11pyname = self.pyname
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -123,6 +149,7 @@ class PYB11pyname:
 #-------------------------------------------------------------------------------
 def PYB11virtual(f):
     f.PYB11virtual = True
+    PYB11invalidateAttrs(f)
     return f
 
 #-------------------------------------------------------------------------------
@@ -130,6 +157,7 @@ def PYB11virtual(f):
 #-------------------------------------------------------------------------------
 def PYB11pure_virtual(f):
     f.PYB11pure_virtual = True
+    PYB11invalidateAttrs(f)
     return f
 
 #-------------------------------------------------------------------------------
@@ -137,6 +165,7 @@ def PYB11pure_virtual(f):
 #-------------------------------------------------------------------------------
 def PYB11protected(f):
     f.PYB11protected = True
+    PYB11invalidateAttrs(f)
     return f
 
 #-------------------------------------------------------------------------------
@@ -144,6 +173,7 @@ def PYB11protected(f):
 #-------------------------------------------------------------------------------
 def PYB11const(f):
     f.PYB11const = True
+    PYB11invalidateAttrs(f)
     return f
 
 #-------------------------------------------------------------------------------
@@ -151,6 +181,7 @@ def PYB11const(f):
 #-------------------------------------------------------------------------------
 def PYB11static(f):
     f.PYB11static = True
+    PYB11invalidateAttrs(f)
     return f
 
 #-------------------------------------------------------------------------------
@@ -158,6 +189,7 @@ def PYB11static(f):
 #-------------------------------------------------------------------------------
 def PYB11noconvert(f):
     f.PYB11noconvert = True
+    PYB11invalidateAttrs(f)
     return f
 
 #-------------------------------------------------------------------------------
@@ -169,6 +201,7 @@ class PYB11implementation:
         return
     def __call__(self, thing):
         thing.PYB11implementation = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -180,6 +213,7 @@ class PYB11returnpolicy:
         return
     def __call__(self, thing):
         thing.PYB11returnpolicy = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -192,6 +226,7 @@ class PYB11keepalive:
         return
     def __call__(self, thing):
         thing.PYB11keepalive = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -203,6 +238,56 @@ class PYB11call_guard:
         return
     def __call__(self, thing):
         thing.PYB11call_guard = self.val
+        PYB11invalidateAttrs(thing)
+        return thing
+
+#-------------------------------------------------------------------------------
+# releaseGIL (method, function, or class default)
+#-------------------------------------------------------------------------------
+def PYB11releaseGIL(thing):
+    thing.PYB11release_gil = True
+    PYB11invalidateAttrs(thing)
+    return thing
+
+#-------------------------------------------------------------------------------
+# keepGIL (method, function, or class default)
+#-------------------------------------------------------------------------------
+def PYB11keepGIL(thing):
+    thing.PYB11release_gil = False
+    PYB11invalidateAttrs(thing)
+    return thing
+
+#-------------------------------------------------------------------------------
+# thread_unsafe (method or class)
+#-------------------------------------------------------------------------------
+class PYB11thread_unsafe:
+    def __init__(self, guard = "critical_section"):
+        assert guard in ("critical_section", "mutex"), "PYB11thread_unsafe: guard must be critical_section or mutex"
+        self.val = guard
+        return
+    def __call__(self, thing):
+        thing.PYB11thread_unsafe = self.val
+        PYB11invalidateAttrs(thing)
+        return thing
+
+#-------------------------------------------------------------------------------
+# thread_safe (method)
+#-------------------------------------------------------------------------------
+def PYB11thread_safe(thing):
+    thing.PYB11thread_unsafe = False
+    PYB11invalidateAttrs(thing)
+    return thing
+
+#-------------------------------------------------------------------------------
+# vectorize (function or method)
+#-------------------------------------------------------------------------------
+class PYB11vectorize:
+    def __init__(self, *args, pyname = None):
+        self.val = (tuple(args), pyname)
+        return
+    def __call__(self, thing):
+        thing.PYB11vectorize = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -216,6 +301,7 @@ class PYB11module:
         if not hasattr(thing, "PYB11module"):
             thing.PYB11module = {}
         thing.PYB11module[thing] = self.val
+        PYB11invalidateAttrs(thing)
         return thing
 
 #-------------------------------------------------------------------------------
@@ -223,4 +309,5 @@ class PYB11module:
 #-------------------------------------------------------------------------------
 def PYB11operator(f):
     f.PYB11operator = True
+    PYB11invalidateAttrs(f)
     return f
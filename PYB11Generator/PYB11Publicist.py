@@ -4,6 +4,9 @@
 import sys, os, io, inspect
 
 from .PYB11utils import *
+from .PYB11parallel import *
+from .PYB11incremental import *
+from .PYB11instantiation import *
 
 #-------------------------------------------------------------------------------
 # PYB11generateModulePublicists
@@ -31,10 +34,11 @@ def PYB11generateModulePublicists(modobj):
                     cppbasename = cppbasename.split("<")[0]
                 assert cppbasename
                 filename = os.path.join(modobj.basedir, modobj.basename + f"_{cppbasename}_publicist.hh")
-                with open(filename, "w") as f:
-                    PYB11generatePublicist(modobj, klass, f.write)
+                PYB11addUnit(modobj, filename,
+                             lambda ss, klass=klass: PYB11generatePublicist(modobj, klass, ss),
+                             PYB11instantiationFingerprint(modobj, "publicist", klass))
             else:
-                with open(modobj.filename, "a") as f:
+                with modobj.emitter.open(modobj.filename, "a") as f:
                     PYB11generatePublicist(modobj, klass, f.write)
     return
 
@@ -103,6 +107,8 @@ public:
     ss("};\n\n")
     for ns in klassattrs["namespace"].split("::")[:-1]:
         ss("}\n")
+    if modobj.explicit_instantiation and template_klass:
+        PYB11generateExternTemplates(modobj, "publicist", ss, klass)
     ss("\n#endif\n")
 
     # Sub any template parameters.
@@ -75,10 +75,7 @@ class PYB11_bind_map:
 # Get the STL objects to bind from a module
 #-------------------------------------------------------------------------------
 def PYB11STLobjs(modobj):
-    return [(name, obj) for (name, obj) in inspect.getmembers(modobj)
-            if name[:5] != "PYB11" and
-            (isinstance(obj, PYB11_bind_vector) or
-             isinstance(obj, PYB11_bind_map))]
+    return list(PYB11getModuleIndex(modobj).stl)
 
 #-------------------------------------------------------------------------------
 # PYB11generateModuleSTLmethod
@@ -90,7 +87,7 @@ def PYB11generateModuleSTLmethod(modobj, stlobjs):
     modobj.generatedfiles_list.append(filename)
     name = modobj.PYB11modulename
     modincludefile = modobj.master_include_file
-    with open(os.path.join(modobj.basedir, filename), "w") as f:
+    with modobj.emitter.open(os.path.join(modobj.basedir, filename), "w") as f:
         ss = f.write
         ss(f'''//------------------------------------------------------------------------------
 // Bind STL for {name} module
@@ -113,21 +110,21 @@ void bindModuleSTLtypes(py::module_& m) {{
 def PYB11generateModuleSTL(modobj):
     stuff = PYB11STLobjs(modobj)
     if stuff:
-        with open(modobj.filename, "a") as f:
+        with modobj.emitter.open(modobj.filename, "a") as f:
             ss = f.write
             ss("  //..............................................................................\n")
             ss("  // STL bindings\n")
 
         if False: # modobj.multiple_files:
             # Multiple files
-            with open(modobj.filename, "a") as f:
+            with modobj.emitter.open(modobj.filename, "a") as f:
                 ss = f.write
                 ss("  bindModuleSTLtypes(m);\n\n")
             PYB11generateModuleSTLmethod(modobj, stuff)
 
         else:
             # Monolithic file
-            with open(modobj.filename, "a") as f:
+            with modobj.emitter.open(modobj.filename, "a") as f:
                 ss = f.write
                 for (name, obj) in stuff:
                     ss("  ")
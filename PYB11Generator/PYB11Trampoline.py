@@ -4,6 +4,10 @@
 import sys, os, io, inspect
 
 from .PYB11utils import *
+from .PYB11parallel import *
+from .PYB11incremental import *
+from .PYB11instantiation import *
+from .PYB11gil import *
 
 #-------------------------------------------------------------------------------
 # PYB11generateModuleTrampolines
@@ -41,11 +45,11 @@ def PYB11generateModuleTrampolines(modobj):
                 cppbasename = cppbasename.split("<")[0]
             assert cppbasename
             filename = os.path.join(modobj.basedir, modobj.basename + f"_{cppbasename}_trampoline.hh")
-            with open(filename, "w") as f:
-                ss = f.write
-                PYB11generateTrampoline(modobj, klass, ss)
+            PYB11addUnit(modobj, filename,
+                         lambda ss, klass=klass: PYB11generateTrampoline(modobj, klass, ss),
+                         PYB11instantiationFingerprint(modobj, "trampoline" + (" (GIL released)" if PYB11moduleReleasesGIL() else ""), klass))
         else:
-            with open(modobj.filename, "a") as f:
+            with modobj.emitter.open(modobj.filename, "a") as f:
                 ss = f.write
                 PYB11generateTrampoline(modobj, klass, ss)
     return
@@ -156,104 +160,22 @@ public:
     # We use an independent StringIO object for this, since we may have some new typedefs that
     # need to be added before this stuff is output to the source.
     methfms = io.StringIO()
-    boundMethods = []
+    boundMethods = set()
     for (bklass, bklassname) in zip(inspect.getmro(klass), bklassnames):
+        for (mname, signature, body, typedefstring) in PYB11virtualMethodTable(bklass):
 
-        bklassinst = bklass()
-        bklassattrs = PYB11attrs(bklass)
-        methods = [(mname, meth) for (mname, meth) in PYB11ClassMethods(bklass)
-                   if (not PYB11attrs(meth)["ignore"] and
-                       (PYB11attrs(meth)["virtual"] or PYB11attrs(meth)["pure_virtual"]) and
-                       mname in bklass.__dict__)]
-
-        # Look for any template parameters of the base not shared by the class in question
-        bklasssubs = {}
-        for name in bklassattrs["template"]:
-            if not name in klassattrs["template"]:
-                nameval = name.split()[1]
-                assert nameval in Tdict
-                bklasssubs[name] = Tdict[nameval]
-
-        for mname, meth in methods:
-            
-            # We build this method string up independent of the output stream
-            # until we determine if it's already been generated.
-            fms = io.StringIO()
-
-            methattrs = PYB11attrs(meth)
-            methattrs["returnType"] = eval("bklassinst." + mname + "()")
-            assert methattrs["returnType"]    # We require the full spec for virtual methods
-            fms.write("  virtual %(returnType)s %(cppname)s(" % methattrs)
-
-            # Fill out the argument list for this method
-            args = PYB11parseArgs(meth)
-            for i, (argType, argName, default) in enumerate(args):
-                fms.write("%s %s" % (argType, argName))
-                if i < len(args) - 1:
-                    fms.write(", ")
-            if methattrs["const"]:
-                fms.write(") const override { ")
-            else:
-                fms.write(") override { ")
-
-            # At this point we can make the call of whether this is a new method.
+            # Is this a new method?
             try:
-                thpt = fms.getvalue() % Tdict
+                thpt = signature % Tdict
             except:
                 raise RuntimeError("Unable to generate call descriptor for %s in %s->%s" % (mname, str(klass), bklassname))
             if not thpt in boundMethods:
-                boundMethods.append(fms.getvalue() % Tdict)
-
-                # Check if the returnType C++ name will choke PYBIND11_OVERLOAD*
-                returnType = methattrs["returnType"]
-                if PYB11badchars(returnType):
-                    returnType = PYB11mangle(returnType)
-                    typedefstring = "    typedef %s %s;\n" % (methattrs["returnType"], returnType)
-                    if typedefstring not in typedefs:
-                        typedefs += typedefstring
-                    methattrs["returnType"] = returnType
-
-                # Check if we need to work around any reference arguments due to the pybind11 bug discussed in
-                # https://stackoverflow.com/questions/59330279/problems-passing-a-stdvector-by-reference-though-virtual-functions-using-pybin/59331026?noredirect=1#comment104861677_59331026
-                altered = False
-                for i, (argType, argName, default) in enumerate(args):
-                    if "&" in argType:
-                        altered = True
-                        fms.write("\n    py::object dummy%i = py::cast(&%s);\n" % (i, argName))
-                if altered:
-                    fms.write("    ")
-
-                if methattrs["pure_virtual"]:
-                    if methattrs["cppname"] == methattrs["pyname"]:
-                        fms.write("PYBIND11_OVERLOAD_PURE(%(returnType)s, PYB11self, %(cppname)s, " % methattrs)
-                    else:
-                        fms.write('PYBIND11_OVERLOAD_PURE_NAME(%(returnType)s, PYB11self, "%(pyname)s", %(cppname)s, ' % methattrs)
-                else:
-                    # HACK!  To workaround what appears to be a bug in overloading virtual method callbacks
-                    # in pybind11 (see https://github.com/pybind/pybind11/issues/1547), we have to give
-                    # the address of the object that actually implements it.  This is clealy not how a human
-                    # should have to handle this, but since we're code generating this we can do this explicit
-                    # workaround.
-                    #fms.write("PYBIND11_OVERLOAD(%(returnType)s, PYB11self, %(cppname)s, " % methattrs)
-                    if methattrs["cppname"] == methattrs["pyname"]:
-                        fms.write("PYBIND11_OVERLOAD(%(returnType)s, PYB11self, %(cppname)s, " % methattrs)
-                    else:
-                        fms.write('PYBIND11_OVERLOAD_NAME(%(returnType)s, PYB11self, "%(pyname)s", %(cppname)s, ' % methattrs)
-                    #fms.write(PYB11mangle(bklassname) + ", ")
-
-                for i, (argType, argName, default) in enumerate(args):
-                    if i < len(args) - 1:
-                        fms.write(argName + ", ")
-                    else:
-                        fms.write(argName)
-                if altered:
-                    fms.write(");\n  }\n")
-                else:
-                    fms.write("); }\n")
+                boundMethods.add(thpt)
+                if typedefstring and typedefstring not in typedefs:
+                    typedefs += typedefstring
 
                 # Write to the method overloading stream.
-                methfms.write(fms.getvalue())
-            fms.close()
+                methfms.write(signature + body)
 
     # Write the full typdefs
     ss(typedefs + "\n")
@@ -266,9 +188,122 @@ public:
     ss("};\n\n")
     for ns in klassattrs["namespace"].split("::")[:-1]:
         ss("}\n")
+    if modobj.explicit_instantiation and template_klass:
+        PYB11generateExternTemplates(modobj, "trampoline", ss, klass)
     ss("\n#endif\n")
 
     # Sub any template parameters.
     ssout(fs.getvalue() % Tdict)
 
     return
+
+#-------------------------------------------------------------------------------
+# PYB11virtualMethodTable
+#
+# The virtual method overrides a class contributes to trampolines: the
+# overrides for the virtual methods it defines itself, as a list of
+#   (method name, signature, body, typedef)
+# where signature is the declaration up to the opening brace (which determines
+# whether a derived trampoline already has it), body the remainder, and typedef
+# any typedef needed for the return type (or None).  Template parameters are
+# left unsubstituted, so the table is computed once per class for the
+# generation and shared by the trampolines of all its derived classes and
+# template instantiations.
+#-------------------------------------------------------------------------------
+def PYB11virtualMethodTable(bklass):
+    return PYB11cached("virtual_table", bklass, PYB11computeVirtualMethodTable)
+
+def PYB11computeVirtualMethodTable(bklass):
+    bklassinst = bklass()
+    methods = [(mname, meth) for (mname, meth) in PYB11ClassMethods(bklass)
+               if (not PYB11attrs(meth)["ignore"] and
+                   (PYB11attrs(meth)["virtual"] or PYB11attrs(meth)["pure_virtual"]) and
+                   mname in bklass.__dict__)]
+
+    result = []
+    for mname, meth in methods:
+        fms = io.StringIO()
+
+        methattrs = PYB11attrs(meth)
+        methattrs["returnType"] = getattr(bklassinst, mname)()
+        assert methattrs["returnType"]    # We require the full spec for virtual methods
+        fms.write("  virtual %(returnType)s %(cppname)s(" % methattrs)
+
+        # Fill out the argument list for this method
+        args = PYB11parseArgs(meth)
+        for i, (argType, argName, default) in enumerate(args):
+            fms.write("%s %s" % (argType, argName))
+            if i < len(args) - 1:
+                fms.write(", ")
+        if methattrs["const"]:
+            fms.write(") const override { ")
+        else:
+            fms.write(") override { ")
+        signature = fms.getvalue()
+        fms.close()
+        fms = io.StringIO()
+
+        # Check if the returnType C++ name will choke PYBIND11_OVERLOAD*
+        typedefstring = None
+        returnType = methattrs["returnType"]
+        if PYB11badchars(returnType):
+            returnType = PYB11mangle(returnType)
+            typedefstring = "    typedef %s %s;\n" % (methattrs["returnType"], returnType)
+            methattrs["returnType"] = returnType
+
+        # Check if we need to work around any reference arguments due to the pybind11 bug discussed in
+        # https://stackoverflow.com/questions/59330279/problems-passing-a-stdvector-by-reference-though-virtual-functions-using-pybin/59331026?noredirect=1#comment104861677_59331026
+        altered = any("&" in argType for (argType, argName, default) in args)
+        argNames = ", ".join(argName for (argType, argName, default) in args)
+
+        # The casts need the GIL, which in a module releasing it the C++ calling
+        # us may not hold.  As in pybind11's own overloads we take it only while
+        # looking for (and calling) the Python override, so the C++ base method
+        # runs without it.  (Without the GIL we cannot use pybind11_fail, which
+        # checks for a Python error.)
+        if altered and PYB11moduleReleasesGIL():
+            fms.write("\n    {\n      py::gil_scoped_acquire PYB11gil;\n")
+            for i, (argType, argName, default) in enumerate(args):
+                if "&" in argType:
+                    fms.write("      py::object dummy%i = py::cast(&%s);\n" % (i, argName))
+            fms.write('      PYBIND11_OVERLOAD_INT(%s, PYB11self, "%s", %s);\n    }\n' % (methattrs["returnType"], methattrs["pyname"], argNames))
+            if methattrs["pure_virtual"]:
+                fms.write('    throw std::runtime_error("Tried to call pure virtual function \\"" PYBIND11_STRINGIFY(PYB11self) "::%(pyname)s\\"");\n  }\n' % methattrs)
+            else:
+                fms.write("    return PYB11self::%s(%s);\n  }\n" % (methattrs["cppname"], argNames))
+            result.append((mname, signature, fms.getvalue(), typedefstring))
+            fms.close()
+            continue
+
+        for i, (argType, argName, default) in enumerate(args):
+            if "&" in argType:
+                fms.write("\n    py::object dummy%i = py::cast(&%s);\n" % (i, argName))
+        if altered:
+            fms.write("    ")
+
+        if methattrs["pure_virtual"]:
+            if methattrs["cppname"] == methattrs["pyname"]:
+                fms.write("PYBIND11_OVERLOAD_PURE(%(returnType)s, PYB11self, %(cppname)s, " % methattrs)
+            else:
+                fms.write('PYBIND11_OVERLOAD_PURE_NAME(%(returnType)s, PYB11self, "%(pyname)s", %(cppname)s, ' % methattrs)
+        else:
+            # HACK!  To workaround what appears to be a bug in overloading virtual method callbacks
+            # in pybind11 (see https://github.com/pybind/pybind11/issues/1547), we have to give
+            # the address of the object that actually implements it.  This is clealy not how a human
+            # should have to handle this, but since we're code generating this we can do this explicit
+            # workaround.
+            #fms.write("PYBIND11_OVERLOAD(%(returnType)s, PYB11self, %(cppname)s, " % methattrs)
+            if methattrs["cppname"] == methattrs["pyname"]:
+                fms.write("PYBIND11_OVERLOAD(%(returnType)s, PYB11self, %(cppname)s, " % methattrs)
+            else:
+                fms.write('PYBIND11_OVERLOAD_NAME(%(returnType)s, PYB11self, "%(pyname)s", %(cppname)s, ' % methattrs)
+
+        fms.write(argNames)
+        if altered:
+            fms.write(");\n  }\n")
+        else:
+            fms.write("); }\n")
+
+        result.append((mname, signature, fms.getvalue(), typedefstring))
+        fms.close()
+    return result
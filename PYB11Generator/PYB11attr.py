@@ -9,16 +9,14 @@ import sys, inspect
 #-------------------------------------------------------------------------------
 def PYB11generateModuleAttrs(modobj):
     
-    with open(modobj.filename, "a") as f:
+    with modobj.emitter.open(modobj.filename, "a") as f:
         ss = f.write
 
         # Module attrs
-        globs, locs = globals(), locals()
-        stuff = [x for x in dir(modobj) if isinstance(eval("modobj.%s" % x, globs, locs), PYB11attr)]
+        stuff = PYB11getModuleIndex(modobj).attrs
         if stuff:
             ss('\n  // module attributes\n')
-            for pyname in stuff:
-                inst = eval("modobj.%s" % pyname)
+            for pyname, inst in stuff:
                 inst(pyname, ss)
 
     return
@@ -42,6 +40,7 @@ class PYB11attr:
             self.__name__ = self.pyname
         else:
             self.__name__ = pyname
+        PYB11invalidateAttrs(self)
         attrattrs = PYB11attrs(self)
         if self.value:
             attrattrs["cppname"] = self.value
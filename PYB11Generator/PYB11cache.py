@@ -0,0 +1,99 @@
+#-------------------------------------------------------------------------------
+# PYB11cache
+#
+# Generation scoped caches.  PYB11generateModule reads the same PYB11 attributes
+# and walks the same modules and classes many times over, so while a module is
+# being generated we remember the results keyed on object identity.  Outside of
+# a generation the caches are inactive and everything is recomputed.
+#-------------------------------------------------------------------------------
+import copy, inspect
+
+# The active caches: None when inactive, otherwise a dictionary of
+#   category -> {id(obj) : (obj, value)}
+# We hold a reference to obj so its id cannot be recycled while the cache is
+# alive.
+_PYB11caches = None
+
+# Attribute values which are mutable containers callers may legitimately modify
+# in the dictionary they are handed (e.g., template_dict for nested classes).
+_PYB11attrs_mutable = ("template", "template_dict", "module")
+
+#-------------------------------------------------------------------------------
+# PYB11generationCache
+#
+# Context manager activating the caches for the duration of a generation pass.
+#-------------------------------------------------------------------------------
+class PYB11generationCache:
+
+    def __enter__(self):
+        global _PYB11caches
+        self.previous = _PYB11caches
+        _PYB11caches = {}
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _PYB11caches
+        _PYB11caches = self.previous
+        return False
+
+#-------------------------------------------------------------------------------
+# PYB11cached
+#
+# Return the value of func(obj), memoized under the given category while a
+# generation cache is active.
+#-------------------------------------------------------------------------------
+def PYB11cached(category, obj, func):
+    if _PYB11caches is None:
+        return func(obj)
+    cache = _PYB11caches.setdefault(category, {})
+    entry = cache.get(id(obj))
+    if entry is None:
+        entry = (obj, func(obj))
+        cache[id(obj)] = entry
+    return entry[1]
+
+#-------------------------------------------------------------------------------
+# PYB11cachedByKey
+#
+# As PYB11cached, but memoized on a hashable key (such as a file name) rather
+# than object identity.
+#-------------------------------------------------------------------------------
+def PYB11cachedByKey(category, key, func):
+    if _PYB11caches is None:
+        return func(key)
+    cache = _PYB11caches.setdefault(category, {})
+    if key not in cache:
+        cache[key] = func(key)
+    return cache[key]
+
+#-------------------------------------------------------------------------------
+# PYB11cachedAttrs
+#
+# Return a private copy of the cached attributes for obj, computing them with
+# func(obj) on a miss.  The cached dictionary itself is never handed out, so
+# callers are free to modify what they get back.
+#-------------------------------------------------------------------------------
+def PYB11cachedAttrs(obj, func):
+    if _PYB11caches is None:
+        return func(obj)
+    result = dict(PYB11cached("attrs", obj, func))
+    for key in _PYB11attrs_mutable:
+        result[key] = copy.copy(result[key])
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11invalidateAttrs
+#
+# Drop anything cached for obj.  Classes pass their attributes and members on
+# to derived classes, so changing a class invalidates all the caches.  Called by
+# the decorators and PYB11inject whenever they modify an object.
+#-------------------------------------------------------------------------------
+def PYB11invalidateAttrs(obj = None):
+    if _PYB11caches is None:
+        return
+    if obj is None or inspect.isclass(obj):
+        _PYB11caches.clear()
+    else:
+        for cache in _PYB11caches.values():
+            cache.pop(id(obj), None)
+    return
@@ -7,8 +7,14 @@ from .PYB11utils import *
 from .PYB11property import *
 from .PYB11ClassAttribute import *
 from .PYB11Trampoline import *
+from .PYB11gil import *
+from .PYB11threads import *
+from .PYB11numpy import *
+from .PYB11parallel import *
+from .PYB11incremental import *
+from .PYB11shards import *
 from .PYB11enum import PYB11enum
-import os, copy, io, inspect
+import os, re, copy, io, inspect, collections
 
 #--------------------------------------------------------------------------------
 # Should we ignore a class?
@@ -21,8 +27,7 @@ def PYB11CheckKlassIgnore(klass):
 # Generate binding function declarations
 #--------------------------------------------------------------------------------
 def PYB11generateClassBindingFunctionDecls(modobj, ss):
-    klasses = PYB11classes(modobj) + PYB11classTemplateInsts(modobj)
-    klasses = sorted(klasses, key=PYB11sort_by_inheritance(klasses))
+    klasses = PYB11classesByInheritance(modobj)
     for kname, klass in klasses:
         if PYB11CheckKlassIgnore(klass):
            if isinstance(klass, PYB11TemplateClass):
@@ -34,10 +39,7 @@ def PYB11generateClassBindingFunctionDecls(modobj, ss):
                    ss("void bind%(pyname)s(py::module_& m);\n" % klassattrs)
 
                    # Check for any nested class scope classes
-                   klassinst = klass()
-                   globs, locs = globals(), locals()
-                   nklasses = [(x, eval("klass.%s" % x, globs, locs)) for x in dir(klassinst) if (inspect.isclass(eval("klass.%s" % x, globs, locs)) and x in klass.__dict__)]
-                   nklasses = sorted(nklasses, key=PYB11sort_by_inheritance(nklasses))
+                   nklasses = PYB11nestedClasses(klass)
                    for nkname, nklass in nklasses:
                        nklassattrs = PYB11attrs(nklass)
                        nklassattrs["pyname"] = klassattrs["pyname"] + "_" + nklassattrs["pyname"]
@@ -52,10 +54,9 @@ def PYB11generateClassBindingFunctionDecls(modobj, ss):
 # Create the calls to bind each class defined in the module
 #-------------------------------------------------------------------------------
 def PYB11generateModuleClassBindingCalls(modobj):
-    klasses = PYB11classes(modobj) + PYB11classTemplateInsts(modobj)
-    klasses = sorted(klasses, key=PYB11sort_by_inheritance(klasses))
+    klasses = PYB11classesByInheritance(modobj)
     if klasses:
-        with open(modobj.filename, "a") as f:
+        with modobj.emitter.open(modobj.filename, "a") as f:
             ss = f.write
             ss("""  //..............................................................................
   // Class bindings
@@ -78,33 +79,134 @@ def PYB11generateModuleClassBindingCalls(modobj):
 # Bind methods for the classes in the module
 #-------------------------------------------------------------------------------
 def PYB11generateModuleClassFuncs(modobj):
-    klasses = PYB11classes(modobj) + PYB11classTemplateInsts(modobj)
-    klasses = sorted(klasses, key=PYB11sort_by_inheritance(klasses))
+    klasses = PYB11classesByInheritance(modobj)
 
     # Define a local method generate the code to a stream
     def generateKlassCode(kname, klass, ss):
-        if isinstance(klass, PYB11TemplateClass):
-            klass(modobj, kname, ss)
-        else:
-            klassattrs = PYB11attrs(klass)
-            mods = klassattrs["module"]
-            if ((klass not in mods) or mods[klass] == modobj.PYB11modulename): # is this class imported from another mod?
-                PYB11generateClass(modobj, klass, klassattrs, ss)
+        with PYB11timer("classes", kname):
+            if isinstance(klass, PYB11TemplateClass):
+                klass(modobj, kname, ss)
+            else:
+                klassattrs = PYB11attrs(klass)
+                mods = klassattrs["module"]
+                if ((klass not in mods) or mods[klass] == modobj.PYB11modulename): # is this class imported from another mod?
+                    PYB11generateClass(modobj, klass, klassattrs, ss)
+
+    # The shared template bind functions go in headers of their own
+    if modobj.template_bindings and modobj.multiple_files:
+        PYB11generateTemplateBindingHeaders(modobj, klasses)
+
+    # Group the classes into shards
+    if modobj.shards or modobj.target_tu_cost:
+        klasses = [(kname, klass) for (kname, klass) in klasses if PYB11CheckKlassIgnore(klass)]
+        for i, shard in enumerate(PYB11shardClasses(klasses, modobj.shards, modobj.target_tu_cost)):
+            filename = modobj.basename + "_shard%i.cc" % i
+            modobj.generatedfiles_list.append(filename)
+            filename = os.path.join(modobj.basedir, filename)
+            PYB11addUnit(modobj, filename,
+                         lambda ss, shard=shard: PYB11generateShard(modobj, shard, generateKlassCode, ss),
+                         PYB11unitFingerprint("shard", *[klass for (kname, klass) in shard]))
+        return
 
+    klassfiles = {}
     for kname, klass in klasses:
         if PYB11CheckKlassIgnore(klass):
             if modobj.multiple_files:
                 filename = modobj.basename + "_" + kname + ".cc"
-                modobj.generatedfiles_list.append(filename)
+                klassfiles[kname] = filename
+                if not modobj.unity:
+                    modobj.generatedfiles_list.append(filename)
                 filename = os.path.join(modobj.basedir, filename)
-                with open(filename, "w") as f:
-                    generateKlassCode(kname, klass, f.write)
+                PYB11addUnit(modobj, filename,
+                             lambda ss, kname=kname, klass=klass: generateKlassCode(kname, klass, ss),
+                             PYB11unitFingerprint("class", klass))
             else:
-                with open(modobj.filename, "a") as f:
+                with modobj.emitter.open(modobj.filename, "a") as f:
                     generateKlassCode(kname, klass, f.write)
 
+    # For a unity build we compile groups of the class files together
+    if modobj.unity:
+        klasses = [(kname, klass) for (kname, klass) in klasses if kname in klassfiles]
+        for i, group in enumerate(PYB11shardClasses(klasses, modobj.unity)):
+            filename = modobj.basename + "_unity_%i.cc" % i
+            modobj.generatedfiles_list.append(filename)
+            with modobj.emitter.open(os.path.join(modobj.basedir, filename), "w") as f:
+                ss = f.write
+                ss("""//------------------------------------------------------------------------------
+// Unity build of the class bindings for %s
+//------------------------------------------------------------------------------
+""" % (", ".join(kname for (kname, klass) in group) or "(none)"))
+                if group:
+                    ss('#include "%s"\n' % modobj.master_include_file)
+                for kname, klass in group:
+                    ss('#include "%s"\n' % klassfiles[kname])
+
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11generateShard
+#
+# Generate the bindings for a group of classes in one file, with a single set
+# of includes at the top.
+#-------------------------------------------------------------------------------
+def PYB11generateShard(modobj, shard, generateKlassCode, ss):
+    fs = io.StringIO()
+    modobj.shard_includes = []
+    try:
+        for kname, klass in shard:
+            generateKlassCode(kname, klass, fs.write)
+        incs = list(collections.OrderedDict.fromkeys(modobj.shard_includes))
+    finally:
+        modobj.shard_includes = None
+    ss("""//------------------------------------------------------------------------------
+// Class bindings for %s
+//------------------------------------------------------------------------------
+""" % (", ".join(kname for (kname, klass) in shard) or "(none)"))
+    for inc in incs:
+        ss('#include %s\n' % inc)
+    ss("\n")
+    ss(fs.getvalue())
+    fs.close()
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11writeClassIncludes
+#
+# Write the includes for a separate class binding file, or when generating a
+# shard pass them on to be written once at the top.
+#-------------------------------------------------------------------------------
+def PYB11writeClassIncludes(modobj, incs, ss):
+    if modobj.shard_includes is None:
+        for inc in incs:
+            ss('#include %s\n' % inc)
+        ss("\n")
+    else:
+        modobj.shard_includes += incs
     return
 
+#-------------------------------------------------------------------------------
+# PYB11classIncludes
+#
+# The includes needed by the separate binding file for a class.  For a unity
+# build we rely on the master include for the module includes, so class files
+# combined in one translation unit do not repeat them (user headers need not
+# have include guards).
+#-------------------------------------------------------------------------------
+def PYB11classIncludes(modobj, klass, klassattrs):
+    result = ['"{}"'.format(modobj.master_include_file)]
+    if not modobj.unity:
+        result += PYB11findAllIncludes(modobj)
+    template_klass = len(klassattrs["template"]) > 0
+    cppbasename = klassattrs["full_cppname"]
+    if template_klass:
+        cppbasename = cppbasename.split("<")[0]
+    assert cppbasename
+    if PYB11virtualClass(klass):
+        result.append('"{}"'.format(modobj.basename + f"_{cppbasename}_trampoline.hh"))
+    if PYB11protectedClass(klass):
+        result.append('"{}"'.format(modobj.basename + f"_{cppbasename}_publicist.hh"))
+    return result
+
 #--------------------------------------------------------------------------------
 # Make a class template instantiation
 #--------------------------------------------------------------------------------
@@ -125,6 +227,7 @@ class PYB11TemplateClass:
         # Create the template parameter dictionary
         self.template_parameters = {}
         klassattrs = PYB11attrs(self.klass_template)
+        self.explicit_parameters = set(template_parameters) if isinstance(template_parameters, dict) else None
         if isinstance(template_parameters, str):
             assert len(klassattrs["template"]) == 1, f"Bad template parameters: {klass_template} : {klassattrs['template']}"
             self.template_parameters[klassattrs["template"][0].split()[1]] = template_parameters
@@ -159,6 +262,9 @@ class PYB11TemplateClass:
         return
 
     def __call__(self, modobj, pyname, ss):
+        if modobj.template_bindings and self.templateBinding(modobj):
+            self.generateTemplateBindingCall(modobj, pyname, ss)
+            return
         klassattrs = self.mangleNames(pyname)
         if self.klass_template.__doc__:
             doc0 = copy.deepcopy(self.klass_template.__doc__)
@@ -188,10 +294,7 @@ class PYB11TemplateClass:
 
         # Check for any nested class scope classes
         klass = self.klass_template
-        klassinst = klass()
-        globs, locs = globals(), locals()
-        nklasses = [(x, eval("klass.%s" % x, globs, locs)) for x in dir(klassinst) if (inspect.isclass(eval("klass.%s" % x, globs, locs)) and x in klass.__dict__)]
-        nklasses = sorted(nklasses, key=PYB11sort_by_inheritance(nklasses))
+        nklasses = PYB11nestedClasses(klass)
         for nkname, nklass in nklasses:
             nklassattrs = PYB11attrs(nklass)
             nklassattrs["pyname"] = klassattrs["pyname"] + "_" + nklassattrs["pyname"]
@@ -202,6 +305,45 @@ class PYB11TemplateClass:
             self.klass_template.__doc__ = doc0
         return
 
+    # Can this instantiation use a bind function shared with the other
+    # instantiations of the template?  It cannot if it changes the C++ name or
+    # doc string, or adds its own template dictionary entries.
+    def templateBindingCandidate(self):
+        params = [x.split()[1] for x in PYB11attrs(self.klass_template)["template"]]
+        return ((not self.cppname) and
+                (not self.docext) and
+                (self.explicit_parameters is None or self.explicit_parameters <= set(params)))
+
+    # The shared bind function for this instantiation, or None
+    def templateBinding(self, modobj):
+        if not self.templateBindingCandidate():
+            return None
+        return PYB11templateBinding(modobj, self.klass_template)
+
+    # Bind this instantiation with a call to the shared bind function
+    def generateTemplateBindingCall(self, modobj, pyname, ss):
+        klassattrs = self.mangleNames(pyname)
+        template_klassattrs = PYB11attrs(self.klass_template)
+        if not (modobj.multiple_files or self.klass_template in modobj.template_bindings_written):
+            ss(PYB11templateBinding(modobj, self.klass_template))
+            modobj.template_bindings_written.add(self.klass_template)
+        ss("""//------------------------------------------------------------------------------
+// Class %(pyname)s bindings
+//------------------------------------------------------------------------------
+""" % klassattrs)
+        if modobj.multiple_files:
+            PYB11writeClassIncludes(modobj,
+                                    PYB11classIncludes(modobj, self.klass_template, klassattrs) +
+                                    ['"{}"'.format(PYB11templateBindingFile(modobj, self.klass_template))],
+                                    ss)
+        args = [self.template_parameters[x.split()[1]] for x in template_klassattrs["template"]]
+        ss("""void bind%s(py::module_& m) {
+  bind%s<%s>(m, "%s");
+}
+
+""" % (klassattrs["pyname"], template_klassattrs["pyname"], ", ".join(args), klassattrs["pyname"]))
+        return
+
     def makeTrampoline(self, pyname, ss):
         klassattrs = self.mangleNames(pyname)
         PYB11generateTrampoline(self.klass_template, klassattrs, ss)
@@ -291,6 +433,135 @@ class PYB11TemplateMethod:
         return
         
 
+#-------------------------------------------------------------------------------
+# PYB11templateBinding
+#
+# With PYB11generateModule(..., template_bindings = True), the instantiations
+# of a template class share a single C++ function template binding the class,
+#   template<typename Value> void bindMyArray(py::module_& m, const char* pyname)
+# and each instantiation's bind function is a one line call to it.  We generate
+# the function template by binding the class with its template parameters
+# standing for themselves, so the bindings must be valid in a dependent
+# context (nested types of a template parameter spelled with typename, for
+# instance).  Returns the code for the function template, or None if the class
+# has to be bound per instantiation: if it has nested classes or template
+# methods, or a template parameter ends up in a string (such as a python name
+# or doc string).
+#-------------------------------------------------------------------------------
+_PYB11template_string_literal = re.compile(r'"(?:[^"\\\n]|\\.)*"')
+
+def PYB11templateBinding(modobj, klass):
+    return PYB11cachedByKey("template_binding", klass,
+                            lambda klass: PYB11computeTemplateBinding(modobj, klass))
+
+def PYB11computeTemplateBinding(modobj, klass):
+    if PYB11nestedClasses(klass):
+        return None
+    for bklass in inspect.getmro(klass):
+        if bklass is not object and PYB11getClassIndex(bklass).template_methods:
+            return None
+
+    # Stand-ins for the template parameters, which we can find in the output
+    klassattrs = PYB11attrs(klass)
+    params = [x.split()[1] for x in klassattrs["template"]]
+    standins = ["PYB11Tparam_%i_" % i for i in range(len(params))]
+    Tdict = dict(zip(params, standins))
+    for attrs in [klassattrs] + [PYB11attrs(bklass) for bklass in PYB11getBaseClasses(klass)]:
+        for key, value in list(attrs["template_dict"].items()):
+            if not key in Tdict:
+                Tdict[key] = value
+    klassattrs["cppname"] += "<" + ", ".join(standins) + ">"
+    klassattrs["template_dict"] = PYB11recurseTemplateDict(Tdict)
+
+    fs = io.StringIO()
+    PYB11generateClass(modobj, klass, klassattrs, fs.write, template_binding = True)
+    result = fs.getvalue()
+    fs.close()
+    for literal in _PYB11template_string_literal.findall(result):
+        if "PYB11Tparam_" in literal:
+            return None
+    for param, standin in zip(params, standins):
+        result = result.replace(standin, param)
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11templateBindingFile
+#
+# The header holding the shared bind function of a template class in
+# multiple_files mode.
+#-------------------------------------------------------------------------------
+def PYB11templateBindingFile(modobj, klass):
+    cppbasename = PYB11attrs(klass)["full_cppname"].split("<")[0]
+    assert cppbasename
+    return modobj.basename + f"_{cppbasename}_bind.hh"
+
+#-------------------------------------------------------------------------------
+# PYB11generateTemplateBindingHeaders
+#
+# Add the units for the headers of the shared template bind functions, one for
+# each template class with instantiations that might use it.
+#-------------------------------------------------------------------------------
+def PYB11generateTemplateBindingHeaders(modobj, klasses):
+    known = set()
+    for kname, klass in klasses:
+        if (PYB11CheckKlassIgnore(klass) and
+            isinstance(klass, PYB11TemplateClass) and
+            klass.templateBindingCandidate() and
+            not klass.klass_template in known):
+            known.add(klass.klass_template)
+            filename = os.path.join(modobj.basedir, PYB11templateBindingFile(modobj, klass.klass_template))
+            PYB11addUnit(modobj, filename,
+                         lambda ss, klass=klass.klass_template: PYB11generateTemplateBindingHeader(modobj, klass, ss),
+                         PYB11unitFingerprint("template_binding", klass.klass_template))
+    return
+
+def PYB11generateTemplateBindingHeader(modobj, klass, ss):
+    klassattrs = PYB11attrs(klass)
+    ss("""//------------------------------------------------------------------------------
+// Shared bind function for the instantiations of %(cppname)s
+//------------------------------------------------------------------------------
+#ifndef PYB11_template_binding_%(pyname)s
+#define PYB11_template_binding_%(pyname)s
+
+""" % klassattrs)
+    ss('#include "{}"\n\n'.format(modobj.master_include_file))
+    binding = PYB11templateBinding(modobj, klass)
+    if binding:
+        ss(binding)
+    else:
+        ss("// %(cppname)s is bound separately for each instantiation\n\n" % klassattrs)
+    ss("#endif\n")
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11generateClassBuffer
+#
+# The def_buffer for a class decorated with @PYB11buffer, describing the
+# contiguous storage at self.data() of length self.size() as a one dimensional
+# buffer, so NumPy (numpy.asarray, memoryview, etc.) can view it without a
+# copy.  The element type defaults to the one data() points to, and the buffer
+# is read-only if data() points to const.
+#-------------------------------------------------------------------------------
+def PYB11generateClassBuffer(klassattrs, ss):
+    buf = klassattrs["buffer"]
+    ss("\n  // Buffer protocol\n")
+    ss("  obj.def_buffer([](%(namespace)s%(cppname)s& self) -> py::buffer_info {\n" % klassattrs)
+    if buf["dtype"]:
+        ss("    using PYB11value = %s;\n" % buf["dtype"])
+    else:
+        ss("    using PYB11value = std::remove_const_t<std::remove_pointer_t<decltype(self.%s())>>;\n" % buf["data"])
+    ss("""    return py::buffer_info(const_cast<PYB11value*>(self.%s()),
+                           sizeof(PYB11value),
+                           py::format_descriptor<PYB11value>::format(),
+                           1,
+                           {static_cast<py::ssize_t>(self.%s())},
+                           {static_cast<py::ssize_t>(sizeof(PYB11value))},
+                           %s);
+  });
+""" % (buf["data"], buf["size"],
+       "true" if buf["readonly"] else "std::is_const<std::remove_pointer_t<decltype(self.%s())>>::value" % buf["data"]))
+    return
+
 #-------------------------------------------------------------------------------
 # Generic class method generation
 #-------------------------------------------------------------------------------
@@ -305,9 +576,10 @@ def PYB11generic_class_method(klass, klassattrs, meth, methattrs, ss):
         methattrs["classcppname"] = "PYB11Publicist" + methattrs["classcppname"]
 
     if methattrs["static"]:
-        ss('  obj.def_static("%(pyname)s", ' % methattrs)
+        deftype = "obj.def_static"
     else:
-        ss('  obj.def("%(pyname)s", ' % methattrs)
+        deftype = "obj.def"
+    ss('  %s("%s", ' % (deftype, methattrs["pyname"]))
 
     # Check for argument specs
     argString = ""
@@ -318,37 +590,56 @@ def PYB11generic_class_method(klass, klassattrs, meth, methattrs, ss):
         if default:
             argString += "=%s" % default
 
+    # Do we need to serialize calls on an instance?  (The critical section would be
+    # suspended if we released the GIL.)
+    guard = PYB11threadGuard(methattrs, klassattrs)
+    if guard and not PYB11guardable(methattrs):
+        if methattrs["thread_unsafe"]:
+            raise RuntimeError("PYB11thread_unsafe: %s::%s needs a return type (and no implementation) to be guarded" %
+                               (klassattrs["cppname"], methattrs["cppname"]))
+        guard = None
+    release_gil, reason = PYB11releaseGILpolicy(methattrs, klassattrs, args, methattrs["returnType"])
+    if guard == "critical_section":
+        release_gil = False
+    elif guard == "mutex":
+        release_gil, call_guard = PYB11splitCallGuard(methattrs, release_gil)
+
     # If there is an implementation, short-circuit the rest.
+    methptr = None
     if methattrs["implementation"]:
         ss(methattrs["implementation"] + argString)
 
     elif methattrs["returnType"] is None:
         if methattrs["static"]:
-            ss("&%(namespace)s%(cppname)s" % methattrs)
+            methptr = "&%(namespace)s%(cppname)s" % methattrs
         else:
-            ss("&%(namespace)s%(classcppname)s::%(cppname)s" % methattrs)
+            methptr = "&%(namespace)s%(classcppname)s::%(cppname)s" % methattrs
+        ss(methptr)
     else:
-        ss("(%(returnType)s " % methattrs)
+        methptr = "(%(returnType)s " % methattrs
         if methattrs["static"]:
-            ss("(*)(")
+            methptr += "(*)("
         else:
-            ss("(%(namespace)s%(cppname)s::*)(" % klassattrs)
-        for i, (argType, argName, default) in enumerate(args):
-            ss(argType)
-            if i < len(args) - 1:
-                ss(", ")
+            methptr += "(%(namespace)s%(cppname)s::*)(" % klassattrs
+        methptr += ", ".join(argType for (argType, argName, default) in args)
         if methattrs["const"]:
-            ss(") const) &%(namespace)s%(classcppname)s::%(cppname)s" % methattrs + argString)
+            methptr += ") const) &%(namespace)s%(classcppname)s::%(cppname)s" % methattrs
+        else:
+            methptr += ")) &%(namespace)s%(classcppname)s::%(cppname)s" % methattrs
+        if guard:
+            ss(PYB11guardedMethod(klassattrs, methattrs, args, methptr, guard, release_gil) + argString)
         else:
-            ss(")) &%(namespace)s%(classcppname)s::%(cppname)s" % methattrs + argString)
+            ss(methptr + argString)
 
     # Is there a return value policy?
     if methattrs["returnpolicy"]:
         ss(", py::return_value_policy::%s" % methattrs["returnpolicy"])
 
-    # Is there a call guard?
-    if methattrs["call_guard"]:
-        ss(", py::call_guard<%s>()" % methattrs["call_guard"])
+    # Is there a call guard?  (A mutex guard releases the GIL itself.)
+    if guard != "mutex":
+        call_guard = PYB11callGuard(methattrs, release_gil)
+    if call_guard:
+        ss(", py::call_guard<%s>()" % call_guard)
 
     # Is there a keep_alive policy?
     if methattrs["keepalive"]:
@@ -369,13 +660,20 @@ def PYB11generic_class_method(klass, klassattrs, meth, methattrs, ss):
     # Done
     ss(");\n")
 
+    # A NumPy vectorized variant?
+    if methattrs["vectorize"]:
+        vguard, vrelease, vcall_guard = PYB11vectorizeGuards(methattrs, klassattrs, args, methattrs["returnType"])
+        binding = PYB11vectorized(methattrs, args, methptr, None if methattrs["static"] else klassattrs, vguard, vrelease)
+        PYB11generateVectorized(deftype, meth, methattrs, args, argString, binding, vcall_guard, ss)
+
 #-------------------------------------------------------------------------------
 # PYB11generateClass
 #
 # Bind the methods for the given class
 #-------------------------------------------------------------------------------
 def PYB11generateClass(modobj, klass, klassattrs, ssout,
-                       nested_class = False):
+                       nested_class = False,
+                       template_binding = False):
     klassinst = klass()
 
     fs = io.StringIO()
@@ -516,36 +814,38 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
                           "__ge__" : (binary_operator, ">=")}
 
     # Start generating.
-    ss("""//------------------------------------------------------------------------------
+    if template_binding:
+        ss("""//------------------------------------------------------------------------------
+// Template class %(cppname)s bindings
+//------------------------------------------------------------------------------
+""" % klassattrs)
+    else:
+        ss("""//------------------------------------------------------------------------------
 // Class %(pyname)s bindings
 //------------------------------------------------------------------------------
 """ % klassattrs)
 
-    if modobj.multiple_files and not nested_class:  # Nested classes already have the includes
+    if modobj.multiple_files and not (nested_class or template_binding):  # Nested classes already have the includes
         # Include files
-        ss('#include "{}"\n'.format(modobj.master_include_file))
-        allincs = PYB11findAllIncludes(modobj)
-        if allincs:
-            for inc in allincs:
-                ss('#include %s\n' % inc)
-        template_klass = len(klassattrs["template"]) > 0
-        cppbasename = klassattrs["full_cppname"]
-        if template_klass:
-            cppbasename = cppbasename.split("<")[0]
-        assert cppbasename
-        if PYB11virtualClass(klass):
-            filename = os.path.join(modobj.basename + f"_{cppbasename}_trampoline.hh")
-            ss('#include "{}"\n'.format(filename))
-        if PYB11protectedClass(klass):
-            filename = os.path.join(modobj.basename + f"_{cppbasename}_publicist.hh")
-            ss('#include "{}"\n'.format(filename))
-        ss("\n")
+        PYB11writeClassIncludes(modobj, PYB11classIncludes(modobj, klass, klassattrs), ss)
 
         # PYB11generateClassBindingFunctionDecls(modobj, ss)
         # ss("\n")
 
+    # With a precompiled master include the binding functions are not declared
+    # there, so declare those for our nested classes here.
+    nklasses = PYB11nestedClasses(klass)
+    if modobj.precompiled_header and nklasses:
+        for nkname, nklass in nklasses:
+            nklassattrs = PYB11attrs(nklass)
+            ss("void bind%s_%s(py::object& obj);\n" % (klassattrs["pyname"], nklassattrs["pyname"]))
+        ss("\n")
+
     if nested_class:
         ss("void bind%(pyname)s(py::object& baseobj) {\n" % klassattrs)
+    elif template_binding:
+        ss("template<%s>\n" % ", ".join(klassattrs["template"]))
+        ss("void bind%(pyname)s(py::module_& m, const char* pyname) {\n" % klassattrs)
     else:
         ss("void bind%(pyname)s(py::module_& m) {\n" % klassattrs)
 
@@ -591,6 +891,8 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
     # Close the template declaration
     if nested_class:
         ss('> obj(baseobj, "%(pyname)s"' % klassattrs)
+    elif template_binding:
+        ss('> obj(m, pyname')
     else:
         ss('> obj(m, "%(pyname)s"' % klassattrs)
 
@@ -598,6 +900,10 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
     if klassattrs["dynamic_attr"]:
         ss(", py::dynamic_attr()")
 
+    # Do we expose our storage through the buffer protocol?
+    if klassattrs["buffer"]:
+        ss(", py::buffer_protocol()")
+
     # Close the class declaration and call the function to bind all its methods
     ss(");\n")
 
@@ -629,7 +935,7 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
     kills = []
     for i, (mname, meth) in enumerate(allmethods):
         methattrs = PYB11attrs(meth)
-        methattrs["returnType"] = eval("klassinst." + mname + "()")
+        methattrs["returnType"] = getattr(klassinst, mname)()
         args = PYB11parseArgs(meth)
         if methattrs["pyname"] in special_operators and not methattrs["implementation"]:
             func, op = special_operators[methattrs["pyname"]]
@@ -651,53 +957,20 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
     # Bind properties
     PYB11GenerateClassProperties(klass, klassinst, klassattrs, ss)
 
+    # Bind the buffer protocol
+    if klassattrs["buffer"]:
+        PYB11generateClassBuffer(klassattrs, ss)
+
     # Bind any templated methods
-    globs, locs = globals(), locals()
-    templates = [x for x in dir(klassinst) if isinstance(eval("klassinst.%s" % x, globs, locs), PYB11TemplateMethod) and x in klass.__dict__]
+    klassindex = PYB11getClassIndex(klass)
+    templates = klassindex.template_methods
     if templates:
         ss("\n    // %(cppname)s template methods\n" % klassattrs)
-        for tname in templates:
-            inst = eval("klassinst.%s" % tname)
+        for tname, inst in templates:
             inst(tname, klass, klassattrs, ss)
 
-    # Fill in the argument string for a method
-    def extractArgs(mmeth):
-        result = [x[0] for x in PYB11parseArgs(mmeth)]
-        for i in range(len(result)):
-            try:
-                result[i] = result[i] % Tdict
-            except:
-                pass
-        return result
-
-    # Helper method to check if the given method spec is already in allmethods
-    def newOverloadedMethod(meth, allmethods, klassattrs):
-        methattrs = PYB11attrs(meth)
-        args = extractArgs(meth)
-        overload = False
-        for (othername, othermeth) in allmethods:
-            othermethattrs = PYB11attrs(othermeth)
-            if methattrs["cppname"] == othermethattrs["cppname"]:
-                overload = True
-                otherargs = extractArgs(othermeth)
-                if otherargs == args:
-                    return False
-        return overload
-
-    # Helper method to check if the given method spec is a new virtual method
-    def newVirtualMethod(mname, meth, allmethods, klassattrs):
-        methattrs = PYB11attrs(meth)
-        args = extractArgs(meth)
-        new_virtual = methattrs["virtual"] and (not methattrs["protected"])
-        if new_virtual:
-            for (othername, othermeth) in allmethods:
-                othermethattrs = PYB11attrs(othermeth)
-                otherargs = extractArgs(othermeth)
-                if (othermethattrs["virtual"] and
-                    methattrs["cppname"] == othermethattrs["cppname"] and
-                    otherargs == args):
-                    return False
-        return new_virtual
+    # Index the signatures of the methods we have bound, to check base methods against
+    signatures = PYB11SignatureIndex(allmethods, Tdict)
 
     # If we're choosing to expose base hidden methods, check for those too.
     if klassattrs["exposeBaseOverloads"]:
@@ -718,19 +991,17 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
             for mname, meth in PYB11ThisClassMethods(bklass):
                 if ((not PYB11attrs(meth)["ignore"]) and                # Ignore the method?
                     (mname[:6] != "pyinit") and                         # Ignore constructors
-                    newOverloadedMethod(meth, allmethods, klassattrs)): # New overload?
+                    signatures.newOverload(meth)):                      # New overload?
                     methattrs = PYB11attrs(meth)
                     PYB11generic_class_method(bklass, bklassattrs, meth, methattrs, ss)
 
             # Same thing with any base templated methods
-            #templates = [x for x in dir(bklass) if isinstance(eval("bklass.%s" % x, globs, locs), PYB11TemplateMethod) and x in bklass.__dict__]
-            templates = [x for x in dir(bklass) if isinstance(getattr(bklass, x, locs), PYB11TemplateMethod) and x in bklass.__dict__]
+            templates = PYB11getClassIndex(bklass).template_methods
             if templates:
-                for tname in templates:
-                    inst = eval("bklass.%s" % tname)
+                for tname, inst in templates:
                     meth = inst.func_template
                     methattrs = PYB11attrs(meth)
-                    if newOverloadedMethod(meth, allmethods, klassattrs):
+                    if signatures.newOverload(meth):
                         try:
                             inst(tname, bklass, bklassattrs, ss)
                         except Exception as excpt:
@@ -755,25 +1026,24 @@ def PYB11generateClass(modobj, klass, klassattrs, ssout,
             bklassattrs["cppname"] = bcppname
         for mname, meth in PYB11ThisClassMethods(bklass):
             if ((not PYB11attrs(meth)["ignore"]) and                      # Ignore the method?
-                newVirtualMethod(mname, meth, allmethods, klassattrs)):   # new virtual?
+                signatures.newVirtual(meth)):                             # new virtual?
                 methattrs = PYB11attrs(meth)
                 PYB11generic_class_method(bklass, bklassattrs, meth, methattrs, ss)
                 allmethods.append((mname, meth))
+                signatures.add(meth)
 
     # Look for any class scope enums and bind them
-    enums = [x for x in dir(klassinst) if isinstance(eval("klassinst.%s" % x, globs, locs), PYB11enum) and x in klass.__dict__]
+    enums = klassindex.enums
     if enums:
         ss("\n  // %(cppname)s enums\n  " % klassattrs)
         ssenum = PYB11indentedIO("  ")
-        for ename in enums:
-            inst = eval("klassinst.%s" % ename)
+        for ename, inst in enums:
             inst(klass, ssenum, klassattrs)
         ss(ssenum.getvalue())
         ssenum.close()
 
     # Look for any class scope classes and bind them
-    klasses = [(x, eval("klass.%s" % x, globs, locs)) for x in dir(klassinst) if (inspect.isclass(eval("klass.%s" % x, globs, locs)) and x in klass.__dict__)]
-    klasses = sorted(klasses, key=PYB11sort_by_inheritance(klasses))
+    klasses = PYB11nestedClasses(klass)
     if klasses:
         ss("\n  // %(cppname)s nested classes\n" % klassattrs)
         for nkname, nklass in klasses:
@@ -0,0 +1,53 @@
+#-------------------------------------------------------------------------------
+# PYB11depfile
+#
+# Write a Makefile/Ninja style depfile recording the Python files a generation
+# depended on: the PYB11 module and every project Python module it imported
+# (directly or not), including PYB11Generator itself when it is used from a
+# source tree.  Modules from the standard library and site-packages are left
+# out.  Build systems can then rerun the generation only when one of these
+# changes (see DEPFILE in CMake's add_custom_command).
+#-------------------------------------------------------------------------------
+import sys, os, sysconfig
+
+#-------------------------------------------------------------------------------
+# PYB11importedFiles
+#
+# The project Python source files currently imported, sorted.
+#-------------------------------------------------------------------------------
+def PYB11importedFiles():
+    paths = sysconfig.get_paths()
+    system_dirs = set(os.path.realpath(paths[x]) for x in ("stdlib", "platstdlib", "purelib", "platlib") if x in paths)
+    result = set()
+    for mod in list(sys.modules.values()):
+        filename = getattr(mod, "__file__", None)
+        if not (filename and filename.endswith(".py") and os.path.isfile(filename)):
+            continue
+        filename = os.path.realpath(filename)
+        if not any(filename.startswith(x + os.sep) for x in system_dirs):
+            result.add(filename)
+    return sorted(result)
+
+#-------------------------------------------------------------------------------
+# PYB11writeDepfile
+#
+# Write the depfile for target, listing the imported project files and any
+# extra dependencies.  Only rewritten if it changes.
+#-------------------------------------------------------------------------------
+def PYB11writeDepfile(depfile, target, extra = []):
+    def escape(pth):
+        return pth.replace("\\", "\\\\").replace(" ", "\\ ").replace("#", "\\#").replace("$", "$$")
+    deps = sorted(set(PYB11importedFiles() + [os.path.realpath(x) for x in extra]))
+    text = escape(os.path.abspath(target)) + ":"
+    for dep in deps:
+        text += " \\\n  " + escape(dep)
+    text += "\n"
+    if os.path.isfile(depfile):
+        with open(depfile, "r") as f:
+            if f.read() == text:
+                return
+    tmpname = depfile + ".PYB11tmp"
+    with open(tmpname, "w") as f:
+        f.write(text)
+    os.replace(tmpname, depfile)
+    return
@@ -0,0 +1,120 @@
+#-------------------------------------------------------------------------------
+# PYB11emitter
+#
+# Buffer all the generated output for a module in memory, one buffer per output
+# file, and only write the files once generation has completed successfully.
+# This replaces repeatedly opening and closing the same files in append mode,
+# and ensures a failed generation does not leave half written files behind.
+#-------------------------------------------------------------------------------
+import io, os, hashlib
+
+from .PYB11profile import PYB11count
+
+#-------------------------------------------------------------------------------
+# PYB11EmitterFile
+#
+# The file-like object handed out by PYB11Emitter.open, so generators can keep
+# using "with ... as f: ss = f.write".
+#-------------------------------------------------------------------------------
+class PYB11EmitterFile:
+
+    def __init__(self, buf):
+        self.write = buf.write
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+#-------------------------------------------------------------------------------
+# PYB11Emitter
+#
+# When flushing, files whose contents are unchanged are not rewritten, so their
+# timestamps are preserved and build tools do not recompile them.  Given the
+# digests recorded by a previous generation (see PYB11Manifest) this can be
+# decided from the file size and timestamp, without reading the file back.
+#-------------------------------------------------------------------------------
+class PYB11Emitter:
+
+    def __init__(self, allow_skips = False):
+        self.buffers = {}             # filename -> io.StringIO, in the order first opened
+        self.previous_digests = {}    # filename -> [digest, size, mtime] as last written
+        self.digests = {}             # filename -> [digest, size, mtime] as flushed
+        self.allow_skips = allow_skips
+        return
+
+    # Open a buffered output file, with the same semantics as the builtin open
+    # for the modes "w" (truncate) and "a" (append, including to the contents of
+    # a preexisting file).
+    def open(self, filename, mode = "w"):
+        assert mode in ("w", "a"), "PYB11Emitter: unsupported mode %s" % mode
+        if mode == "w" or filename not in self.buffers:
+            buf = io.StringIO()
+            if mode == "a" and os.path.isfile(filename):
+                with open(filename, "r") as f:
+                    buf.write(f.read())
+            self.buffers[filename] = buf
+        return PYB11EmitterFile(self.buffers[filename])
+
+    # Write all the buffered files.  Each file is written to a temporary name
+    # and moved into place, so readers never see a partial file.
+    def flush(self):
+        for filename, buf in self.buffers.items():
+            content = buf.getvalue()
+            data = content.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()
+            PYB11count("emitted_bytes", len(data))
+            if self.unchanged(filename, content, digest):
+                PYB11count("files_unchanged")
+            elif self.skipped(filename):
+                print("PYB11Generator WARNING: skipping regenerating {} as requested".format(filename))
+                continue
+            else:
+                tmpname = filename + ".PYB11tmp"
+                with open(tmpname, "w") as f:
+                    f.write(content)
+                os.replace(tmpname, filename)
+                PYB11count("files_written")
+            stat = os.stat(filename)
+            self.digests[filename] = [digest, stat.st_size, stat.st_mtime_ns]
+        self.discard()
+        return
+
+    # Does filename already hold content (with the given digest)?
+    def unchanged(self, filename, content, digest):
+        if not os.path.isfile(filename):
+            return False
+        previous = self.previous_digests.get(filename)
+        if previous:
+            stat = os.stat(filename)
+            if [stat.st_size, stat.st_mtime_ns] == previous[1:]:
+                return previous[0] == digest
+        with open(filename, "r") as f:
+            return f.read() == content
+
+    # Has the user asked us not to overwrite filename (first line "// PYB11skip")?
+    def skipped(self, filename):
+        if not (self.allow_skips and os.path.isfile(filename)):
+            return False
+        with open(filename, "r") as f:
+            return f.readline().startswith("// PYB11skip")
+
+    # As a context manager, flush on success and discard on failure
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    # Throw away anything buffered
+    def discard(self):
+        for buf in self.buffers.values():
+            buf.close()
+        self.buffers = {}
+        return
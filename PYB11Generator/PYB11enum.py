@@ -10,15 +10,13 @@ import sys, inspect
 def PYB11generateModuleEnums(modobj):
 
     # Module enums
-    globs, locs = globals(), locals()
-    enums = [x for x in dir(modobj) if isinstance(eval("modobj.%s" % x, globs, locs), PYB11enum)]
+    enums = PYB11getModuleIndex(modobj).enums
     if enums:
-        with open(modobj.filename, "a") as f:
+        with modobj.emitter.open(modobj.filename, "a") as f:
             ss = f.write
             ss("  //..............................................................................\n")
             ss("  // enum types\n")
-            for name in enums:
-                inst = eval("modobj.%s" % name)
+            for name, inst in enums:
                 inst(modobj, ss)
             ss("\n")
 
@@ -56,6 +54,7 @@ class PYB11enum:
             self.__name__ = self.getInstanceName(scope)
         if self.cppname is None:
             self.cppname = self.__name__
+        PYB11invalidateAttrs(self)
         enumattrs = PYB11attrs(self)
         enumattrs["namespace"] = self.namespace
         enumattrs["cppname"] = self.cppname
@@ -90,8 +89,15 @@ class PYB11enum:
         return
 
     def getInstanceName(self, scope):
+        if inspect.isclass(scope):
+            enums = PYB11getClassIndex(scope).enums
+        else:
+            enums = PYB11getModuleIndex(scope).enums
+        for name, thing in enums:
+            if thing == self:
+                return name
         for name in dir(scope):
-            thing = eval("scope.%s" % name)
+            thing = getattr(scope, name)
             if isinstance(thing, PYB11enum) and thing == self:
                 return name
         raise RuntimeError("PYB11enum: unable to find myself!")
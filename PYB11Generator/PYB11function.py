@@ -5,6 +5,8 @@
 #-------------------------------------------------------------------------------
 from .PYB11utils import *
 from .PYB11property import *
+from .PYB11gil import *
+from .PYB11numpy import *
 import copy, io
 
 #-------------------------------------------------------------------------------
@@ -13,7 +15,7 @@ import copy, io
 # Bind the methods in the module
 #-------------------------------------------------------------------------------
 def PYB11generateModuleFunctions(modobj):
-    with open(modobj.filename, "a") as f:
+    with modobj.emitter.open(modobj.filename, "a") as f:
         ss = f.write
         methods = PYB11functions(modobj)
         if methods:
@@ -25,10 +27,7 @@ def PYB11generateModuleFunctions(modobj):
                     PYB11generateFunction(meth, methattrs, ss)
 
         # Now look for any template function instantiations.
-        globs, locs = globals(), locals()
-        func_templates = [x for x in dir(modobj) if isinstance(eval("modobj.%s" % x, globs, locs), PYB11TemplateFunction)]
-        for ftname in func_templates:
-            func_template = eval("modobj.%s" % ftname)
+        for ftname, func_template in PYB11getModuleIndex(modobj).template_functions:
             func_template(ftname, ss)
         ss("\n")
     return
@@ -153,26 +152,26 @@ def PYB11generateFunction(meth, methattrs, ssout):
     ss('  m.def("%(pyname)s", ' % methattrs)
 
     # If there is an implementation, short-circuit the rest of our work.
+    funcptr = None
     if methattrs["implementation"]:
         ss(methattrs["implementation"] + argString)
 
     elif returnType:
-        ss("(%s (*)(" % returnType)
-        for i, argType in enumerate(argTypes):
-            ss(argType)
-            if i < nargs - 1:
-                ss(", ")
-        ss(")) &%(namespace)s%(cppname)s" % methattrs + argString)
+        funcptr = "(%s (*)(" % returnType + ", ".join(argTypes) + ")) &%(namespace)s%(cppname)s" % methattrs
+        ss(funcptr + argString)
     else:
-        ss("&%(namespace)s%(cppname)s" % methattrs)
+        funcptr = "&%(namespace)s%(cppname)s" % methattrs
+        ss(funcptr)
 
     # Is there a return value policy?
     if methattrs["returnpolicy"]:
         ss(", py::return_value_policy::%s" % methattrs["returnpolicy"])
 
     # Is there a call guard?
-    if methattrs["call_guard"]:
-        ss(", py::call_guard<%s>()" % methattrs["call_guard"])
+    release_gil, reason = PYB11releaseGILpolicy(methattrs, None, list(zip(argTypes, argNames, argDefaults)), returnType)
+    call_guard = PYB11callGuard(methattrs, release_gil)
+    if call_guard:
+        ss(", py::call_guard<%s>()" % call_guard)
 
     # Is there a keep_alive policy?
     if methattrs["keepalive"]:
@@ -187,6 +186,13 @@ def PYB11generateFunction(meth, methattrs, ssout):
         PYB11docstring(doc, ss)
     ss(");\n")
 
+    # A NumPy vectorized variant?
+    if methattrs["vectorize"]:
+        args = list(zip(argTypes, argNames, argDefaults))
+        vguard, vrelease, vcall_guard = PYB11vectorizeGuards(methattrs, None, args, returnType)
+        PYB11generateVectorized("m.def", meth, methattrs, args, argString,
+                                PYB11vectorized(methattrs, args, funcptr, None, vguard, vrelease), vcall_guard, ss)
+
     ssout(fs.getvalue() % methattrs["template_dict"])
     fs.close()
     return
@@ -0,0 +1,209 @@
+#-------------------------------------------------------------------------------
+# PYB11gil
+#
+# Releasing the Python GIL around bound calls, so Python threads can run while
+# long C++ calls proceed.  A method or function can be marked with
+# @PYB11releaseGIL (or @PYB11keepGIL to opt out), and defaults can be given
+# for a whole class (PYB11release_gil = True as a class attribute, or the
+# decorators on the class) or module (PYB11release_gil = True in the PYB11
+# module).  In order of precedence:
+#   - the method or function decorator,
+#   - the class default,
+#   - the module default.
+# The defaults are not applied to bindings which handle Python objects
+# (py:: or pybind11:: types, PyObject, or an explicit implementation), since
+# they need the GIL held.  Released bindings get
+# py::call_guard<py::gil_scoped_release>.  Since a released C++ method may
+# call a virtual overridden in Python, in modules releasing the GIL anywhere
+# the trampoline overrides of virtual methods reacquire the GIL before
+# touching their arguments (only while looking for the Python override, so
+# the C++ base method still runs without it).  A JSON
+# report of the bindings with a GIL policy is written next to the generated
+# files list as <modname>_PYB11_gil.json.
+#-------------------------------------------------------------------------------
+import os, json, inspect
+
+from .PYB11utils import *
+
+# The module default, and the module, while a module is generated
+_PYB11release_gil_default = False
+_PYB11release_gil_module = None
+
+#-------------------------------------------------------------------------------
+# PYB11GILdefault
+#
+# Context manager making the module default of modobj active.
+#-------------------------------------------------------------------------------
+class PYB11GILdefault:
+
+    def __init__(self, modobj):
+        self.modobj = modobj
+        self.value = bool(getattr(modobj, "PYB11release_gil", False))
+        return
+
+    def __enter__(self):
+        global _PYB11release_gil_default, _PYB11release_gil_module
+        self.previous = (_PYB11release_gil_default, _PYB11release_gil_module)
+        _PYB11release_gil_default, _PYB11release_gil_module = self.value, self.modobj
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _PYB11release_gil_default, _PYB11release_gil_module
+        _PYB11release_gil_default, _PYB11release_gil_module = self.previous
+        return False
+
+#-------------------------------------------------------------------------------
+# PYB11releaseGILpolicy
+#
+# Should the binding of a method (with klassattrs) or function (klassattrs
+# None) release the GIL?  Returns (release, reason), where reason is None if
+# no policy applies.
+#-------------------------------------------------------------------------------
+def PYB11releaseGILpolicy(methattrs, klassattrs = None, args = [], returnType = None):
+    if methattrs["release_gil"] is not None:
+        return bool(methattrs["release_gil"]), "decorator"
+    if klassattrs is not None and klassattrs["release_gil"] is not None:
+        release, reason = bool(klassattrs["release_gil"]), "class default"
+    elif _PYB11release_gil_default:
+        release, reason = True, "module default"
+    else:
+        return False, None
+    if release and PYB11usesPythonObjects(methattrs, args, returnType):
+        return False, "uses Python objects"
+    return release, reason
+
+def PYB11usesPythonObjects(methattrs, args, returnType):
+    stuff = [methattrs["implementation"], returnType] + [argType for (argType, argName, default) in args]
+    return any(x and any(y in x for y in ("py::", "pybind11::", "PyObject")) for x in stuff)
+
+#-------------------------------------------------------------------------------
+# PYB11callGuard
+#
+# The call_guard for a binding, adding the GIL release if requested.
+#-------------------------------------------------------------------------------
+def PYB11callGuard(methattrs, release):
+    guard = methattrs["call_guard"]
+    if release and not (guard and "gil_scoped_release" in guard):
+        if guard:
+            guard += ", py::gil_scoped_release"
+        else:
+            guard = "py::gil_scoped_release"
+    return guard
+
+#-------------------------------------------------------------------------------
+# PYB11splitCallGuard
+#
+# For bindings which release the GIL themselves, only once they are done with
+# Python (the mutex thread guard, vectorized loops): whether to release it,
+# counting any py::gil_scoped_release in the explicit call_guard, and the rest
+# of the call_guard.
+#-------------------------------------------------------------------------------
+def PYB11splitCallGuard(methattrs, release):
+    guard = methattrs["call_guard"]
+    if guard and "gil_scoped_release" in guard:
+        others = [x.strip() for x in guard.split(",") if not "gil_scoped_release" in x]
+        return True, ", ".join(others) or None
+    return release, guard
+
+#-------------------------------------------------------------------------------
+# PYB11GILbindings
+#
+# The functions and template function instantiations of the module, and for
+# each bound class the methods it defines (inherited methods are listed under
+# their own classes), as
+#   (name, meth, methattrs, klassattrs, args, returnType)
+# where klassattrs is None for functions.
+#-------------------------------------------------------------------------------
+def PYB11GILbindings(modobj):
+    def functionReturn(meth):
+        return meth(*inspect.getfullargspec(meth).args)
+
+    for name, meth in PYB11functions(modobj):
+        methattrs = PYB11attrs(meth)
+        if not methattrs["ignore"]:
+            yield methattrs["pyname"], meth, methattrs, None, PYB11parseArgs(meth), functionReturn(meth)
+    for ftname, inst in PYB11getModuleIndex(modobj).template_functions:
+        meth = inst.func_template
+        yield inst.pyname or ftname, meth, PYB11attrs(meth), None, PYB11parseArgs(meth), functionReturn(meth)
+
+    for klass, klassattrs in PYB11boundClasses(modobj):
+        klassinst = klass()
+        for mname, meth in PYB11ThisClassMethods(klass):
+            methattrs = PYB11attrs(meth)
+            if not methattrs["ignore"] and mname[:6] != "pyinit":
+                yield (klassattrs["pyname"] + "." + methattrs["pyname"], meth, methattrs, klassattrs,
+                       PYB11parseArgs(meth), getattr(klassinst, mname)())
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11moduleReleasesGIL
+#
+# Does any binding of the module being generated release the GIL, by policy or
+# an explicit call_guard?  Outside a module generation we assume so.
+#-------------------------------------------------------------------------------
+def PYB11moduleReleasesGIL():
+    if _PYB11release_gil_module is None:
+        return True
+    return PYB11cached("releases_gil", _PYB11release_gil_module, PYB11findGILrelease)
+
+def PYB11findGILrelease(modobj):
+    if _PYB11release_gil_default:
+        return True
+    for name, meth, methattrs, klassattrs, args, returnType in PYB11GILbindings(modobj):
+        guard = methattrs["call_guard"]
+        if (PYB11releaseGILpolicy(methattrs, klassattrs, args, returnType)[0] or
+            (guard and "gil_scoped_release" in guard)):
+            return True
+    return False
+
+#-------------------------------------------------------------------------------
+# PYB11generateGILreport
+#
+# Find the bindings with a GIL policy (see PYB11GILbindings), including their
+# NumPy vectorized variants.
+#-------------------------------------------------------------------------------
+def PYB11generateGILreport(modobj):
+    entries = []
+
+    def record(name, meth, methattrs, klassattrs, args, returnType):
+        from .PYB11numpy import PYB11vectorizeGuards
+        release, reason = PYB11releaseGILpolicy(methattrs, klassattrs, args, returnType)
+        if reason:
+            entries.append({"binding"     : name,
+                            "release_gil" : release,
+                            "reason"      : reason})
+            if methattrs["vectorize"]:
+                guard, release, call_guard = PYB11vectorizeGuards(methattrs, klassattrs, args, returnType)
+                klassname, dot, pyname = name.rpartition(".")
+                entries.append({"binding"     : klassname + dot + (methattrs["vectorize"][1] or pyname),
+                                "release_gil" : release,
+                                "reason"      : reason,
+                                "vectorized"  : True})
+        return
+
+    for binding in PYB11GILbindings(modobj):
+        record(*binding)
+    modobj.gil_report = entries
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11writeGILreport
+#
+# Write the report, or remove any from an earlier generation if there is
+# nothing to report.
+#-------------------------------------------------------------------------------
+def PYB11writeGILreport(modobj, filename):
+    if not modobj.gil_report:
+        if os.path.isfile(filename):
+            os.remove(filename)
+        return
+    report = {"module"      : modobj.PYB11modulename,
+              "default"     : bool(getattr(modobj, "PYB11release_gil", False)),
+              "released"    : [x["binding"] for x in modobj.gil_report if x["release_gil"]],
+              "bindings"    : modobj.gil_report}
+    tmpname = filename + ".PYB11tmp"
+    with open(tmpname, "w") as f:
+        json.dump(report, f, indent=1)
+        f.write("\n")
+    os.replace(tmpname, filename)
+    return
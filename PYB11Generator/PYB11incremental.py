@@ -0,0 +1,219 @@
+#-------------------------------------------------------------------------------
+# PYB11incremental
+#
+# Support for regenerating only what changed.  In multiple_files mode every
+# class binding, trampoline, and publicist is a separate unit (see
+# PYB11parallel), and we can fingerprint each unit from what goes into it:
+#   - the source of the class and all its bases, and of all its methods
+#     (including any injected from elsewhere),
+#   - the parameters of their properties, attributes, and template methods
+#     (which may also be injected),
+#   - the PYB11 attributes of those classes and methods (decorators),
+#   - the template parameters of a template class instantiation,
+#   - the module level includes, preamble, and other PYB11 settings,
+#   - the PYB11Generator sources themselves.
+# The fingerprints are recorded in a manifest file, along with the digest of
+# every file written.  The digests let the emitter see which files are
+# unchanged without reading them back, and with
+# PYB11generateModule(..., manifest = filename, incremental = True) any unit
+# whose fingerprint matches the manifest and whose file is still present is
+# neither regenerated nor rewritten.  This relies on generating in place over
+# the previous generation.
+#
+# Anything that cannot be fingerprinted (for instance because its source is not
+# available) is always regenerated.
+#-------------------------------------------------------------------------------
+import os, json, hashlib, inspect
+
+from .PYB11utils import *
+from .PYB11parallel import PYB11renderUnit
+
+#-------------------------------------------------------------------------------
+# PYB11Manifest
+#
+# The unit fingerprints and file digests from the previous generation, and
+# those of the current one.
+#-------------------------------------------------------------------------------
+class PYB11Manifest:
+
+    version = 2
+
+    def __init__(self, modobj, filename, incremental = False):
+        self.filename = filename
+        self.incremental = incremental
+        self.previous = {}       # unit -> fingerprint
+        self.digests = {}        # file -> [digest, size, mtime]
+        self.units = {}
+        self.files = []
+        if os.path.isfile(filename):
+            try:
+                with open(filename, "r") as f:
+                    stuff = json.load(f)
+                if stuff.get("version") == self.version:
+                    self.previous = stuff["units"]
+                    self.digests = stuff["digests"]
+            except (ValueError, KeyError):
+                print("PYB11Generator WARNING: ignoring unreadable manifest %s" % filename)
+        modobj.emitter.previous_digests = self.digests
+        if incremental:
+            self.context = PYB11moduleFingerprint(modobj)
+        return
+
+    # Record the fingerprint for a unit, returning True if it is unchanged since
+    # the previous generation and its file is still as we left it.
+    def unchanged(self, filename, fingerprint):
+        key = os.path.basename(filename)
+        self.files.append(filename)
+        if fingerprint is None:
+            return False
+        fingerprint = PYB11hash(self.context, key, fingerprint)
+        self.units[key] = fingerprint
+        if self.previous.get(key) != fingerprint or filename not in self.digests:
+            return False
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        return [stat.st_size, stat.st_mtime_ns] == self.digests[filename][1:]
+
+    # Write the manifest for the current generation, once the emitter has
+    # flushed.  Includes the list of all the files in the output directory
+    # belonging to this generation.
+    def write(self, modobj):
+        digests = dict(modobj.emitter.digests)
+        for filename in self.files:
+            if filename not in digests and filename in self.digests:
+                digests[filename] = self.digests[filename]
+        files = sorted(set(os.path.basename(x) for x in list(digests) + self.files
+                           if os.path.dirname(x) == modobj.basedir))
+        tmpname = self.filename + ".PYB11tmp"
+        with open(tmpname, "w") as f:
+            json.dump({"version" : self.version,
+                       "units"   : self.units,
+                       "digests" : digests,
+                       "files"   : files}, f, indent=1, sort_keys=True)
+            f.write("\n")
+        os.replace(tmpname, self.filename)
+        return
+
+#-------------------------------------------------------------------------------
+# PYB11hash
+#
+# Digest of the repr of a sequence of things.
+#-------------------------------------------------------------------------------
+def PYB11hash(*args):
+    h = hashlib.sha256()
+    for arg in args:
+        h.update(repr(arg).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+#-------------------------------------------------------------------------------
+# PYB11generatorFingerprint
+#
+# Digest of the PYB11Generator sources, so changing the generator invalidates
+# everything.
+#-------------------------------------------------------------------------------
+_PYB11generator_fingerprint = None
+def PYB11generatorFingerprint():
+    global _PYB11generator_fingerprint
+    if _PYB11generator_fingerprint is None:
+        h = hashlib.sha256()
+        pkgdir = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(os.listdir(pkgdir)):
+            if filename.endswith(".py"):
+                with open(os.path.join(pkgdir, filename), "rb") as f:
+                    h.update(filename.encode("utf-8"))
+                    h.update(f.read())
+        _PYB11generator_fingerprint = h.hexdigest()
+    return _PYB11generator_fingerprint
+
+#-------------------------------------------------------------------------------
+# PYB11moduleFingerprint
+#
+# Digest of the module level settings every unit depends on.
+#-------------------------------------------------------------------------------
+def PYB11moduleFingerprint(modobj):
+    settings = sorted((name, repr(val)) for (name, val) in vars(modobj).items()
+                      if name.startswith("PYB11") and isinstance(val, (str, list, tuple, dict, bool, int)))
+    return PYB11hash(PYB11generatorFingerprint(),
+                     modobj.PYB11modulename,
+                     modobj.basename,
+                     modobj.multiple_files,
+                     modobj.precompiled_header,
+                     modobj.unity,
+                     modobj.template_bindings,
+                     modobj.explicit_instantiation,
+                     modobj.master_include_file,
+                     PYB11findAllIncludes(modobj),
+                     settings,
+                     [(name, PYB11renderUnit(lambda ss, obj=obj, name=name: obj.PYB11preamble(modobj, ss, name)))
+                      for (name, obj) in PYB11objsWithMethod(modobj, "PYB11preamble")])
+
+#-------------------------------------------------------------------------------
+# PYB11classFingerprint
+#
+# Digest of a class (or PYB11TemplateClass instantiation), its bases, and their
+# methods.  Returns None if any of the source is unavailable.
+#-------------------------------------------------------------------------------
+def PYB11classFingerprint(klass):
+    return PYB11cached("class_fingerprint", klass, PYB11computeClassFingerprint)
+
+def PYB11computeClassFingerprint(klass):
+    from .PYB11class import PYB11TemplateClass
+    stuff = []
+    if isinstance(klass, PYB11TemplateClass):
+        stuff.append((klass.template_parameters, klass.cppname, klass.pyname, klass.docext))
+        klass = klass.klass_template
+    try:
+        for base in inspect.getmro(klass):
+            if base is not object:
+                stuff.append((base.__module__, base.__qualname__, PYB11sourceText(base), PYB11attrs(base)))
+                stuff.append(sorted((name, PYB11memberState(obj)) for (name, obj) in vars(base).items()
+                                    if not (name.startswith("__") or inspect.isfunction(obj))))
+        for name, meth in PYB11getClassIndex(klass).methods:
+            stuff.append((name, meth.__qualname__, PYB11sourceText(meth), PYB11attrs(meth)))
+    except (OSError, TypeError):
+        return None
+    return PYB11hash(*stuff)
+
+#-------------------------------------------------------------------------------
+# PYB11memberState
+#
+# A stable representation of a (non-method) class member for fingerprinting.
+# The PYB11 helpers (PYB11property, PYB11readwrite, PYB11TemplateMethod, etc.)
+# are represented by their parameters rather than the source text, since
+# PYB11inject may have copied them from a class outside the MRO.  Raises
+# OSError or TypeError if some source is unavailable.
+#-------------------------------------------------------------------------------
+def PYB11memberState(obj):
+    if inspect.isfunction(obj):
+        return ("function", obj.__qualname__, PYB11sourceText(obj), PYB11attrs(obj))
+    elif inspect.isclass(obj):
+        fingerprint = PYB11classFingerprint(obj)
+        if fingerprint is None:
+            raise OSError("cannot fingerprint %s" % obj.__qualname__)
+        return ("class", fingerprint)
+    elif isinstance(obj, property):
+        return ("property", PYB11memberState(obj.fget), PYB11memberState(obj.fset), obj.__doc__)
+    elif isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, [PYB11memberState(x) for x in obj])
+    elif isinstance(obj, dict):
+        return ("dict", sorted((repr(key), PYB11memberState(val)) for (key, val) in obj.items()))
+    elif hasattr(obj, "__dict__") and not inspect.ismodule(obj):
+        return (type(obj).__name__, PYB11memberState(vars(obj)))
+    return repr(obj)
+
+#-------------------------------------------------------------------------------
+# PYB11unitFingerprint
+#
+# Return a function computing the fingerprint for a unit generated from the
+# given classes, suitable for PYB11addUnit.
+#-------------------------------------------------------------------------------
+def PYB11unitFingerprint(kind, *klasses):
+    def fingerprint():
+        result = [PYB11classFingerprint(klass) for klass in klasses]
+        if None in result:
+            return None
+        return PYB11hash(kind, *result)
+    return fingerprint
@@ -0,0 +1,206 @@
+#-------------------------------------------------------------------------------
+# PYB11index
+#
+# Classify the members of a PYB11 module or class in a single pass, so the
+# generation phases can read what they need rather than each re-walking
+# dir(obj).
+#-------------------------------------------------------------------------------
+from .PYB11cache import *
+from .PYB11profile import PYB11count
+import inspect
+
+#-------------------------------------------------------------------------------
+# PYB11ModuleIndex
+#
+# The bindable members of a module, sorted into buckets.  Members appear in
+# dir() (alphabetical) order, except classes, template class instantiations
+# and functions which are in source order.
+#-------------------------------------------------------------------------------
+class PYB11ModuleIndex:
+
+    # Methods objects can provide to contribute to the module start
+    provider_methods = ("PYB11includes", "PYB11preamble", "PYB11opaqueTypes")
+
+    def __init__(self, modobj):
+        from .PYB11utils import PYB11sort_by_line
+        from .PYB11class import PYB11TemplateClass
+        from .PYB11function import PYB11TemplateFunction
+        from .PYB11enum import PYB11enum
+        from .PYB11attr import PYB11attr
+        from .PYB11STLmethods import PYB11_bind_vector, PYB11_bind_map
+
+        self.members = []                # (name, obj) for everything not named PYB11*
+        self.classes = []                # classes to bind
+        self.template_classes = []       # PYB11TemplateClass instantiations
+        self.functions = []              # functions to bind
+        self.template_functions = []     # PYB11TemplateFunction instantiations
+        self.enums = []                  # PYB11enum
+        self.attrs = []                  # PYB11attr
+        self.stl = []                    # PYB11_bind_vector/map
+        self.providers = {x : [] for x in self.provider_methods}
+
+        for name, obj in inspect.getmembers(modobj):
+            pyb11name = (name[:5] == "PYB11")
+            if not pyb11name:
+                self.members.append((name, obj))
+                for methodname in self.provider_methods:
+                    if hasattr(obj, methodname) and callable(getattr(obj, methodname)):
+                        self.providers[methodname].append((name, obj))
+            if inspect.isclass(obj):
+                if not pyb11name:
+                    self.classes.append((name, obj))
+            elif inspect.isfunction(obj):
+                if not pyb11name:
+                    self.functions.append((name, obj))
+            elif isinstance(obj, PYB11TemplateClass):
+                self.template_classes.append((name, obj))
+            elif isinstance(obj, PYB11TemplateFunction):
+                self.template_functions.append((name, obj))
+            elif isinstance(obj, PYB11enum):
+                self.enums.append((name, obj))
+            elif isinstance(obj, PYB11attr):
+                self.attrs.append((name, obj))
+            elif isinstance(obj, (PYB11_bind_vector, PYB11_bind_map)) and not pyb11name:
+                self.stl.append((name, obj))
+
+        self.classes.sort(key = PYB11sort_by_line)
+        self.template_classes.sort(key = PYB11sort_by_line)
+        # It's nice to sort functions in the same order the user created, but not necessary
+        try:
+            self.functions.sort(key = PYB11sort_by_line)
+        except:
+            pass
+        return
+
+    # All members with the given (callable) method
+    def objsWithMethod(self, methodname):
+        if methodname in self.providers:
+            return self.providers[methodname]
+        return [(name, obj) for (name, obj) in self.members
+                if (hasattr(obj, methodname) and callable(getattr(obj, methodname)))]
+
+#-------------------------------------------------------------------------------
+# PYB11ClassIndex
+#
+# The members of a class, sorted into buckets.  Everything except methods is
+# restricted to what the class itself defines (not inherited), and appears in
+# dir() (alphabetical) order.
+#-------------------------------------------------------------------------------
+class PYB11ClassIndex:
+
+    def __init__(self, klass):
+        from .PYB11utils import PYB11sort_by_line
+        from .PYB11property import PYB11property
+        from .PYB11ClassAttribute import PYB11ClassAttribute
+        from .PYB11class import PYB11TemplateMethod
+        from .PYB11enum import PYB11enum
+
+        self.methods = []                # all methods, including inherited, in source order
+        self.local_methods = []          # methods defined by klass, in source order
+        self.properties = []             # python properties
+        self.PYB11properties = []        # PYB11property
+        self.attributes = []             # PYB11ClassAttribute (readwrite/readonly)
+        self.template_methods = []       # PYB11TemplateMethod instantiations
+        self.enums = []                  # PYB11enum
+        self.classes = []                # nested classes
+
+        for name, obj in inspect.getmembers(klass):
+            local = name in klass.__dict__
+            if inspect.isfunction(obj):
+                self.methods.append((name, obj))
+            elif not local:
+                pass
+            elif inspect.isclass(obj):
+                self.classes.append((name, obj))
+            elif isinstance(obj, property):
+                self.properties.append((name, obj))
+            elif isinstance(obj, PYB11property):
+                self.PYB11properties.append((name, obj))
+            elif isinstance(obj, PYB11ClassAttribute):
+                self.attributes.append((name, obj))
+            elif isinstance(obj, PYB11TemplateMethod):
+                self.template_methods.append((name, obj))
+            elif isinstance(obj, PYB11enum):
+                self.enums.append((name, obj))
+
+        # It's nice to sort in the same order the user created, but not necessary
+        try:
+            self.methods.sort(key = PYB11sort_by_line)
+        except:
+            pass
+        self.local_methods = [(name, meth) for (name, meth) in self.methods if name in klass.__dict__]
+        return
+
+#-------------------------------------------------------------------------------
+# PYB11getModuleIndex, PYB11getClassIndex
+#
+# Return the (generation cached) index for a module or class.
+#-------------------------------------------------------------------------------
+def PYB11getModuleIndex(modobj):
+    return PYB11cached("module_index", modobj, PYB11ModuleIndex)
+
+def PYB11getClassIndex(klass):
+    return PYB11cached("class_index", klass, PYB11ClassIndex)
+
+#-------------------------------------------------------------------------------
+# PYB11methodSignature
+#
+# The (cppname, argument types, const) signature of a method, with the argument
+# types resolved against the template dictionary Tdict where possible.
+#-------------------------------------------------------------------------------
+def PYB11methodSignature(meth, Tdict):
+    return PYB11cachedByKey("method_signature",
+                            (meth, tuple(sorted(Tdict.items()))),
+                            lambda key: PYB11computeMethodSignature(meth, Tdict))
+
+def PYB11computeMethodSignature(meth, Tdict):
+    from .PYB11utils import PYB11attrs, PYB11parseArgs
+    methattrs = PYB11attrs(meth)
+    args = []
+    for x in PYB11parseArgs(meth):
+        try:
+            args.append(x[0] % Tdict)
+        except:
+            args.append(x[0])
+    return (methattrs["cppname"], tuple(args), bool(methattrs["const"]))
+
+#-------------------------------------------------------------------------------
+# PYB11SignatureIndex
+#
+# The signatures of the methods bound for a class, so we can check whether a
+# base class method is a new overload or an un-overridden virtual with a set
+# lookup rather than comparing against every method.
+#-------------------------------------------------------------------------------
+class PYB11SignatureIndex:
+
+    def __init__(self, methods, Tdict):
+        self.Tdict = Tdict
+        self.cppnames = set()            # cppnames of all methods
+        self.signatures = set()          # signatures of all methods
+        self.virtual_signatures = set()  # signatures of the virtual methods
+        for mname, meth in methods:
+            self.add(meth)
+        return
+
+    def add(self, meth):
+        from .PYB11utils import PYB11attrs
+        sig = PYB11methodSignature(meth, self.Tdict)
+        self.cppnames.add(sig[0])
+        self.signatures.add(sig)
+        if PYB11attrs(meth)["virtual"]:
+            self.virtual_signatures.add(sig)
+        return
+
+    # Is meth an overload of a method name we have, with a new signature?
+    def newOverload(self, meth):
+        PYB11count("overload_checks")
+        sig = PYB11methodSignature(meth, self.Tdict)
+        return sig[0] in self.cppnames and sig not in self.signatures
+
+    # Is meth a public virtual method we do not already have?
+    def newVirtual(self, meth):
+        from .PYB11utils import PYB11attrs
+        PYB11count("virtual_checks")
+        methattrs = PYB11attrs(meth)
+        return (methattrs["virtual"] and (not methattrs["protected"]) and
+                PYB11methodSignature(meth, self.Tdict) not in self.virtual_signatures)
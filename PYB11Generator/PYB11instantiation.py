@@ -0,0 +1,133 @@
+#-------------------------------------------------------------------------------
+# PYB11instantiation
+#
+# With PYB11generateModule(..., explicit_instantiation = True) (which requires
+# multiple_files), the classes instantiated through PYB11TemplateClass, along
+# with their trampolines and publicists, are explicitly instantiated once in a
+# dedicated source file <basename>_instantiations.cc.  Every other source file
+# sees them declared extern template, so they are not implicitly instantiated
+# again in each translation unit that uses them:
+#   - the bound classes are declared extern in the master include,
+#   - the trampolines and publicists at the end of their own headers, where
+#     their templates are defined.
+# Note explicitly instantiating a class instantiates all its members, so they
+# must all be valid for the template parameters.  Instantiations given an
+# explicit cppname (which need not name a template) are left alone.
+#-------------------------------------------------------------------------------
+import os, collections
+
+from .PYB11utils import *
+from .PYB11parallel import *
+from .PYB11incremental import *
+
+#-------------------------------------------------------------------------------
+# PYB11explicitInstantiations
+#
+# The template class instantiations of the module to explicitly instantiate, as
+# a list of (PYB11TemplateClass, klassattrs).
+#-------------------------------------------------------------------------------
+def PYB11explicitInstantiations(modobj):
+    return PYB11cached("explicit_instantiations", modobj, PYB11findExplicitInstantiations)
+
+def PYB11findExplicitInstantiations(modobj):
+    from .PYB11class import PYB11CheckKlassIgnore
+    result = []
+    known = set()
+    for kname, klass in PYB11classTemplateInsts(modobj):
+        if PYB11CheckKlassIgnore(klass) and not klass.cppname:
+            klassattrs = klass.mangleNames(kname)
+            name = "%(namespace)s%(cppname)s" % klassattrs
+            if not name in known:
+                known.add(name)
+                result.append((klass, klassattrs))
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11instantiationName
+#
+# The C++ name of the explicit instantiation of the given kind ("class",
+# "trampoline", or "publicist") for a template class instantiation, or None if
+# there is no such thing.
+#-------------------------------------------------------------------------------
+def PYB11instantiationName(kind, klass, klassattrs):
+    if kind == "class":
+        return "%(namespace)s%(cppname)s" % klassattrs
+    elif kind == "trampoline" and PYB11virtualClass(klass.klass_template):
+        return "%(namespace)sPYB11Trampoline%(cppname)s" % klassattrs
+    elif kind == "publicist" and PYB11protectedClass(klass.klass_template):
+        return "%(namespace)sPYB11Publicist%(cppname)s" % klassattrs
+    return None
+
+# The names of the given kind, optionally just for one class template
+def PYB11instantiationNames(modobj, kind, klass_template = None):
+    result = []
+    for klass, klassattrs in PYB11explicitInstantiations(modobj):
+        if klass_template is None or klass.klass_template is klass_template:
+            name = PYB11instantiationName(kind, klass, klassattrs)
+            if name:
+                result.append(name)
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11instantiationFingerprint
+#
+# Fingerprint for a unit (such as a trampoline header) which depends on the
+# explicit instantiations of klass_template.
+#-------------------------------------------------------------------------------
+def PYB11instantiationFingerprint(modobj, kind, klass):
+    if modobj.explicit_instantiation:
+        return PYB11unitFingerprint(kind, klass, *[x for (x, attrs) in PYB11explicitInstantiations(modobj)
+                                                   if x.klass_template is klass])
+    return PYB11unitFingerprint(kind, klass)
+
+#-------------------------------------------------------------------------------
+# PYB11generateExternTemplates
+#
+# Declare the explicit instantiations of the given kind extern.
+#-------------------------------------------------------------------------------
+def PYB11generateExternTemplates(modobj, kind, ss, klass_template = None):
+    names = PYB11instantiationNames(modobj, kind, klass_template)
+    if names:
+        ss("// Explicitly instantiated in %s\n" % PYB11instantiationFile(modobj))
+        for name in names:
+            ss("extern template class %s;\n" % name)
+    return
+
+def PYB11instantiationFile(modobj):
+    return modobj.basename + "_instantiations.cc"
+
+#-------------------------------------------------------------------------------
+# PYB11generateModuleInstantiations
+#
+# Add the unit for the source file with the explicit instantiations.  It is
+# written even if there is nothing to instantiate, so the set of generated files
+# does not depend on whether the module binds template classes.
+#-------------------------------------------------------------------------------
+def PYB11generateModuleInstantiations(modobj):
+    if not modobj.explicit_instantiation:
+        return
+    filename = PYB11instantiationFile(modobj)
+    modobj.generatedfiles_list.append(filename)
+    PYB11addUnit(modobj, os.path.join(modobj.basedir, filename),
+                 lambda ss: PYB11generateInstantiations(modobj, ss),
+                 PYB11unitFingerprint("instantiations", *[klass for (klass, klassattrs) in PYB11explicitInstantiations(modobj)]))
+    return
+
+def PYB11generateInstantiations(modobj, ss):
+    from .PYB11class import PYB11classIncludes
+    ss("""//------------------------------------------------------------------------------
+// Explicit template instantiations for module %s
+//------------------------------------------------------------------------------
+""" % modobj.PYB11modulename)
+    incs = []
+    for klass, klassattrs in PYB11explicitInstantiations(modobj):
+        incs += PYB11classIncludes(modobj, klass.klass_template, klassattrs)
+    for inc in collections.OrderedDict.fromkeys(incs):
+        ss("#include %s\n" % inc)
+    ss("\n")
+    for klass, klassattrs in PYB11explicitInstantiations(modobj):
+        for kind in ("class", "trampoline", "publicist"):
+            name = PYB11instantiationName(kind, klass, klassattrs)
+            if name:
+                ss("template class %s;\n" % name)
+    return
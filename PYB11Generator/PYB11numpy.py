@@ -0,0 +1,265 @@
+#-------------------------------------------------------------------------------
+# PYB11numpy
+#
+# Bindings specific to NumPy, which need pybind11/numpy.h.  (PYB11numpy_view
+# attributes are with the other class attributes in PYB11ClassAttribute.)
+#
+# @PYB11vectorize(*args, pyname = None) on a function or method adds a NumPy
+# vectorized variant next to the scalar binding, using py::vectorize, so one
+# call over arrays replaces a loop of Python level calls.  args names the
+# arguments to vectorize (by default all of them: py::vectorize broadcasts
+# every arithmetic, complex, or POD argument), and the others are passed
+# through as scalars.  The variant is bound under pyname, or as an overload
+# of the scalar binding if None.  It is subject to the same thread guard and
+# GIL release policy as the scalar binding.  py::vectorize needs the GIL
+# throughout, so such variants are instead bound through a lambda which takes
+# the guard, broadcasts the arrays with NumPy, and calls PYB11vectorizeCall
+# (in the master include) to loop over them, releasing the GIL for the loop.
+#-------------------------------------------------------------------------------
+import inspect
+
+from .PYB11utils import *
+from .PYB11gil import *
+from .PYB11threads import *
+
+#-------------------------------------------------------------------------------
+# PYB11numpyUsed
+#
+# Does the module need the NumPy support of pybind11?
+#-------------------------------------------------------------------------------
+def PYB11numpyUsed(modobj):
+    return PYB11cached("numpy_used", modobj, PYB11findNumpyUse)
+
+def PYB11findNumpyUse(modobj):
+    funcs = [meth for (name, meth) in PYB11functions(modobj)]
+    funcs += [inst.func_template for (name, inst) in PYB11getModuleIndex(modobj).template_functions]
+    for klass, klassattrs in PYB11boundClasses(modobj):
+        klassindex = PYB11getClassIndex(klass)
+        if any(attr.deftype == "numpy_view" for (name, attr) in klassindex.attributes):
+            return True
+        funcs += [meth for (name, meth) in PYB11ClassMethods(klass)]
+        funcs += [inst.func_template for (name, inst) in klassindex.template_methods]
+    return any(PYB11attrs(func)["vectorize"] for func in funcs)
+
+#-------------------------------------------------------------------------------
+# PYB11vectorizeGuards
+#
+# The thread guard, whether to release the GIL for the loop, and the call_guard
+# of the vectorized variant of a function or method.  klassattrs is None for
+# functions.
+#-------------------------------------------------------------------------------
+def PYB11vectorizeGuards(methattrs, klassattrs, args, returnType):
+    guard = None
+    if klassattrs is not None:
+        guard = PYB11threadGuard(methattrs, klassattrs)
+    release, reason = PYB11releaseGILpolicy(methattrs, klassattrs, args, returnType)
+    release, call_guard = PYB11splitCallGuard(methattrs, release)
+    if guard == "critical_section":
+        release = False
+
+    # We need the full signature to write the loop ourselves
+    if returnType is None:
+        guard, release = None, False
+    return guard, release, call_guard
+
+#-------------------------------------------------------------------------------
+# PYB11vectorized
+#
+# The expression to bind for the vectorized variant of a function or method,
+# given the expression (function or member function pointer) bound for the
+# scalar version.  klassattrs is None for functions and static methods.
+#-------------------------------------------------------------------------------
+def PYB11vectorized(methattrs, args, scalar, klassattrs = None, guard = None, release_gil = False):
+    vecargs, pyname = methattrs["vectorize"]
+    names = [argName for (argType, argName, default) in args]
+    for argName in vecargs:
+        if not argName in names:
+            raise RuntimeError("PYB11vectorize: %s is not an argument of %s" % (argName, methattrs["cppname"]))
+    if methattrs["implementation"]:
+        raise RuntimeError("PYB11vectorize: cannot vectorize %s given by an implementation" % methattrs["cppname"])
+    if not vecargs:
+        vecargs = names
+    if not vecargs:
+        raise RuntimeError("PYB11vectorize: %s has no arguments to vectorize" % methattrs["cppname"])
+    if guard or release_gil:
+        return PYB11vectorizedLoop(methattrs, args, scalar, klassattrs, vecargs, guard, release_gil)
+    if set(vecargs) == set(names):
+        return "py::vectorize(%s)" % scalar
+
+    # Vectorize just some of the arguments.  py::vectorize passes non-const
+    # lvalue references through as is, so we take the others that way.
+    params = []
+    if klassattrs:
+        if methattrs["const"]:
+            params.append("const %(namespace)s%(cppname)s* self" % klassattrs)
+        else:
+            params.append("%(namespace)s%(cppname)s* self" % klassattrs)
+    for argType, argName, default in args:
+        if argName in vecargs:
+            params.append("%s %s" % (argType, argName))
+        else:
+            params.append("std::decay_t<%s>& %s" % (argType, argName))
+    if klassattrs:
+        call = "(self->*(%s))(%s)" % (scalar, ", ".join(names))
+    else:
+        call = "(%s)(%s)" % (scalar, ", ".join(names))
+    return "py::vectorize([](%s) { return %s; })" % (", ".join(params), call)
+
+# The value type to loop over for a C++ argument or return type
+def PYB11valueType(cppType):
+    if "&" in cppType or "const" in cppType or "volatile" in cppType:
+        return "std::decay_t<%s>" % cppType
+    return cppType
+
+#-------------------------------------------------------------------------------
+# PYB11vectorizedLoop
+#
+# The lambda for a vectorized variant which holds a thread guard on self or
+# releases the GIL while it loops over the arrays.
+#-------------------------------------------------------------------------------
+def PYB11vectorizedLoop(methattrs, args, scalar, klassattrs, vecargs, guard, release_gil):
+    names = [argName for (argType, argName, default) in args]
+    params, elements = [], []
+    if klassattrs:
+        selftype = "%(namespace)s%(cppname)s&" % klassattrs
+        if methattrs["const"]:
+            selftype = "const " + selftype
+        params.append(selftype + " self")
+    for argType, argName, default in args:
+        if argName in vecargs:
+            params.append("py::array_t<%s, py::array::forcecast> %s" % (PYB11valueType(argType), argName))
+            elements.append("%s %s" % (PYB11valueType(argType), argName))
+        else:
+            params.append("%s %s" % (argType, argName))
+    if klassattrs:
+        call = "(self.*(%s))(%s)" % (scalar, ", ".join(names))
+    else:
+        call = "(%s)(%s)" % (scalar, ", ".join(names))
+    result = "[](%s) -> py::object {\n" % ", ".join(params)
+    if guard:
+        result += PYB11guardCode(guard, False)
+    result += "    return PYB11vectorizeCall<%s>(%s, [&](%s) { return %s; }, %s);\n  }" % (PYB11valueType(methattrs["returnType"]),
+                                                                                  "true" if release_gil else "false",
+                                                                                  ", ".join(elements),
+                                                                                  call,
+                                                                                  ", ".join(x for x in names if x in vecargs))
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11vectorizeLoopUsed
+#
+# Do any vectorized variants in the module need PYB11vectorizeCall?
+#-------------------------------------------------------------------------------
+def PYB11vectorizeLoopUsed(modobj):
+    return PYB11cached("vectorize_loop_used", modobj, PYB11findVectorizeLoops)
+
+def PYB11findVectorizeLoops(modobj):
+    def loops(meth, methattrs, klassattrs, returnType):
+        guard, release, call_guard = PYB11vectorizeGuards(methattrs, klassattrs, PYB11parseArgs(meth), returnType)
+        return bool(guard or release)
+
+    def functionReturn(meth):
+        return meth(*inspect.getfullargspec(meth).args)
+
+    funcs = [meth for (name, meth) in PYB11functions(modobj)]
+    funcs += [inst.func_template for (name, inst) in PYB11getModuleIndex(modobj).template_functions]
+    for meth in funcs:
+        methattrs = PYB11attrs(meth)
+        if methattrs["vectorize"] and loops(meth, methattrs, None, functionReturn(meth)):
+            return True
+    for klass, klassattrs in PYB11boundClasses(modobj):
+        klassinst = klass()
+        meths = [(mname, meth) for (mname, meth) in PYB11ClassMethods(klass)]
+        meths += [(tname, inst.func_template) for (tname, inst) in PYB11getClassIndex(klass).template_methods]
+        for mname, meth in meths:
+            methattrs = PYB11attrs(meth)
+            if methattrs["vectorize"]:
+                if loops(meth, methattrs, klassattrs, meth(klassinst)):
+                    return True
+    return False
+
+#-------------------------------------------------------------------------------
+# PYB11generateVectorizeSupport
+#
+# The loop for vectorized variants which hold a guard or release the GIL, for
+# the master include.
+#-------------------------------------------------------------------------------
+def PYB11generateVectorizeSupport(modobj, ss):
+    if PYB11vectorizeLoopUsed(modobj):
+        ss("""//------------------------------------------------------------------------------
+// Call f for each element of the arrays broadcast against one another by NumPy
+// (like py::vectorize), releasing the GIL for the loop if asked.
+//------------------------------------------------------------------------------
+#include <memory>
+#include <utility>
+#include <vector>
+
+template<typename Return>
+struct PYB11vectorizeLoop {
+  template<typename Func, typename... Ts, size_t... I>
+  static py::object run(bool release, Func& f, std::index_sequence<I...>, py::array_t<Ts, py::array::forcecast>&... arrays) {
+    py::tuple broadcast = py::module_::import("numpy").attr("broadcast_arrays")(arrays...);
+    std::tuple<py::array_t<Ts, py::array::c_style | py::array::forcecast>...> inputs(py::array_t<Ts, py::array::c_style | py::array::forcecast>::ensure(broadcast[I])...);
+    std::tuple<const Ts*...> data(std::get<I>(inputs).data()...);
+    const auto& input = std::get<0>(inputs);
+    py::array_t<Return> result(std::vector<py::ssize_t>(input.shape(), input.shape() + input.ndim()));
+    auto* out = result.mutable_data();
+    const auto n = result.size();
+    {
+      std::unique_ptr<py::gil_scoped_release> nogil(release ? new py::gil_scoped_release : nullptr);
+      for (py::ssize_t i = 0; i < n; ++i) out[i] = f(std::get<I>(data)[i]...);
+    }
+    if (result.ndim() == 0) return py::cast(out[0]);
+    return std::move(result);
+  }
+};
+
+template<>
+struct PYB11vectorizeLoop<void> {
+  template<typename Func, typename... Ts, size_t... I>
+  static py::object run(bool release, Func& f, std::index_sequence<I...>, py::array_t<Ts, py::array::forcecast>&... arrays) {
+    py::tuple broadcast = py::module_::import("numpy").attr("broadcast_arrays")(arrays...);
+    std::tuple<py::array_t<Ts, py::array::c_style | py::array::forcecast>...> inputs(py::array_t<Ts, py::array::c_style | py::array::forcecast>::ensure(broadcast[I])...);
+    std::tuple<const Ts*...> data(std::get<I>(inputs).data()...);
+    const auto n = std::get<0>(inputs).size();
+    {
+      std::unique_ptr<py::gil_scoped_release> nogil(release ? new py::gil_scoped_release : nullptr);
+      for (py::ssize_t i = 0; i < n; ++i) f(std::get<I>(data)[i]...);
+    }
+    return py::none();
+  }
+};
+
+template<typename Return, typename Func, typename... Ts>
+py::object PYB11vectorizeCall(bool release, Func&& f, py::array_t<Ts, py::array::forcecast>&... arrays) {
+  return PYB11vectorizeLoop<Return>::run(release, f, std::index_sequence_for<Ts...>(), arrays...);
+}
+
+""")
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11vectorizedName
+#
+# The Python name of the vectorized variant.
+#-------------------------------------------------------------------------------
+def PYB11vectorizedName(methattrs):
+    vecargs, pyname = methattrs["vectorize"]
+    return pyname or methattrs["pyname"]
+
+#-------------------------------------------------------------------------------
+# PYB11generateVectorized
+#
+# Bind the vectorized variant with obj.def/m.def etc. (deftype).
+#-------------------------------------------------------------------------------
+def PYB11generateVectorized(deftype, meth, methattrs, args, argString, binding, call_guard, ss):
+    vecargs, pyname = methattrs["vectorize"]
+    ss('  %s("%s", %s%s' % (deftype, PYB11vectorizedName(methattrs), binding, argString))
+    if call_guard:
+        ss(", py::call_guard<%s>()" % call_guard)
+    doc = inspect.getdoc(meth)
+    if doc:
+        ss(", ")
+        PYB11docstring(doc, ss)
+    ss(");\n")
+    return
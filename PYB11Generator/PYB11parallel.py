@@ -0,0 +1,81 @@
+#-------------------------------------------------------------------------------
+# PYB11parallel
+#
+# In multiple_files mode each class binding, trampoline, and publicist is
+# written to its own file, and these can be generated independently.  The
+# generators register such files here as units, and PYB11generateUnits
+# produces them at the end of the generation, optionally across a pool of
+# processes (PYB11generateModule(..., jobs = N)).
+#
+# Workers are forked from the generating process so they inherit the
+# (unpicklable) PYB11 module and all generation state; each returns the text
+# of its unit, and the parent emits the files in order.  Where fork is not
+# available we fall back to generating serially.
+#-------------------------------------------------------------------------------
+import io, os, multiprocessing
+
+from .PYB11profile import *
+
+# The units being generated by a pool, visible to the forked workers
+_PYB11pool_units = None
+
+#-------------------------------------------------------------------------------
+# PYB11addUnit
+#
+# Register a file to be generated by func(ss), where ss is a write method.
+# fingerprint is an optional function returning a digest of everything the unit
+# depends on, or None if that cannot be determined.
+#-------------------------------------------------------------------------------
+def PYB11addUnit(modobj, filename, func, fingerprint = None):
+    modobj.generation_units.append((filename, func, fingerprint))
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11renderUnit
+#
+# Generate the text for a unit.
+#-------------------------------------------------------------------------------
+def PYB11renderUnit(func):
+    fs = io.StringIO()
+    func(fs.write)
+    result = fs.getvalue()
+    fs.close()
+    return result
+
+def _PYB11poolWorker(i):
+    filename, func, fingerprint = _PYB11pool_units[i]
+    with PYB11profileUnit() as profile:
+        content = PYB11renderUnit(func)
+    return content, profile.data()
+
+#-------------------------------------------------------------------------------
+# PYB11generateUnits
+#
+# Generate and write all the registered units.
+#-------------------------------------------------------------------------------
+def PYB11generateUnits(modobj):
+    global _PYB11pool_units
+    units = modobj.generation_units
+    manifest = modobj.manifest
+    if manifest and manifest.incremental:
+        units = [(filename, func, fingerprint) for (filename, func, fingerprint) in units
+                 if not manifest.unchanged(filename, fingerprint and fingerprint())]
+    jobs = min(modobj.jobs, len(units))
+    if jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+        _PYB11pool_units = units
+        try:
+            with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                results = pool.map(_PYB11poolWorker, range(len(units)), chunksize=1)
+        finally:
+            _PYB11pool_units = None
+        contents = [content for (content, data) in results]
+        if modobj.profile:
+            for content, data in results:
+                modobj.profile.merge(data)
+    else:
+        contents = [PYB11renderUnit(func) for (filename, func, fingerprint) in units]
+    for (filename, func, fingerprint), content in zip(units, contents):
+        with modobj.emitter.open(filename, "w") as f:
+            f.write(content)
+    modobj.generation_units = []
+    return
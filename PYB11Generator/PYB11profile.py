@@ -0,0 +1,138 @@
+#-------------------------------------------------------------------------------
+# PYB11profile
+#
+# Optional instrumentation of a generation pass: the wall time spent in each
+# phase of PYB11generateModule and generating each class, along with counts of
+# the operations which tend to dominate (reading PYB11 attributes, looking up
+# source lines, checking base class overloads, emitting bytes).  Enabled with
+# PYB11generateModule(..., profile = True) or by setting the environment
+# variable PYB11_PROFILE, in which case a JSON report is written next to the
+# generated files list.
+#
+# When profiling is not active the hooks below cost a global lookup.
+#-------------------------------------------------------------------------------
+import os, time, json, collections
+
+# The active PYB11Profile, or None
+_PYB11profile = None
+
+#-------------------------------------------------------------------------------
+# PYB11Profile
+#-------------------------------------------------------------------------------
+class PYB11Profile:
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()    # phase -> seconds
+        self.classes = collections.OrderedDict()   # class -> seconds
+        self.counters = collections.Counter()
+        self.total = 0.0
+        return
+
+    # As a context manager, make this the active profile and time the whole
+    def __enter__(self):
+        global _PYB11profile
+        self.previous = _PYB11profile
+        _PYB11profile = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _PYB11profile
+        self.total += time.perf_counter() - self.start
+        _PYB11profile = self.previous
+        return False
+
+    # The results as plain data, and the inverse
+    def data(self):
+        return {"total"    : self.total,
+                "phases"   : dict(self.phases),
+                "classes"  : dict(self.classes),
+                "counters" : dict(sorted(self.counters.items()))}
+
+    # Add in the results from another profile (e.g., from a worker process)
+    def merge(self, data):
+        for key, val in data["phases"].items():
+            self.phases[key] = self.phases.get(key, 0.0) + val
+        for key, val in data["classes"].items():
+            self.classes[key] = self.classes.get(key, 0.0) + val
+        self.counters.update(data["counters"])
+        return
+
+    # Write a JSON report
+    def write(self, filename, **info):
+        report = dict(info)
+        report.update(self.data())
+        tmpname = filename + ".PYB11tmp"
+        with open(tmpname, "w") as f:
+            json.dump(report, f, indent=1)
+            f.write("\n")
+        os.replace(tmpname, filename)
+        return
+
+#-------------------------------------------------------------------------------
+# PYB11profiling
+#
+# Should we profile?  profile is the argument to PYB11generateModule; None
+# defers to the PYB11_PROFILE environment variable.
+#-------------------------------------------------------------------------------
+def PYB11profiling(profile = None):
+    if profile is None:
+        return os.environ.get("PYB11_PROFILE", "") not in ("", "0")
+    return bool(profile)
+
+#-------------------------------------------------------------------------------
+# PYB11count
+#
+# Increment a counter in the active profile.
+#-------------------------------------------------------------------------------
+def PYB11count(name, n = 1):
+    if _PYB11profile is not None:
+        _PYB11profile.counters[name] += n
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11timer
+#
+# Context manager accumulating the wall time of its body under
+# category ("phases" or "classes") and name in the active profile.
+#-------------------------------------------------------------------------------
+class PYB11timer:
+
+    def __init__(self, category, name):
+        self.category = category
+        self.name = name
+        return
+
+    def __enter__(self):
+        if _PYB11profile is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if _PYB11profile is not None:
+            times = getattr(_PYB11profile, self.category)
+            times[self.name] = times.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+#-------------------------------------------------------------------------------
+# PYB11profileUnit
+#
+# For worker processes: if profiling, collect what happens in the body in a
+# fresh profile, whose data() can be sent back to the parent to merge.
+# Otherwise the data is None.
+#-------------------------------------------------------------------------------
+class PYB11profileUnit:
+
+    def __enter__(self):
+        self.profile = PYB11Profile() if _PYB11profile is not None else None
+        if self.profile:
+            self.profile.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profile:
+            self.profile.__exit__(exc_type, exc_value, traceback)
+        return False
+
+    def data(self):
+        return self.profile.data() if self.profile else None
@@ -43,8 +43,9 @@ class PYB11property:
         return
 
     def __call__(self, propname, klassattrs, ss):
-        if not self.getterraw and self.getter is None:
-            self.getter = propname
+        getter = self.getter
+        if not self.getterraw and getter is None:
+            getter = propname
 
         if self.static:
             if self.setter:
@@ -73,9 +74,9 @@ class PYB11property:
                 if self.returnType:
                     ss(' -> ' + self.returnType)
                 if self.static:
-                    ss((' { return %(namespace)s%(cppname)s::' % klassattrs) + self.getter + '(); }')
+                    ss((' { return %(namespace)s%(cppname)s::' % klassattrs) + getter + '(); }')
                 else:
-                    ss((' { return self.' % klassattrs) + self.getter + '(); }')
+                    ss((' { return self.' % klassattrs) + getter + '(); }')
 
             else:
                 if self.returnType:
@@ -87,7 +88,7 @@ class PYB11property:
                         if self.getterconst:
                             ss(' const')
                     ss(') ')
-                ss('&%(namespace)s%(cppname)s::' % klassattrs + self.getter)
+                ss('&%(namespace)s%(cppname)s::' % klassattrs + getter)
 
         # setter, if any
         if self.setterraw:
@@ -132,7 +133,7 @@ def PYB11GenerateProperty(propname,
     assert not getter is None
 
     # Write the getter property formula.
-    returnType = eval("klassinst." + getter.__name__ + "()")
+    returnType = getattr(klassinst, getter.__name__)()
     getterattrs = PYB11attrs(getter)
     getterattrs["returnType"] = returnType
     getterattrs["namespace"] = "%(namespace)s" % klassattrs
@@ -202,17 +203,16 @@ def PYB11GenerateProperty(propname,
 #-------------------------------------------------------------------------------
 def PYB11GenerateClassProperties(klass, klassinst, klassattrs, ss):
 
-    globs, locs = globals(), locals()
-    props = [x for x in dir(klass) if isinstance(eval("klass.%s" % x, globs, locs), property) and x in klass.__dict__]
-    PYB11props = [x for x in dir(klass) if isinstance(eval("klass.%s" % x, globs, locs), PYB11property) and x in klass.__dict__]
+    klassindex = PYB11getClassIndex(klass)
+    props = klassindex.properties
+    PYB11props = klassindex.PYB11properties
     if props or PYB11props:
         ss("\n  // Properties\n")
 
-    for propname in props:
-        prop = eval("klass.%s" % propname)
+    for propname, prop in props:
         PYB11GenerateProperty(propname, prop, klassinst, klassattrs, ss)
-    for propname in PYB11props:
-        exec('klassinst.%s("%s", klassattrs, ss)' % (propname, propname))
+    for propname, prop in PYB11props:
+        prop(propname, klassattrs, ss)
     ss("\n")
 
     return
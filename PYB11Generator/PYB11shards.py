@@ -0,0 +1,92 @@
+#-------------------------------------------------------------------------------
+# PYB11shards
+#
+# Group the class bindings of a module into a chosen number of source files
+# (shards) of roughly equal compile cost, rather than one file per class
+# (multiple_files) or everything in one file.  Each shard parses the master
+# include once for all its classes, and no single shard is left holding most of
+# the work.
+#
+# The compile cost of a class binding is estimated from what it instantiates:
+# the py::class_ itself, each method def (overloads costing extra for the cast
+# signatures), properties and attributes, template method instantiations, and
+# the virtual methods of its trampoline.  Template class instantiations are
+# weighted up, as they also instantiate the underlying C++ template.  The costs
+# are only relative, and can be tuned through PYB11shard_costs.
+#-------------------------------------------------------------------------------
+import heapq, math
+
+from .PYB11utils import *
+
+# Relative compile cost weights
+PYB11shard_costs = {"class"          : 20.0,   # each bound class
+                    "method"         : 1.0,    # each method def
+                    "overload"       : 1.0,    # extra for each overloaded method
+                    "attribute"      : 1.0,    # each property or attribute
+                    "template_method": 2.0,    # each template method instantiation
+                    "virtual"        : 2.0,    # each virtual method in the trampoline
+                    "template_class" : 1.5}    # multiplier for template class instantiations
+
+#-------------------------------------------------------------------------------
+# PYB11classCost
+#
+# Estimate the relative compile cost of binding klass (a class or
+# PYB11TemplateClass instantiation).
+#-------------------------------------------------------------------------------
+def PYB11classCost(klass):
+    return PYB11cached("class_cost", klass, PYB11computeClassCost)
+
+def PYB11computeClassCost(klass):
+    from .PYB11class import PYB11TemplateClass
+    weights = PYB11shard_costs
+    template_klass = isinstance(klass, PYB11TemplateClass)
+    if template_klass:
+        klass = klass.klass_template
+    klassindex = PYB11getClassIndex(klass)
+    cost = weights["class"]
+    cppnames = {}
+    for mname, meth in klassindex.methods:
+        methattrs = PYB11attrs(meth)
+        if methattrs["ignore"]:
+            continue
+        cost += weights["method"]
+        if methattrs["virtual"] or methattrs["pure_virtual"]:
+            cost += weights["virtual"]
+        cppnames[methattrs["cppname"]] = cppnames.get(methattrs["cppname"], 0) + 1
+    cost += weights["overload"] * sum(n for n in cppnames.values() if n > 1)
+    cost += weights["attribute"] * (len(klassindex.properties) +
+                                     len(klassindex.PYB11properties) +
+                                     len(klassindex.attributes))
+    cost += weights["template_method"] * len(klassindex.template_methods)
+    for nkname, nklass in klassindex.classes:
+        cost += PYB11classCost(nklass)
+    if template_klass:
+        cost *= weights["template_class"]
+    return cost
+
+#-------------------------------------------------------------------------------
+# PYB11shardClasses
+#
+# Pack the (name, klass) pairs into shards of balanced estimated cost, either
+# a given number of them or as many as needed to keep each near target_cost.
+# Greedy: the most expensive remaining class goes in the cheapest shard.  Each
+# shard keeps its classes in their original order.  A given number of shards
+# is always returned, even if some are empty, so the set of files generated
+# from them does not change as classes are added or removed; with target_cost
+# empty shards are dropped.
+#-------------------------------------------------------------------------------
+def PYB11shardClasses(klasses, shards = None, target_cost = None):
+    costs = [PYB11classCost(klass) for (kname, klass) in klasses]
+    fixed = shards is not None
+    if not fixed:
+        assert target_cost, "PYB11shardClasses requires shards or target_cost"
+        shards = int(math.ceil(sum(costs)/target_cost))
+        shards = min(shards, len(klasses))
+    shards = max(1, int(shards))
+    heap = [(0.0, i) for i in range(shards)]
+    members = [[] for i in range(shards)]
+    for j in sorted(range(len(klasses)), key = lambda j: (-costs[j], j)):
+        cost, i = heapq.heappop(heap)
+        members[i].append(j)
+        heapq.heappush(heap, (cost + costs[j], i))
+    return [[klasses[j] for j in sorted(x)] for x in members if x or fixed]
@@ -0,0 +1,248 @@
+#-------------------------------------------------------------------------------
+# PYB11threads
+#
+# Support for free-threaded (no GIL) Python builds.
+#   - PYB11free_threaded = True in the PYB11 module declares the module safe to
+#     use without the GIL (py::mod_gil_not_used(), pybind11 2.13 or later), so
+#     importing it does not turn the GIL back on.
+#   - @PYB11thread_unsafe(guard) on a class or method serializes the calls of
+#     the (non-static) methods on each instance, where guard is
+#       "critical_section" : a py::scoped_critical_section on the Python object
+#                            (pybind11 3.0 or later), which is a no-op in
+#                            builds with the GIL, and is suspended should the
+#                            method release the GIL, so the method keeps it
+#       "mutex"            : a std::mutex per instance, acquired with the GIL
+#                            released, and dropped when the Python object is
+#                            collected.
+#     @PYB11thread_safe opts a method out of the class guard.  Guarded methods
+#     are bound through a lambda, so they need a full signature (return type).
+#   - A JSON report <modname>_PYB11_threads.json, written next to the generated
+#     files list, of the bound mutable state: readwrite attributes, writable
+#     NumPy views, property setters, and non-const methods, with any guard.
+#     Those without one cannot be proven safe.
+#-------------------------------------------------------------------------------
+import os, json
+
+from .PYB11utils import *
+
+PYB11thread_guards = ("critical_section", "mutex")
+
+#-------------------------------------------------------------------------------
+# PYB11threadGuard
+#
+# The guard for the binding of a method, or None.
+#-------------------------------------------------------------------------------
+def PYB11threadGuard(methattrs, klassattrs):
+    if methattrs["thread_unsafe"] is not None:
+        guard = methattrs["thread_unsafe"]
+    else:
+        guard = klassattrs["thread_unsafe"]
+    if guard and methattrs["static"]:
+        return None
+    return guard or None
+
+# Can we bind the method through a guarding lambda?
+def PYB11guardable(methattrs):
+    return not (methattrs["implementation"] or methattrs["returnType"] is None)
+
+#-------------------------------------------------------------------------------
+# PYB11guardedMethod
+#
+# A lambda calling the method of klass under its guard.  methptr is the
+# (cast) member function pointer the binding would otherwise use.  The mutex
+# is found with the GIL held, so the lambda releases the GIL itself (after
+# that) if release_gil is set, rather than through a call_guard.
+#-------------------------------------------------------------------------------
+def PYB11guardedMethod(klassattrs, methattrs, args, methptr, guard, release_gil):
+    selftype = "%(namespace)s%(cppname)s&" % klassattrs
+    if methattrs["const"]:
+        selftype = "const " + selftype
+    result = "[](%s self" % selftype
+    for argType, argName, default in args:
+        result += ", %s %s" % (argType, argName)
+    result += ") -> %(returnType)s {\n" % methattrs
+    result += PYB11guardCode(guard, release_gil)
+    callargs = []
+    for argType, argName, default in args:
+        if "&&" in argType:
+            callargs.append("std::move(%s)" % argName)
+        else:
+            callargs.append(argName)
+    result += "    return (self.*(%s))(%s);\n  }" % (methptr, ", ".join(callargs))
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11guardCode
+#
+# The statements taking the guard on self in a binding lambda, leaving the GIL
+# released afterwards if release_gil.
+#-------------------------------------------------------------------------------
+def PYB11guardCode(guard, release_gil):
+    if guard == "critical_section":
+        return "    py::scoped_critical_section PYB11guard(py::cast(&self, py::return_value_policy::reference));\n"
+    result = "    std::unique_lock<std::mutex> PYB11guard(PYB11instanceMutex(py::cast(&self, py::return_value_policy::reference)), std::defer_lock);\n"
+    if release_gil:
+        result += "    py::gil_scoped_release PYB11nogil;\n    PYB11guard.lock();\n"
+    else:
+        result += "    { py::gil_scoped_release PYB11nogil; PYB11guard.lock(); }\n"
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11threadGuardsUsed
+#
+# The kinds of guard used in the module.
+#-------------------------------------------------------------------------------
+def PYB11threadGuardsUsed(modobj):
+    return PYB11cached("thread_guards", modobj, PYB11findThreadGuards)
+
+def PYB11findThreadGuards(modobj):
+    result = set()
+    for klass, klassattrs in PYB11boundClasses(modobj):
+        if klassattrs["thread_unsafe"]:
+            result.add(klassattrs["thread_unsafe"])
+        for mname, meth in PYB11ClassMethods(klass):
+            if PYB11attrs(meth)["thread_unsafe"]:
+                result.add(PYB11attrs(meth)["thread_unsafe"])
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11generateThreadSupport
+#
+# The declarations the guards need, for the master include.
+#-------------------------------------------------------------------------------
+def PYB11generateThreadSupport(modobj, ss):
+    if "critical_section" in PYB11threadGuardsUsed(modobj):
+        ss('#include "pybind11/critical_section.h"\n\n')
+    if "mutex" in PYB11threadGuardsUsed(modobj):
+        ss("""//------------------------------------------------------------------------------
+// Per instance locks for methods marked PYB11thread_unsafe("mutex"), keyed on
+// the Python object of the instance and dropped when it is collected.  The
+// table is split into stripes, so calls on different instances rarely contend.
+//------------------------------------------------------------------------------
+#include <mutex>
+#include <memory>
+#include <cstdint>
+#include <unordered_map>
+
+struct PYB11instanceMutexStripe {
+  std::mutex lock;
+  std::unordered_map<PyObject*, std::unique_ptr<std::mutex>> mutexes;
+};
+
+inline PYB11instanceMutexStripe& PYB11instanceMutexStripeFor(PyObject* key) {
+  static PYB11instanceMutexStripe stripes[64];
+  return stripes[(reinterpret_cast<std::uintptr_t>(key) >> 4) & 63];
+}
+
+// Called with the GIL held
+inline std::mutex& PYB11instanceMutex(py::handle self) {
+  auto* key = self.ptr();
+  auto& stripe = PYB11instanceMutexStripeFor(key);
+  std::mutex* result;
+  bool created = false;
+  {
+    std::lock_guard<std::mutex> guard(stripe.lock);
+    auto& entry = stripe.mutexes[key];
+    if (!entry) {
+      entry.reset(new std::mutex);
+      created = true;
+    }
+    result = entry.get();
+  }
+  if (created) {
+    py::cpp_function cleanup([key](py::handle wr) {
+      auto& stripe = PYB11instanceMutexStripeFor(key);
+      {
+        std::lock_guard<std::mutex> guard(stripe.lock);
+        stripe.mutexes.erase(key);
+      }
+      wr.dec_ref();
+    });
+    py::weakref(self, cleanup).release();
+  }
+  return *result;
+}
+
+""")
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11generateThreadReport
+#
+# Find the bound mutable state of the module's classes, for free-threaded
+# modules or those using guards.
+#-------------------------------------------------------------------------------
+def PYB11generateThreadReport(modobj):
+    entries = []
+    if not (getattr(modobj, "PYB11free_threaded", False) or PYB11threadGuardsUsed(modobj)):
+        modobj.thread_report = entries
+        return
+
+    def record(name, kind, guard = None, note = None):
+        entry = {"binding" : name,
+                 "kind"    : kind,
+                 "guard"   : guard}
+        if note:
+            entry["note"] = note
+        entries.append(entry)
+        return
+
+    for klass, klassattrs in PYB11boundClasses(modobj):
+        klassinst = klass()
+        klassindex = PYB11getClassIndex(klass)
+        for attrname, attr in klassindex.attributes:
+            if attr.deftype == "readwrite":
+                record(klassattrs["pyname"] + "." + (attr.pyname or attrname),
+                       "static readwrite attribute" if attr.static else "readwrite attribute")
+            elif attr.deftype == "numpy_view" and not attr.readonly:
+                record(klassattrs["pyname"] + "." + (attr.pyname or attrname), "writable NumPy view")
+        for propname, prop in klassindex.properties:
+            if prop.fset:
+                record(klassattrs["pyname"] + "." + propname, "property setter")
+        for propname, prop in klassindex.PYB11properties:
+            if prop.setter or prop.setterraw:
+                record(klassattrs["pyname"] + "." + propname, "property setter")
+        for mname, meth in PYB11ThisClassMethods(klass):
+            methattrs = PYB11attrs(meth)
+            if methattrs["ignore"] or mname[:6] == "pyinit" or methattrs["const"]:
+                continue
+            methattrs["returnType"] = getattr(klassinst, mname)()
+            name = klassattrs["pyname"] + "." + methattrs["pyname"]
+            kind = "static method" if methattrs["static"] else "non-const method"
+            guard = PYB11threadGuard(methattrs, klassattrs)
+            if guard and not PYB11guardable(methattrs):
+                record(name, kind, note = "cannot guard without a full signature")
+            else:
+                record(name, kind, guard)
+            if methattrs["vectorize"]:
+                from .PYB11numpy import PYB11vectorizeGuards, PYB11vectorizedName
+                name = klassattrs["pyname"] + "." + PYB11vectorizedName(methattrs)
+                kind = "vectorized " + kind
+                if guard and methattrs["returnType"] is None:
+                    record(name, kind, note = "cannot guard without a full signature")
+                else:
+                    record(name, kind, PYB11vectorizeGuards(methattrs, klassattrs, PYB11parseArgs(meth), methattrs["returnType"])[0])
+    modobj.thread_report = entries
+    return
+
+#-------------------------------------------------------------------------------
+# PYB11writeThreadReport
+#
+# Write the report, or remove any from an earlier generation if there is
+# nothing to report.
+#-------------------------------------------------------------------------------
+def PYB11writeThreadReport(modobj, filename):
+    if not modobj.thread_report:
+        if os.path.isfile(filename):
+            os.remove(filename)
+        return
+    report = {"module"        : modobj.PYB11modulename,
+              "free_threaded" : bool(getattr(modobj, "PYB11free_threaded", False)),
+              "unguarded"     : [x["binding"] for x in modobj.thread_report if not x["guard"]],
+              "bindings"      : modobj.thread_report}
+    tmpname = filename + ".PYB11tmp"
+    with open(tmpname, "w") as f:
+        json.dump(report, f, indent=1)
+        f.write("\n")
+    os.replace(tmpname, filename)
+    return
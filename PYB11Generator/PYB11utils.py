@@ -1,5 +1,8 @@
 from .PYB11Decorators import *
-import inspect, io, types, itertools, collections
+from .PYB11cache import *
+from .PYB11profile import *
+from .PYB11index import *
+import inspect, io, types, itertools, collections, ast, linecache, re, functools
 
 #-------------------------------------------------------------------------------
 # PYB11inject
@@ -61,9 +64,20 @@ def PYB11inject(fromcls, tocls,
                                                static = fromcls.%(name)s.static,
                                                returnpolicy = fromcls.%(name)s.returnpolicy)''' % {"name": name})
 
+    # NumPy views
+    from .PYB11ClassAttribute import PYB11numpy_view
+    names = [x for x in dir(fromcls) if isinstance(eval('fromcls.%s' % x, globs, locs), PYB11numpy_view)]
+    for name in names:
+        exec('''tocls.%(name)s = PYB11numpy_view(dtype = fromcls.%(name)s.dtype,
+                                                 readonly = fromcls.%(name)s.readonly,
+                                                 pyname = fromcls.%(name)s.pyname,
+                                                 cppname = fromcls.%(name)s.cppname,
+                                                 doc = fromcls.%(name)s.doc)''' % {"name": name})
+
     # Attributes
     from .PYB11ClassAttribute import PYB11ClassAttribute
-    names = [x for x in dir(fromcls) if isinstance(eval('fromcls.%s' % x, globs, locs), PYB11ClassAttribute)]
+    names = [x for x in dir(fromcls) if isinstance(eval('fromcls.%s' % x, globs, locs), PYB11ClassAttribute) and
+             not isinstance(eval('fromcls.%s' % x, globs, locs), PYB11numpy_view)]
     for name in names:
         exec('''tocls.%(name)s = PYB11ClassAttribute(static = fromcls.%(name)s.static,
                                                      pyname = fromcls.%(name)s.pyname,
@@ -72,6 +86,8 @@ def PYB11inject(fromcls, tocls,
                                                      doc = fromcls.%(name)s.doc,
                                                      deftype = fromcls.%(name)s.deftype)''' % {"name": name})
 
+    # Anything we knew about tocls is now stale
+    PYB11invalidateAttrs(tocls)
     return
 
 #-------------------------------------------------------------------------------
@@ -95,6 +111,107 @@ def PYB11getBaseClasses(klass):
     result = { k[0] : k[1] for k in flatstuff }
     return result
 
+#-------------------------------------------------------------------------------
+# PYB11LineIndex
+#
+# Parse a source file once and map the qualified names of the classes it
+# defines to their (zero based) line numbers, using the same conventions as
+# inspect.findsource (the first decorator line if decorated).  We also note
+# where each class and function definition ends, so their source text can be
+# extracted without reparsing.
+#-------------------------------------------------------------------------------
+class PYB11LineIndex(ast.NodeVisitor):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stack = []
+        self.classes = {}          # qualname -> first line
+        self.class_ends = {}       # qualname -> end line
+        self.function_ends = {}    # first line -> end line
+        linecache.checkcache(filename)
+        self.lines = linecache.getlines(filename)
+        if self.lines:
+            self.visit(ast.parse("".join(self.lines), filename))
+        return
+
+    def visit_FunctionDef(self, node):
+        if node.decorator_list:
+            lineno = node.decorator_list[0].lineno
+        else:
+            lineno = node.lineno
+        self.function_ends.setdefault(lineno - 1, node.end_lineno)
+        self.stack.append(node.name)
+        self.stack.append("<locals>")
+        self.generic_visit(node)
+        self.stack.pop()
+        self.stack.pop()
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self.stack.append(node.name)
+        if node.decorator_list:
+            lineno = node.decorator_list[0].lineno
+        else:
+            lineno = node.lineno
+        qualname = ".".join(self.stack)
+        self.classes.setdefault(qualname, lineno - 1)
+        self.class_ends.setdefault(qualname, node.end_lineno)
+        self.generic_visit(node)
+        self.stack.pop()
+
+#-------------------------------------------------------------------------------
+# PYB11sourceLine
+#
+# The (zero based) source line an object is defined on, as inspect.findsource
+# would report it.  Raises OSError if the source is not available.
+#-------------------------------------------------------------------------------
+def PYB11sourceLine(obj):
+    PYB11count("PYB11sourceLine")
+    return PYB11cached("source_line", obj, PYB11findSourceLine)
+
+def PYB11findSourceLine(obj):
+    PYB11count("PYB11findSourceLine")
+    index = PYB11sourceIndex(obj)
+    if inspect.isclass(obj):
+        if obj.__qualname__ not in index.classes:
+            raise OSError("could not find class definition")
+        return index.classes[obj.__qualname__]
+    return obj.__code__.co_firstlineno - 1
+
+#-------------------------------------------------------------------------------
+# PYB11sourceIndex
+#
+# The (generation cached) PYB11LineIndex for the file defining obj.  Raises
+# OSError if the source is not available.
+#-------------------------------------------------------------------------------
+def PYB11sourceIndex(obj):
+    filename = inspect.getsourcefile(obj)
+    if not filename:
+        filename = inspect.getfile(obj)
+        if not (filename.startswith("<") and filename.endswith(">")):
+            raise OSError("source code not available")
+    index = PYB11cachedByKey("line_index", filename, PYB11LineIndex)
+    if not index.lines:
+        raise OSError("could not get source code")
+    return index
+
+#-------------------------------------------------------------------------------
+# PYB11sourceText
+#
+# The source text defining a class or function, including any decorators.
+# Raises OSError if the source is not available.
+#-------------------------------------------------------------------------------
+def PYB11sourceText(obj):
+    index = PYB11sourceIndex(obj)
+    start = PYB11sourceLine(obj)
+    if inspect.isclass(obj):
+        end = index.class_ends.get(obj.__qualname__)
+    else:
+        end = index.function_ends.get(start)
+    if end is None:
+        raise OSError("could not find end of definition for %s" % obj.__qualname__)
+    return "".join(index.lines[start:end])
+
 #-------------------------------------------------------------------------------
 # Key function to sort lists by source code order.
 #-------------------------------------------------------------------------------
@@ -102,52 +219,61 @@ def PYB11sort_by_line(stuff):
     from .PYB11class import PYB11TemplateClass
     name, obj = stuff
     if isinstance(obj, PYB11TemplateClass):
-        #return obj.order + 0
-        try:
-            source, lineno = inspect.findsource(obj.klass_template)
-        except:
-            raise RuntimeError("Cannot find source for %s?" % name)
-        #print " **> ", name, lineno
-        return lineno
-    else:
-        try:
-            source, lineno = inspect.findsource(obj)
-        except:
-            raise RuntimeError("Cannot find source for %s?" % name)
-        #print " ==> ", name, lineno
-        return lineno
+        obj = obj.klass_template
+    try:
+        return PYB11sourceLine(obj)
+    except:
+        raise RuntimeError("Cannot find source for %s?" % name)
 
 #-------------------------------------------------------------------------------
 # PYB11sort_by_inheritance
 #
-# Key sorting function to put base classes first.
+# Key sorting function to put base classes first.  Each class is keyed by its
+# source line, pushed past the keys of any of its bases in the set.  We compute
+# these in a single topological pass (Kahn's algorithm) over the inheritance
+# graph, so sorting on the keys orders bases first with ties broken by source
+# order.
 #-------------------------------------------------------------------------------
 class PYB11sort_by_inheritance:
     def __init__(self, klasses):
         from .PYB11class import PYB11TemplateClass
 
-        # First pass, order by line number
+        # Start from the line numbers
         self.keys = {}
         for (name, obj) in klasses:
             if isinstance(obj, PYB11TemplateClass):
                 klass = obj.klass_template
             else:
                 klass = obj
-            self.keys[klass] = PYB11sort_by_line((name, klass))
-
-        # Now make sure classes come after any of their bases
-        changed = True
-        while changed:
-            changed = False
-            for (name, obj) in klasses:
-                if isinstance(obj, PYB11TemplateClass):
-                    klass = obj.klass_template
-                else:
-                    klass = obj
-                for bklass in inspect.getmro(klass)[1:]:
-                    if (bklass in self.keys) and (self.keys[klass] <= self.keys[bklass]):
-                        self.keys[klass] = self.keys[bklass] + 1
-                        changed = True
+            if klass not in self.keys:
+                self.keys[klass] = PYB11sort_by_line((name, klass))
+
+        # Build the graph of bases -> derived classes within our set
+        derived = {klass : [] for klass in self.keys}
+        nbases = {klass : 0 for klass in self.keys}
+        for klass in self.keys:
+            for bklass in inspect.getmro(klass)[1:]:
+                if bklass in self.keys:
+                    derived[bklass].append(klass)
+                    nbases[klass] += 1
+
+        # Visit the classes in topological order, making sure classes come after
+        # any of their bases
+        ready = collections.deque([klass for klass in self.keys if nbases[klass] == 0])
+        nvisited = 0
+        while ready:
+            bklass = ready.popleft()
+            nvisited += 1
+            for klass in derived[bklass]:
+                if self.keys[klass] <= self.keys[bklass]:
+                    self.keys[klass] = self.keys[bklass] + 1
+                nbases[klass] -= 1
+                if nbases[klass] == 0:
+                    ready.append(klass)
+        if nvisited < len(self.keys):
+            cycle = [klass.__name__ for klass in self.keys if nbases[klass] > 0]
+            raise RuntimeError("PYB11sort_by_inheritance: inheritance cycle detected among %s" % cycle)
+        return
 
     def __call__(self, stuff):
         from .PYB11class import PYB11TemplateClass
@@ -158,15 +284,61 @@ class PYB11sort_by_inheritance:
             klass = obj
         return self.keys[klass]
 
+#-------------------------------------------------------------------------------
+# PYB11classesByInheritance
+#
+# The classes and template class instantiations of a module, sorted with base
+# classes first.  Computed once per generation.
+#-------------------------------------------------------------------------------
+def PYB11classesByInheritance(modobj):
+    def sortKlasses(modobj):
+        klasses = PYB11classes(modobj) + PYB11classTemplateInsts(modobj)
+        return sorted(klasses, key=PYB11sort_by_inheritance(klasses))
+    return list(PYB11cached("classes_by_inheritance", modobj, sortKlasses))
+
+#-------------------------------------------------------------------------------
+# PYB11boundClasses
+#
+# The classes bound in a module as (class, klassattrs), including template
+# class instantiations (as their template class, with the mangled names of the
+# instantiation) and nested classes.
+#-------------------------------------------------------------------------------
+def PYB11boundClasses(modobj):
+    from .PYB11class import PYB11TemplateClass, PYB11CheckKlassIgnore
+    result = []
+    def addClass(klass, klassattrs):
+        result.append((klass, klassattrs))
+        for nkname, nklass in PYB11nestedClasses(klass):
+            nklassattrs = PYB11attrs(nklass)
+            nklassattrs["pyname"] = klassattrs["pyname"] + "_" + nklassattrs["pyname"]
+            addClass(nklass, nklassattrs)
+        return
+    for kname, klass in PYB11classesByInheritance(modobj):
+        if PYB11CheckKlassIgnore(klass):
+            if isinstance(klass, PYB11TemplateClass):
+                addClass(klass.klass_template, klass.mangleNames(kname))
+            else:
+                addClass(klass, PYB11attrs(klass))
+    return result
+
+#-------------------------------------------------------------------------------
+# PYB11nestedClasses
+#
+# The class scope classes of a class, sorted with base classes first.
+#-------------------------------------------------------------------------------
+def PYB11nestedClasses(klass):
+    def sortKlasses(klass):
+        klasses = PYB11getClassIndex(klass).classes
+        return sorted(klasses, key=PYB11sort_by_inheritance(klasses))
+    return list(PYB11cached("nested_classes", klass, sortKlasses))
+
 #-------------------------------------------------------------------------------
 # PYB11classes
 #
 # Get the classes to bind from a module
 #-------------------------------------------------------------------------------
 def PYB11classes(modobj):
-    result = [(name, cls) for (name, cls) in inspect.getmembers(modobj, predicate=inspect.isclass)
-              if name[:5] != "PYB11"]
-    return sorted(result, key = PYB11sort_by_line)
+    return list(PYB11getModuleIndex(modobj).classes)
 
 #-------------------------------------------------------------------------------
 # PYB11othermods
@@ -185,11 +357,7 @@ def PYB11othermods(modobj):
 # Get the template class instantiations to bind from a module
 #-------------------------------------------------------------------------------
 def PYB11classTemplateInsts(modobj):
-    from .PYB11class import PYB11TemplateClass
-    globs, locs = globals(), locals()
-    result = [x for x in dir(modobj) if isinstance(eval("modobj.%s" % x, globs, locs), PYB11TemplateClass)]
-    result = [(x, eval("modobj.%s" % x, globs, locs)) for x in result]
-    return sorted(result, key = PYB11sort_by_line)
+    return list(PYB11getModuleIndex(modobj).template_classes)
 
 #-------------------------------------------------------------------------------
 # PYB11ClassMethods
@@ -197,14 +365,7 @@ def PYB11classTemplateInsts(modobj):
 # Get the methods to bind from a class
 #-------------------------------------------------------------------------------
 def PYB11ClassMethods(obj):
-    result = inspect.getmembers(obj, predicate=inspect.isfunction)
-    #result = inspect.getmembers(obj, predicate=inspect.ismethod)
-    # It's nice to sort in the same order the user created, but not necessary
-    try:
-        result.sort(key = PYB11sort_by_line)
-    except:
-        pass
-    return result
+    return list(PYB11getClassIndex(obj).methods)
 
 #-------------------------------------------------------------------------------
 # PYB11ThisClassMethods
@@ -213,8 +374,7 @@ def PYB11ClassMethods(obj):
 # in obj.
 #-------------------------------------------------------------------------------
 def PYB11ThisClassMethods(obj):
-    result = PYB11ClassMethods(obj)
-    return [(name, meth) for (name, meth) in result if name in obj.__dict__]
+    return list(PYB11getClassIndex(obj).local_methods)
 
 #-------------------------------------------------------------------------------
 # PYB11functions
@@ -222,14 +382,7 @@ def PYB11ThisClassMethods(obj):
 # Get the functions to bind from a module
 #-------------------------------------------------------------------------------
 def PYB11functions(modobj):
-    result = [(name, meth) for (name, meth) in inspect.getmembers(modobj, predicate=inspect.isfunction)
-              if name[:5] != "PYB11"]
-    # It's nice to sort in the same order the user created, but not necessary
-    try:
-        result.sort(key = PYB11sort_by_line)
-    except:
-        pass
-    return result
+    return list(PYB11getModuleIndex(modobj).functions)
 
 #-------------------------------------------------------------------------------
 # PYB11parseArgs
@@ -253,21 +406,51 @@ def PYB11parseArgs(meth):
 #-------------------------------------------------------------------------------
 # PYB11recurseTemplateDict
 #
-# Recursively iterate over a dictionary of template parameters until all value
-# parameters have been resolved.
+# Resolve the %(X)s references in a dictionary of template parameters, in place.
+# Each value is resolved once, after the values it refers to (depth first), and
+# a reference cycle is reported with the keys involved.  As the result depends
+# only on the contents, resolved dictionaries are memoized.
 #-------------------------------------------------------------------------------
+_PYB11template_reference = re.compile(r"%\(([^)]*)\)")
+
 def PYB11recurseTemplateDict(Tdict):
-    done = False
-    itcount = 0
-    while not done and itcount < 100:
-        done = True
-        itcount += 1
-        for key, val in Tdict.items():
-            if "%(" in val:
-                done = False
-                Tdict[key] = val % Tdict
-    if itcount == 100:
-        raise RuntimeError("PYB11recurseTemplate failed to resolve all values in %s" % Tdict)
+    if not any(isinstance(val, str) and "%(" in val for val in Tdict.values()):
+        return Tdict
+    try:
+        key = tuple(Tdict.items())
+        hash(key)
+    except TypeError:
+        Tdict.update(PYB11resolveTemplateDict(dict(Tdict)))
+    else:
+        Tdict.update(PYB11memoizedTemplateDict(key))
+    return Tdict
+
+@functools.lru_cache(maxsize = 4096)
+def PYB11memoizedTemplateDict(items):
+    return PYB11resolveTemplateDict(dict(items))
+
+def PYB11resolveTemplateDict(Tdict):
+    resolved = set()
+    path = []
+    def resolve(key):
+        if key in resolved or key not in Tdict:
+            return
+        if key in path:
+            cycle = path[path.index(key):] + [key]
+            raise RuntimeError("PYB11recurseTemplateDict found a cycle in the template parameters: %s\n    in %s" %
+                               (" -> ".join(cycle), Tdict))
+        path.append(key)
+        val = Tdict[key]
+        while isinstance(val, str) and "%(" in val:
+            for ref in _PYB11template_reference.findall(val):
+                resolve(ref)
+            val = val % Tdict
+        Tdict[key] = val
+        path.pop()
+        resolved.add(key)
+        return
+    for key in list(Tdict):
+        resolve(key)
     return Tdict
 
 #-------------------------------------------------------------------------------
@@ -429,8 +612,7 @@ def PYB11output(cmd, dict=None):
 # Find all PYB11 objects
 #-------------------------------------------------------------------------------
 def PYB11objs(modobj):
-    return [(name, obj) for (name, obj) in inspect.getmembers(modobj)
-            if name[:5] != "PYB11"]
+    return list(PYB11getModuleIndex(modobj).members)
 
 #-------------------------------------------------------------------------------
 # Find all PYB11 objects with the given attribute
@@ -443,8 +625,7 @@ def PYB11objsWithAttr(modobj, attrname):
 # Find all PYB11 objects with the given method
 #-------------------------------------------------------------------------------
 def PYB11objsWithMethod(modobj, methodname):
-    return [(name, obj) for (name, obj) in PYB11objs(modobj)
-            if (hasattr(obj, methodname) and callable(getattr(obj, methodname)))]
+    return list(PYB11getModuleIndex(modobj).objsWithMethod(methodname))
 
 #-------------------------------------------------------------------------------
 # Find all unique include files
@@ -460,9 +641,16 @@ def PYB11findAllIncludes(modobj):
 #-------------------------------------------------------------------------------
 # PYB11attrs
 #
-# Read the possible PYB11 generation attributes from the obj
+# Read the possible PYB11 generation attributes from the obj.  During a
+# generation pass these are memoized (see PYB11cache), and callers always get
+# back their own copy to modify.
 #-------------------------------------------------------------------------------
 def PYB11attrs(obj):
+    PYB11count("PYB11attrs")
+    return PYB11cachedAttrs(obj, PYB11readAttrs)
+
+def PYB11readAttrs(obj):
+    PYB11count("PYB11readAttrs")
     d = {"pyname"                : obj.__name__,
          "cppname"               : obj.__name__,
          "pynamebase"            : obj.__name__,
@@ -472,6 +660,7 @@ def PYB11attrs(obj):
          "holder"                : None,
          "exposeBaseOverloads"   : True,
          "dynamic_attr"          : None,
+         "buffer"                : None,
          "virtual"               : False,
          "pure_virtual"          : False,
          "protected"             : False,
@@ -482,6 +671,9 @@ def PYB11attrs(obj):
          "returnpolicy"          : None,
          "keepalive"             : None,
          "call_guard"            : None,
+         "release_gil"           : None,
+         "thread_unsafe"         : None,
+         "vectorize"             : None,
          "template"              : (),
          "template_dict"         : {},
          "module"                : {},
@@ -493,7 +685,7 @@ def PYB11attrs(obj):
 
     for key in d:
         if hasattr(obj, "PYB11" + key):
-            d[key] = eval("obj.PYB11%s" % key)
+            d[key] = getattr(obj, "PYB11" + key)
     safeexts= PYB11cppname_exts(d["template"])
     d["full_cppname"] = d["cppname"] + safeexts[0]
     d["mangle_cppname"] = d["cppname"] + safeexts[1]
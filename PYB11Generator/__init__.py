@@ -1,7 +1,7 @@
 #-------------------------------------------------------------------------------
 # PYB11Generator
 #-------------------------------------------------------------------------------
-import inspect, sys, os
+import inspect, sys, os, contextlib
 from .PYB11utils import *
 from .PYB11Decorators import *
 from .PYB11STLmethods import *
@@ -10,6 +10,15 @@ from .PYB11class import *
 from .PYB11Publicist import *
 from .PYB11enum import *
 from .PYB11attr import *
+from .PYB11parallel import *
+from .PYB11emitter import *
+from .PYB11incremental import *
+from .PYB11instantiation import *
+from .PYB11depfile import *
+from .PYB11gil import *
+from .PYB11threads import *
+from .PYB11numpy import *
+from .PYB11profile import *
 
 #-------------------------------------------------------------------------------
 # PYB11generateModule
@@ -18,7 +27,18 @@ def PYB11generateModule(modobj,
                         modname = None,
                         filename = None,
                         multiple_files = False,  # Optionally generate multiple pybind11 source files
-                        generatedfiles = None):  # file name to create list of generated pybind11 source files if multiple_files = True
+                        generatedfiles = None,   # file name to create list of generated pybind11 source files if multiple_files = True
+                        jobs = 1,                # number of processes for generating the separate files if multiple_files = True
+                        manifest = None,         # manifest file recording what was generated, for regenerating in place
+                        incremental = False,     # only regenerate the separate files whose inputs changed (requires manifest)
+                        allow_skips = False,     # leave existing files starting with "// PYB11skip" alone
+                        shards = None,           # number of files to group the class bindings into if multiple_files = True
+                        target_tu_cost = None,   # alternatively, group the class bindings into files of about this estimated cost
+                        precompiled_header = False, # keep the master include stable so it can be precompiled
+                        unity = None,            # number of unity build files to group the class files into if multiple_files = True
+                        template_bindings = False, # bind template class instantiations through a shared C++ function template
+                        explicit_instantiation = False, # explicitly instantiate template classes in one file, extern elsewhere (multiple_files)
+                        profile = None):         # write a timing report (defaults to the PYB11_PROFILE environment variable)
     if modname is None:
         modname = modobj.__name__
     modobj.PYB11modulename = modname
@@ -38,38 +58,79 @@ def PYB11generateModule(modobj,
     modobj.basename = basename
     modobj.generatedfiles = generatedfiles
     modobj.master_include_file = "PYB11_module_" + basename + ".hh"
+    modobj.decls_include_file = "PYB11_module_" + basename + "_decls.hh"
+    modobj.precompiled_header = precompiled_header
     modobj.generatedfiles_list = [tmp_filename]
-
-    # Main module source
-    PYB11generateModuleStart(modobj)
-
-    # enums
-    PYB11generateModuleEnums(modobj)
-
-    # STL types
-    PYB11generateModuleSTL(modobj)
-
-    # Generate the class binding calls
-    PYB11generateModuleClassBindingCalls(modobj)
-
-    # methods
-    PYB11generateModuleFunctions(modobj)
-
-    # Attributes
-    PYB11generateModuleAttrs(modobj)
-
-    # Close the module source
-    PYB11generateModuleClose(modobj)
-
-    # Generate the class binding functions
-    PYB11generateModuleClassFuncs(modobj)
-
-    # Write out our list of generated files
-    with open(generatedfiles, "w") as f:
-        ss = f.write
-        #ss(f"#  PYB11Generator generated files for module {modname}\n")
-        for x in modobj.generatedfiles_list:
-            ss(x + "\n")
+    modobj.jobs = max(1, int(jobs))
+    modobj.generation_units = []
+    modobj.emitter = PYB11Emitter(allow_skips)
+    modobj.manifest = None
+    modobj.shards = shards
+    modobj.target_tu_cost = target_tu_cost
+    modobj.shard_includes = None
+    modobj.unity = unity
+    modobj.template_bindings = template_bindings
+    modobj.template_bindings_written = set()
+    modobj.explicit_instantiation = explicit_instantiation
+    if (shards or target_tu_cost or unity or explicit_instantiation) and not multiple_files:
+        raise RuntimeError("PYB11generateModule: shards, target_tu_cost, unity, and explicit_instantiation require multiple_files")
+    if (shards or target_tu_cost) and unity:
+        raise RuntimeError("PYB11generateModule: cannot combine shards/target_tu_cost with unity")
+
+    # Memoize what we learn about objects for the duration of this generation.
+    # Output is buffered by the emitter, and nothing is written to disk unless the
+    # whole generation succeeds.
+    modobj.profile = PYB11Profile() if PYB11profiling(profile) else None
+    modobj.gil_report = []
+    modobj.thread_report = []
+    with (modobj.profile or contextlib.nullcontext()), PYB11generationCache(), PYB11GILdefault(modobj), modobj.emitter:
+
+        # What we generated last time
+        if manifest:
+            with PYB11timer("phases", "Manifest"):
+                modobj.manifest = PYB11Manifest(modobj, manifest, incremental)
+
+        for phase, func in (("Start",              PYB11generateModuleStart),             # Main module source
+                            ("Enums",              PYB11generateModuleEnums),             # enums
+                            ("STL",                PYB11generateModuleSTL),               # STL types
+                            ("ClassBindingCalls",  PYB11generateModuleClassBindingCalls), # Generate the class binding calls
+                            ("Functions",          PYB11generateModuleFunctions),         # methods
+                            ("Attrs",              PYB11generateModuleAttrs),             # Attributes
+                            ("Close",              PYB11generateModuleClose),             # Close the module source
+                            ("ClassFuncs",         PYB11generateModuleClassFuncs),        # Generate the class binding functions
+                            ("Instantiations",     PYB11generateModuleInstantiations),    # Explicit template instantiations (multiple_files)
+                            ("Units",              PYB11generateUnits),                   # Generate the separate trampoline, publicist, and class files (multiple_files)
+                            ("GIL",                PYB11generateGILreport),               # Find the bindings releasing the GIL
+                            ("Threads",            PYB11generateThreadReport)):           # Find the unguarded mutable state
+            with PYB11timer("phases", phase):
+                func(modobj)
+
+        # Write out our list of generated files
+        with modobj.emitter.open(generatedfiles, "w") as f:
+            ss = f.write
+            #ss(f"#  PYB11Generator generated files for module {modname}\n")
+            for x in modobj.generatedfiles_list:
+                ss(x + "\n")
+
+        with PYB11timer("phases", "Write"):
+            modobj.emitter.flush()
+
+    # Record what we generated for next time
+    if modobj.manifest:
+        modobj.manifest.write(modobj)
+
+    # Report the bindings releasing the GIL
+    PYB11writeGILreport(modobj, os.path.join(os.path.dirname(generatedfiles), modname + "_PYB11_gil.json"))
+
+    # Report the mutable state for free threading
+    PYB11writeThreadReport(modobj, os.path.join(os.path.dirname(generatedfiles), modname + "_PYB11_threads.json"))
+
+    # Report where the time went
+    if modobj.profile:
+        modobj.profile.write(os.path.join(os.path.dirname(generatedfiles), modname + "_PYB11_profile.json"),
+                             module = modname,
+                             multiple_files = multiple_files,
+                             jobs = modobj.jobs)
 
     return
 
@@ -83,19 +144,20 @@ def PYB11generateModuleStart(modobj):
     name = modobj.PYB11modulename
 
     # Generate module starting comments and include master header
-    faccess = "w" if modobj.multiple_files else "a"
-    with open(modobj.filename, faccess) as f:
+    with modobj.emitter.open(modobj.filename, "w") as f:
         ss = f.write
         incfile = modobj.master_include_file
         ss(f'''//------------------------------------------------------------------------------
 // Module {name}
 //------------------------------------------------------------------------------
 #include "{incfile}"
-
 ''')
+        if modobj.precompiled_header:
+            ss(f'#include "{modobj.decls_include_file}"\n')
+        ss("\n")
 
     # Make master include file
-    with open(os.path.join(modobj.basedir, modobj.master_include_file), "w") as f:
+    with modobj.emitter.open(os.path.join(modobj.basedir, modobj.master_include_file), "w") as f:
         ss = f.write
 
         ss(f"""//------------------------------------------------------------------------------
@@ -110,7 +172,10 @@ def PYB11generateModuleStart(modobj):
 #include "pybind11/stl.h"
 #include "pybind11/functional.h"
 #include "pybind11/operators.h"
-
+""")
+        if PYB11numpyUsed(modobj):
+            ss('#include "pybind11/numpy.h"\n')
+        ss("""
 namespace py = pybind11;
 using namespace pybind11::literals;
 """)
@@ -158,7 +223,33 @@ using namespace pybind11::literals;
             obj.PYB11opaqueTypes(modobj, ss, objname)
         ss("\n")
 
-        # Forward declare functions we use for multiple file bindings
+        # Support for thread guards
+        PYB11generateThreadSupport(modobj, ss)
+
+        # Support for guarded or GIL releasing vectorized variants
+        PYB11generateVectorizeSupport(modobj, ss)
+
+        # Template classes instantiated once elsewhere
+        if modobj.explicit_instantiation:
+            PYB11generateExternTemplates(modobj, "class", ss)
+            ss("\n")
+
+        # Forward declare functions we use for multiple file bindings.  When the
+        # master include is to be precompiled these go in a separate header, so
+        # adding or removing bindings does not invalidate the precompiled header.
+        if modobj.precompiled_header:
+            ss("#endif\n")
+            f = modobj.emitter.open(os.path.join(modobj.basedir, modobj.decls_include_file), "w")
+            ss = f.write
+            ss(f"""//------------------------------------------------------------------------------
+// Module {name} binding function declarations
+//------------------------------------------------------------------------------
+#ifndef PYB11_{name}_decls_include
+#define PYB11_{name}_decls_include
+
+#include "{modobj.master_include_file}"
+
+""")
         ss("""//------------------------------------------------------------------------------
 // Forward decalare methods for providing bindings
 //------------------------------------------------------------------------------
@@ -170,7 +261,7 @@ using namespace pybind11::literals;
         ss("\n#endif\n")
 
     # On to the module coding
-    with open(modobj.filename, "a") as f:
+    with modobj.emitter.open(modobj.filename, "a") as f:
         ss = f.write
 
         # Trampolines
@@ -179,12 +270,17 @@ using namespace pybind11::literals;
         # Publicists
         PYB11generateModulePublicists(modobj)
 
-        # Declare the module
+        # Declare the module (free-threaded modules declare they do not need the GIL)
+        if getattr(modobj, "PYB11free_threaded", False):
+            modargs = ", py::mod_gil_not_used()"
+        else:
+            modargs = ""
         ss("""//------------------------------------------------------------------------------
 // Make the module
 //------------------------------------------------------------------------------
-PYBIND11_MODULE(%(name)s, m) {
+PYBIND11_MODULE(%(name)s, m%(modargs)s) {
 """ % {"name"     : name,
+       "modargs"  : modargs,
 })
 
         doc = inspect.getdoc(modobj)
@@ -220,6 +316,6 @@ PYBIND11_MODULE(%(name)s, m) {
 # PYB11generateModuleClose
 #-------------------------------------------------------------------------------
 def PYB11generateModuleClose(modobj):
-    with open(modobj.filename, "a") as f:
+    with modobj.emitter.open(modobj.filename, "a") as f:
         f.write("}\n")
     return
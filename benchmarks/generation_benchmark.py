@@ -0,0 +1,266 @@
+#-------------------------------------------------------------------------------
+# generation_benchmark
+#
+# Measure how PYB11generateModule scales with the size and shape of the module
+# being bound, without compiling anything.  Synthetic PYB11 modules are built in
+# memory, varying one dimension at a time around a baseline:
+#   classes   - number of bound classes
+#   methods   - methods per class (every other one overloaded)
+#   depth     - length of the inheritance chains the classes form
+#   templates - instantiations of a template class
+#   virtual   - virtual methods per class (which need trampolines)
+#   protected - protected methods per class (which need publicists)
+# For each point we record the best wall time over a few repeats and the peak
+# Python memory of a single generation (tracemalloc), and fit the scaling
+# exponent of time against each dimension.  (With --jobs the memory measured is
+# only that of the parent process.)
+#
+# Usage:
+#   python generation_benchmark.py [--output results.json] [--label name]
+#                                  [--multiple-files] [--jobs n] [--repeat n]
+#                                  [--quick]
+#   python generation_benchmark.py --compare old.json new.json
+#
+# Run it with the PYB11Generator to test first on the PYTHONPATH, and compare
+# the JSON results from two revisions with --compare.
+#-------------------------------------------------------------------------------
+import sys, os, time, json, math, types, linecache, tempfile, tracemalloc
+import argparse, platform
+
+from PYB11Generator import *
+
+# The baseline module, and the values each dimension is swept through
+baseline = {"classes"   : 20,
+            "methods"   : 10,
+            "depth"     : 1,
+            "templates" : 0,
+            "virtual"   : 0,
+            "protected" : 0}
+
+sweeps = {"classes"   : [10, 20, 40, 80, 160],
+          "methods"   : [5, 10, 20, 40, 80],
+          "depth"     : [1, 2, 4, 8, 16],
+          "templates" : [5, 10, 20, 40, 80],
+          "virtual"   : [1, 2, 4, 8, 16],
+          "protected" : [1, 2, 4, 8, 16]}
+
+quick_sweeps = {key : val[:3] for (key, val) in sweeps.items()}
+
+#-------------------------------------------------------------------------------
+# The python source of a synthetic PYB11 module.
+#-------------------------------------------------------------------------------
+def syntheticSource(classes, methods, depth, templates, virtual, protected):
+    lines = ["from PYB11Generator import *",
+             "",
+             'PYB11includes = ["\\"Synthetic.hh\\""]',
+             ""]
+
+    def methodLines(i, j):
+        result = []
+        xtype = "int"
+        if j % 2 == 1:
+            result += ['    @PYB11pycppname("method%i")' % (j - 1)]
+            xtype = "double"
+        result += ["    @PYB11const",
+                   "    def method%i(self, x=\"%s\", y=\"double\"):" % (j, xtype),
+                   '        "Method %i of class %i"' % (j, i),
+                   '        return "double"',
+                   ""]
+        return result
+
+    for i in range(classes):
+        base = "Class%i" % (i - 1) if (i % depth) else "object"
+        lines += ["class Class%i(%s):" % (i, base),
+                  '    "Synthetic class %i"' % i,
+                  "",
+                  "    def pyinit(self):",
+                  '        "Default constructor"',
+                  ""]
+        for j in range(methods):
+            lines += methodLines(i, j)
+        for j in range(virtual):
+            lines += ["    @PYB11virtual",
+                      "    def virtual%i_%i(self, x=\"const std::vector<double>&\"):" % (i, j),
+                      '        "Virtual method %i"' % j,
+                      '        return "void"',
+                      ""]
+        for j in range(protected):
+            lines += ["    @PYB11protected",
+                      "    def protected%i_%i(self, x=\"int\"):" % (i, j),
+                      '        "Protected method %i"' % j,
+                      '        return "int"',
+                      ""]
+        lines += ["    value%i = PYB11readwrite()" % i,
+                  ""]
+
+    if templates:
+        lines += ['@PYB11template("T")',
+                  "class TemplateClass:",
+                  '    "Synthetic template class"',
+                  "",
+                  "    def pyinit(self):",
+                  '        "Default constructor"',
+                  ""]
+        for j in range(methods):
+            lines += ["    def tmethod%i(self, x=\"const %%(T)s&\"):" % j,
+                      '        "Template method %i"' % j,
+                      '        return "%(T)s"',
+                      ""]
+        for k in range(templates):
+            lines += ['TemplateClass%i = PYB11TemplateClass(TemplateClass, template_parameters="Type%i")' % (k, k)]
+        lines += [""]
+    return "\n".join(lines) + "\n"
+
+#-------------------------------------------------------------------------------
+# Build a synthetic module object.  The source is registered with linecache so
+# inspect can find it just as for a module on disk.
+#-------------------------------------------------------------------------------
+_module_count = 0
+def syntheticModule(**params):
+    global _module_count
+    _module_count += 1
+    name = "PYB11synthetic%i" % _module_count
+    filename = "<%s>" % name
+    source = syntheticSource(**params)
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    mod = types.ModuleType(name)
+    mod.__file__ = filename
+    sys.modules[name] = mod
+    exec(compile(source, filename, "exec"), mod.__dict__)
+    return mod
+
+#-------------------------------------------------------------------------------
+# Generate the module once into a scratch directory.
+#-------------------------------------------------------------------------------
+def generate(mod, multiple_files, jobs):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        PYB11generateModule(mod,
+                            modname = "synthetic",
+                            filename = os.path.join(tmpdir, "synthetic.cc"),
+                            multiple_files = multiple_files,
+                            generatedfiles = os.path.join(tmpdir, "synthetic_generated.txt"),
+                            jobs = jobs,
+                            profile = False)
+    return
+
+#-------------------------------------------------------------------------------
+# Time and measure the peak memory for generating one synthetic module.
+#-------------------------------------------------------------------------------
+def measure(params, multiple_files, jobs, repeat):
+    mod = syntheticModule(**params)
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        generate(mod, multiple_files, jobs)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    generate(mod, multiple_files, jobs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del sys.modules[mod.__name__]
+    linecache.cache.pop(mod.__file__, None)
+    return {"params"     : params,
+            "seconds"    : min(times),
+            "all_seconds": times,
+            "peak_bytes" : peak}
+
+#-------------------------------------------------------------------------------
+# Least squares slope of log(y) against log(x): the scaling exponent.
+#-------------------------------------------------------------------------------
+def scalingExponent(xs, ys):
+    pts = [(math.log(x), math.log(y)) for (x, y) in zip(xs, ys) if x > 0 and y > 0]
+    if len(pts) < 2:
+        return None
+    n = len(pts)
+    mx = sum(p[0] for p in pts)/n
+    my = sum(p[1] for p in pts)/n
+    sxx = sum((p[0] - mx)**2 for p in pts)
+    if sxx == 0.0:
+        return None
+    return sum((p[0] - mx)*(p[1] - my) for p in pts)/sxx
+
+def formatExponent(x):
+    return "?" if x is None else "%.2f" % x
+
+#-------------------------------------------------------------------------------
+# Run all the sweeps.
+#-------------------------------------------------------------------------------
+def run(args):
+    import PYB11Generator
+    results = {"label"          : args.label,
+               "generator"      : os.path.dirname(os.path.abspath(PYB11Generator.__file__)),
+               "python"         : platform.python_version(),
+               "platform"       : platform.platform(),
+               "multiple_files" : args.multiple_files,
+               "jobs"           : args.jobs,
+               "repeat"         : args.repeat,
+               "baseline"       : baseline,
+               "sweeps"         : {}}
+    for dim, values in (quick_sweeps if args.quick else sweeps).items():
+        points = []
+        for val in values:
+            params = dict(baseline)
+            params[dim] = val
+            point = measure(params, args.multiple_files, args.jobs, args.repeat)
+            point["value"] = val
+            points.append(point)
+            print("%-10s %6i : %9.4f s  %8.1f MiB" % (dim, val, point["seconds"], point["peak_bytes"]/2.0**20))
+        results["sweeps"][dim] = {"points"        : points,
+                                  "time_exponent" : scalingExponent([p["value"] for p in points],
+                                                                    [p["seconds"] for p in points]),
+                                  "memory_exponent" : scalingExponent([p["value"] for p in points],
+                                                                      [p["peak_bytes"] for p in points])}
+    print()
+    for dim, sweep in results["sweeps"].items():
+        print("%-10s time ~ n^%s  memory ~ n^%s" % (dim, formatExponent(sweep["time_exponent"]),
+                                                   formatExponent(sweep["memory_exponent"])))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+            f.write("\n")
+    return
+
+#-------------------------------------------------------------------------------
+# Compare the results of two runs, point by point.
+#-------------------------------------------------------------------------------
+def compare(oldname, newname):
+    with open(oldname, "r") as f:
+        old = json.load(f)
+    with open(newname, "r") as f:
+        new = json.load(f)
+    print("%-10s %6s %10s %10s %7s %9s %9s %7s" % ("dimension", "n", "old (s)", "new (s)", "ratio",
+                                                  "old MiB", "new MiB", "ratio"))
+    for dim, newsweep in new["sweeps"].items():
+        oldsweep = old["sweeps"].get(dim)
+        if oldsweep is None:
+            continue
+        oldpoints = {p["value"] : p for p in oldsweep["points"]}
+        for p in newsweep["points"]:
+            q = oldpoints.get(p["value"])
+            if q is None:
+                continue
+            print("%-10s %6i %10.4f %10.4f %7.2f %9.1f %9.1f %7.2f" % (dim, p["value"],
+                                                                      q["seconds"], p["seconds"],
+                                                                      p["seconds"]/q["seconds"],
+                                                                      q["peak_bytes"]/2.0**20,
+                                                                      p["peak_bytes"]/2.0**20,
+                                                                      p["peak_bytes"]/max(1, q["peak_bytes"])))
+        print("%-10s exponent %s -> %s" % (dim, formatExponent(oldsweep["time_exponent"]),
+                                           formatExponent(newsweep["time_exponent"])))
+    return
+
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark PYB11generateModule on synthetic modules")
+    parser.add_argument("--output", help = "write the results as JSON to this file")
+    parser.add_argument("--label", default = "", help = "label to record with the results")
+    parser.add_argument("--multiple-files", action = "store_true", help = "generate in multiple_files mode")
+    parser.add_argument("--jobs", type = int, default = 1, help = "jobs for multiple_files generation")
+    parser.add_argument("--repeat", type = int, default = 3, help = "timing repeats per point (best is kept)")
+    parser.add_argument("--quick", action = "store_true", help = "only the smaller points of each sweep")
+    parser.add_argument("--compare", nargs = 2, metavar = ("OLD", "NEW"), help = "compare two JSON results")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
@@ -33,7 +33,15 @@
 #                             GENERATED_FILES  ...
 #                             USE_BLT          ON/OFF
 #                             PYTHONPATH       ...
-#                             ALLOW_SKIPS      ON/OFF)
+#                             ALLOW_SKIPS      ON/OFF
+#                             JOBS             ...
+#                             INCREMENTAL      ON/OFF
+#                             SHARDS           ...
+#                             TARGET_TU_COST   ...
+#                             PRECOMPILED_HEADER ON/OFF
+#                             UNITY            ...
+#                             TEMPLATE_BINDINGS ON/OFF
+#                             EXPLICIT_INSTANTIATION ON/OFF)
 #   where arguments are:
 #       <package_name> (required)
 #           The base name of the Python module being generated.  Results in a module
@@ -80,6 +88,39 @@
 #       ALLOW_SKIPS  ON/OFF (optional, default OFF)
 #           Developer option (and dangerous).  If ON any generated C++ pybind11 files
 #           that start with the line "// PYB11skip" will not be regenerated and replaced
+#       JOBS ... (optional, default 1)
+#           Number of processes to use generating the separate pybind11 source files
+#           when MULTIPLE_FILES is ON
+#       INCREMENTAL  ON/OFF (optional, default OFF)
+#           When MULTIPLE_FILES is ON, only regenerate the class, trampoline, and publicist
+#           files whose inputs have changed since the last generation, as recorded in
+#           <module_name>_PYB11_manifest.json
+#       SHARDS ... (optional)
+#           Group the class bindings into this many source files of roughly equal
+#           estimated compile cost, rather than one file per class.  Implies
+#           MULTIPLE_FILES ON
+#       TARGET_TU_COST ... (optional)
+#           Alternatively to SHARDS, group the class bindings into as many source files
+#           as needed for each to have about this estimated compile cost.  Implies
+#           MULTIPLE_FILES ON
+#       PRECOMPILED_HEADER  ON/OFF (optional, default OFF)
+#           Precompile the master include PYB11_module_<module_name>.hh shared by all the
+#           generated source files (requires CMake 3.16).  The binding function
+#           declarations are moved to a separate header so the precompiled header only
+#           changes with the includes and preamble
+#       UNITY ... (optional)
+#           Generate one source file per class as for MULTIPLE_FILES, but compile them
+#           in this many unity build files (<module_name>_unity_<i>.cc), each including
+#           a group of the class files of roughly equal estimated compile cost.  Implies
+#           MULTIPLE_FILES ON, and cannot be combined with SHARDS or TARGET_TU_COST
+#       TEMPLATE_BINDINGS  ON/OFF (optional, default OFF)
+#           Bind the instantiations of each template class through a single shared C++
+#           function template, with each instantiation reduced to a one line call,
+#           rather than a separate copy of the bindings per instantiation
+#       EXPLICIT_INSTANTIATION  ON/OFF (optional, default OFF)
+#           Explicitly instantiate the template classes bound with PYB11TemplateClass,
+#           and their trampolines and publicists, once in <module_name>_instantiations.cc,
+#           and declare them extern template everywhere else.  Implies MULTIPLE_FILES ON
 #
 # This is the function users should call directly.  The macro PYB11_GENERATE_BINDINGS
 # defined next is primarily for internal use.
@@ -106,7 +147,7 @@ function(PYB11Generator_add_module package_name)
 
   # Define our arguments
   set(options )
-  set(oneValueArgs   MODULE SOURCE INSTALL MULTIPLE_FILES GENERATED_FILES USE_BLT ALLOW_SKIPS)
+  set(oneValueArgs   MODULE SOURCE INSTALL MULTIPLE_FILES GENERATED_FILES USE_BLT ALLOW_SKIPS JOBS INCREMENTAL SHARDS TARGET_TU_COST PRECOMPILED_HEADER UNITY TEMPLATE_BINDINGS EXPLICIT_INSTANTIATION)
   set(multiValueArgs INCLUDES LINKS DEPENDS PYBIND11_OPTIONS COMPILE_OPTIONS EXTRA_SOURCE PYTHONPATH)
   cmake_parse_arguments(${package_name} "${options}" "${oneValueArgs}" "${multiValueArgs}" ${ARGN})
   # message("-- package_name : ${package_name}")
@@ -124,6 +165,14 @@ function(PYB11Generator_add_module package_name)
   # message("-- EXTRA_SOURCE: ${package_name}_EXTRA_SOURCE")
   # message("-- PYTHONPATH: ${${package_name}_PYTHONPATH}")
   # message("-- ALLOW_SKIPS: ${${package_name}_ALLOW_SKIPS}")
+  # message("-- JOBS: ${${package_name}_JOBS}")
+  # message("-- INCREMENTAL: ${${package_name}_INCREMENTAL}")
+  # message("-- SHARDS: ${${package_name}_SHARDS}")
+  # message("-- TARGET_TU_COST: ${${package_name}_TARGET_TU_COST}")
+  # message("-- PRECOMPILED_HEADER: ${${package_name}_PRECOMPILED_HEADER}")
+  # message("-- UNITY: ${${package_name}_UNITY}")
+  # message("-- TEMPLATE_BINDINGS: ${${package_name}_TEMPLATE_BINDINGS}")
+  # message("-- EXPLICIT_INSTANTIATION: ${${package_name}_EXPLICIT_INSTANTIATION}")
 
   # Set our names and paths
   if (NOT DEFINED ${package_name}_MODULE)
@@ -141,6 +190,37 @@ function(PYB11Generator_add_module package_name)
   if (NOT DEFINED ${package_name}_ALLOW_SKIPS)
     set(${package_name}_ALLOW_SKIPS "OFF")
   endif()
+  if (NOT DEFINED ${package_name}_JOBS)
+    set(${package_name}_JOBS 1)
+  endif()
+  if (NOT DEFINED ${package_name}_INCREMENTAL)
+    set(${package_name}_INCREMENTAL "OFF")
+  endif()
+  if (NOT DEFINED ${package_name}_SHARDS)
+    set(${package_name}_SHARDS 0)
+  endif()
+  if (NOT DEFINED ${package_name}_TARGET_TU_COST)
+    set(${package_name}_TARGET_TU_COST 0)
+  endif()
+  if (NOT DEFINED ${package_name}_UNITY)
+    set(${package_name}_UNITY 0)
+  endif()
+  if (NOT DEFINED ${package_name}_EXPLICIT_INSTANTIATION)
+    set(${package_name}_EXPLICIT_INSTANTIATION "OFF")
+  endif()
+  if (${package_name}_SHARDS OR ${package_name}_TARGET_TU_COST OR ${package_name}_UNITY OR ${${package_name}_EXPLICIT_INSTANTIATION})
+    set(${package_name}_MULTIPLE_FILES "ON")
+  endif()
+  if (NOT DEFINED ${package_name}_PRECOMPILED_HEADER)
+    set(${package_name}_PRECOMPILED_HEADER "OFF")
+  endif()
+  if (NOT DEFINED ${package_name}_TEMPLATE_BINDINGS)
+    set(${package_name}_TEMPLATE_BINDINGS "OFF")
+  endif()
+  if (${${package_name}_PRECOMPILED_HEADER} AND CMAKE_VERSION VERSION_LESS 3.16)
+    message(WARNING "PYB11Generator: PRECOMPILED_HEADER requires CMake 3.16 or later, ignoring for ${package_name}")
+    set(${package_name}_PRECOMPILED_HEADER "OFF")
+  endif()
   # message("-- ${package_name}_MODULE: ${${package_name}_MODULE}")
   # message("-- ${package_name}_SOURCE: ${${package_name}_SOURCE}")
   # message("-- ${package_name}_MULTIPLE_FILES: ${${package_name}_MULTIPLE_FILES}")
@@ -153,7 +233,15 @@ function(PYB11Generator_add_module package_name)
                           MULTIPLE_FILES ${${package_name}_MULTIPLE_FILES} 
                           DEPENDS ${${package_name}_DEPENDS}
                           PYTHONPATH ${${package_name}_PYTHONPATH}
-                          ALLOW_SKIPS ${${package_name}_ALLOW_SKIPS})
+                          ALLOW_SKIPS ${${package_name}_ALLOW_SKIPS}
+                          JOBS ${${package_name}_JOBS}
+                          INCREMENTAL ${${package_name}_INCREMENTAL}
+                          SHARDS ${${package_name}_SHARDS}
+                          TARGET_TU_COST ${${package_name}_TARGET_TU_COST}
+                          PRECOMPILED_HEADER ${${package_name}_PRECOMPILED_HEADER}
+                          UNITY ${${package_name}_UNITY}
+                          TEMPLATE_BINDINGS ${${package_name}_TEMPLATE_BINDINGS}
+                          EXPLICIT_INSTANTIATION ${${package_name}_EXPLICIT_INSTANTIATION})
 
   # The library build rule
   if (${${package_name}_USE_BLT}) 
@@ -188,6 +276,12 @@ function(PYB11Generator_add_module package_name)
 
   target_compile_options(${${package_name}_MODULE} PRIVATE ${${package_name}_COMPILE_OPTIONS})
 
+  # Precompile the master include all the generated source shares
+  if (${${package_name}_PRECOMPILED_HEADER})
+    target_precompile_headers(${${package_name}_MODULE} PRIVATE
+      "$<$<COMPILE_LANGUAGE:CXX>:${CMAKE_CURRENT_BINARY_DIR}/current_${${package_name}_MODULE}/PYB11_module_${${package_name}_MODULE}.hh>")
+  endif()
+
   # Installation
   if (NOT ${${package_name}_INSTALL} STREQUAL "OFF")
     if ("${${package_name}_INSTALL} " STREQUAL " ")
@@ -196,13 +290,15 @@ function(PYB11Generator_add_module package_name)
     install(TARGETS ${${package_name}_MODULE} DESTINATION ${${package_name}_INSTALL})
   endif()
 
-  if (${package_name}_MULTIPLE_FILES)
-    # We need to regenerate at configuration time for multiple file output
-    # Read the generated CMake dependencies for PYB11 imported files (sets ${package_name}_FILE_DEPENDS)
-    include(${CMAKE_CURRENT_BINARY_DIR}/${${package_name}_MODULE}_stamp.cmake)
-    foreach(item IN LISTS ${${package_name}_MODULE}_FILE_DEPENDS)
-      set_property(DIRECTORY APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS ${item})
-    endforeach()
+  if (PYB11_USE_DEPFILE)
+    # Generation is a build step, rerun when any Python file it imported changes
+    # (see PYB11_GENERATE_BINDINGS).  Make sure it happens before we compile.
+    add_dependencies(${${package_name}_MODULE} ${${package_name}_MODULE}_src)
+
+  elseif (${package_name}_MULTIPLE_FILES)
+    # We need to regenerate at configuration time for multiple file output, which
+    # PYB11_GENERATE_BINDINGS arranges whenever one of the PYB11 imported files
+    # changes (see PYB11_check_dependencies)
 
   else()
     # For monolithic pybind11 output we add a source dependency on the PYB11 Python file
@@ -218,6 +314,10 @@ endfunction()
 #     - Generates the Python bindings for each module in the list
 #     - Generates python stamp files for listing python dependency file to help
 #       detecting changes in the pyb11 python files at build time
+#     - With CMake 3.20 or later, generation is a build step driven by the depfile
+#       the generator writes listing the Python files it imported
+#       (<module_name>_PYB11.d).  Multiple file output is only generated at
+#       configure time the first time through or when the generation options change
 #
 # Usage:
 #   PYB11_GENERATE_BINDINGS(<package_name> <module_name> <PYB11_SOURCE>
@@ -225,7 +325,15 @@ endfunction()
 #                           GENERATED_FILES ...
 #                           DEPENDS    ...
 #                           PYTHONPATH ...
-#                           ALLOW_SKIPS    ON/OFF)
+#                           ALLOW_SKIPS    ON/OFF
+#                           JOBS           ...
+#                           INCREMENTAL    ON/OFF
+#                           SHARDS         ...
+#                           TARGET_TU_COST ...
+#                           PRECOMPILED_HEADER ON/OFF
+#                           UNITY          ...
+#                           TEMPLATE_BINDINGS ON/OFF
+#                           EXPLICIT_INSTANTIATION ON/OFF)
 #   where the arguments are:
 #       <package_name> (required)
 #           The CMake target name
@@ -245,6 +353,39 @@ endfunction()
 #       ALLOW_SKIPS  ON/OFF (optional, default OFF)
 #           Developer option (and dangerous).  If ON any generated C++ pybind11 files
 #           that start with the line "// PYB11skip" will not be regenerated and replaced
+#       JOBS ... (optional, default 1)
+#           Number of processes to use generating the separate pybind11 source files
+#           when MULTIPLE_FILES is ON
+#       INCREMENTAL  ON/OFF (optional, default OFF)
+#           When MULTIPLE_FILES is ON, only regenerate the class, trampoline, and publicist
+#           files whose inputs have changed since the last generation, as recorded in
+#           <module_name>_PYB11_manifest.json
+#       SHARDS ... (optional)
+#           Group the class bindings into this many source files of roughly equal
+#           estimated compile cost, rather than one file per class.  Implies
+#           MULTIPLE_FILES ON
+#       TARGET_TU_COST ... (optional)
+#           Alternatively to SHARDS, group the class bindings into as many source files
+#           as needed for each to have about this estimated compile cost.  Implies
+#           MULTIPLE_FILES ON
+#       PRECOMPILED_HEADER  ON/OFF (optional, default OFF)
+#           Precompile the master include PYB11_module_<module_name>.hh shared by all the
+#           generated source files (requires CMake 3.16).  The binding function
+#           declarations are moved to a separate header so the precompiled header only
+#           changes with the includes and preamble
+#       UNITY ... (optional)
+#           Generate one source file per class as for MULTIPLE_FILES, but compile them
+#           in this many unity build files (<module_name>_unity_<i>.cc), each including
+#           a group of the class files of roughly equal estimated compile cost.  Implies
+#           MULTIPLE_FILES ON, and cannot be combined with SHARDS or TARGET_TU_COST
+#       TEMPLATE_BINDINGS  ON/OFF (optional, default OFF)
+#           Bind the instantiations of each template class through a single shared C++
+#           function template, with each instantiation reduced to a one line call,
+#           rather than a separate copy of the bindings per instantiation
+#       EXPLICIT_INSTANTIATION  ON/OFF (optional, default OFF)
+#           Explicitly instantiate the template classes bound with PYB11TemplateClass,
+#           and their trampolines and publicists, once in <module_name>_instantiations.cc,
+#           and declare them extern template everywhere else.  Implies MULTIPLE_FILES ON
 #
 # To get the names of the generated source
 # use: ${PYB11_GENERATED_SOURCE}
@@ -255,7 +396,7 @@ macro(PYB11_GENERATE_BINDINGS package_name module_name PYB11_SOURCE GENERATED_FI
 
   # Define our arguments
   set(options )
-  set(oneValueArgs MULTIPLE_FILES GENERATED_FILES ALLOW_SKIPS)
+  set(oneValueArgs MULTIPLE_FILES GENERATED_FILES ALLOW_SKIPS JOBS INCREMENTAL SHARDS TARGET_TU_COST PRECOMPILED_HEADER UNITY TEMPLATE_BINDINGS EXPLICIT_INSTANTIATION)
   set(multiValueArgs DEPENDS PYTHONPATH)
   cmake_parse_arguments(${package_name} "${options}" "${oneValueArgs}" "${multiValueArgs}" ${ARGN})
   # message("** package_name: ${package_name}")
@@ -265,6 +406,14 @@ macro(PYB11_GENERATE_BINDINGS package_name module_name PYB11_SOURCE GENERATED_FI
   # message("** PYTHONPATH: ${${package_name}_PYTHONPATH}")
   # message("** MULTIPLE_FILES: ${${package_name}_MULTIPLE_FILES}")
   # message("** ALLOW_SKIPS: ${${package_name}_ALLOW_SKIPS}")
+  # message("** JOBS: ${${package_name}_JOBS}")
+  # message("** INCREMENTAL: ${${package_name}_INCREMENTAL}")
+  # message("** SHARDS: ${${package_name}_SHARDS}")
+  # message("** TARGET_TU_COST: ${${package_name}_TARGET_TU_COST}")
+  # message("** PRECOMPILED_HEADER: ${${package_name}_PRECOMPILED_HEADER}")
+  # message("** UNITY: ${${package_name}_UNITY}")
+  # message("** TEMPLATE_BINDINGS: ${${package_name}_TEMPLATE_BINDINGS}")
+  # message("** EXPLICIT_INSTANTIATION: ${${package_name}_EXPLICIT_INSTANTIATION}")
 
   # Multiple file output options
   if(NOT DEFINED ${package_name}_MULTIPLE_FILES)
@@ -283,6 +432,38 @@ macro(PYB11_GENERATE_BINDINGS package_name module_name PYB11_SOURCE GENERATED_FI
   else()
     set(${package_name}_ALLOW_SKIPS "False")
   endif()
+  if (NOT DEFINED ${package_name}_JOBS)
+    set(${package_name}_JOBS 1)
+  endif()
+  if(${${package_name}_INCREMENTAL})
+    set(${package_name}_INCREMENTAL "True")
+  else()
+    set(${package_name}_INCREMENTAL "False")
+  endif()
+  if (NOT DEFINED ${package_name}_SHARDS)
+    set(${package_name}_SHARDS 0)
+  endif()
+  if (NOT DEFINED ${package_name}_TARGET_TU_COST)
+    set(${package_name}_TARGET_TU_COST 0)
+  endif()
+  if(${${package_name}_PRECOMPILED_HEADER})
+    set(${package_name}_PRECOMPILED_HEADER "True")
+  else()
+    set(${package_name}_PRECOMPILED_HEADER "False")
+  endif()
+  if (NOT DEFINED ${package_name}_UNITY)
+    set(${package_name}_UNITY 0)
+  endif()
+  if(${${package_name}_TEMPLATE_BINDINGS})
+    set(${package_name}_TEMPLATE_BINDINGS "True")
+  else()
+    set(${package_name}_TEMPLATE_BINDINGS "False")
+  endif()
+  if(${${package_name}_EXPLICIT_INSTANTIATION})
+    set(${package_name}_EXPLICIT_INSTANTIATION "True")
+  else()
+    set(${package_name}_EXPLICIT_INSTANTIATION "False")
+  endif()
 
   # Places we need in the Python path
   set(PYTHON_ENV ".:${CMAKE_CURRENT_BINARY_DIR}:${CMAKE_CURRENT_SOURCE_DIR}:${PYB11GENERATOR_ROOT_DIR}:${${package_name}_PYTHONPATH}")
@@ -293,32 +474,128 @@ macro(PYB11_GENERATE_BINDINGS package_name module_name PYB11_SOURCE GENERATED_FI
 
   # Extract the name of PYB11 generating source code without the .py extension
   string(REGEX REPLACE "\\.[^.]*$" "" pyb11_module ${PYB11_SOURCE})
+  if (EXISTS ${CMAKE_CURRENT_BINARY_DIR}/${PYB11_SOURCE})
+    set(FULL_PYB11_SOURCE_PATH ${CMAKE_CURRENT_BINARY_DIR}/${PYB11_SOURCE})
+  else()
+    set(FULL_PYB11_SOURCE_PATH ${CMAKE_CURRENT_SOURCE_DIR}/${PYB11_SOURCE})
+  endif()
+  set(PYB11_GENERATE_ARGS ${pyb11_module} ${module_name} ${${package_name}_MULTIPLE_FILES} ${${package_name}_GENERATED_FILES} ${${package_name}_ALLOW_SKIPS} ${${package_name}_JOBS} ${${package_name}_INCREMENTAL} ${${package_name}_SHARDS} ${${package_name}_TARGET_TU_COST} ${${package_name}_PRECOMPILED_HEADER} ${${package_name}_UNITY} ${${package_name}_TEMPLATE_BINDINGS} ${${package_name}_EXPLICIT_INSTANTIATION})
 
-  # Now for a big branch.  If we're generating multiple output files we need to do all
-  # generation and dependency checking at configure time, since we don't have a fixed
-  # set of resulting targets.  However, if we're only generating one monolithic pybind11
-  # output we can instead make a custom target and do dependency rebuild checking at
-  # compile time.
-  if (${package_name}_MULTIPLE_FILES)
+  # With CMake 3.20 or later generation is a build step, rerun only when one of the
+  # Python files it imported has changed: the generator writes a depfile listing them
+  # (<module_name>_PYB11.d), and stamps each successful run (<module_name>_PYB11.stamp).
+  set(PYB11_DEPFILE ${CMAKE_CURRENT_BINARY_DIR}/${module_name}_PYB11.d)
+  set(PYB11_STAMP_FILE ${CMAKE_CURRENT_BINARY_DIR}/${module_name}_PYB11.stamp)
+  if (CMAKE_VERSION VERSION_LESS 3.20)
+    set(PYB11_USE_DEPFILE OFF)
+  else()
+    set(PYB11_USE_DEPFILE ON)
+  endif()
+
+  if (PYB11_USE_DEPFILE)
+
+    # If we're generating multiple output files we have to know what they are when
+    # we configure, so we generate at configure time the first time through, or
+    # if the generation options change.  With a fixed number of SHARDS or UNITY
+    # files the set of files never changes, and after that the build regenerates
+    # as needed.  Otherwise adding or removing a class changes the set, so we
+    # reconfigure (and regenerate) whenever one of the Python files the last
+    # generation imported changes, as listed in <module_name>_PYB11_depends.cmake.
+    if (${package_name}_MULTIPLE_FILES)
+      if (${package_name}_SHARDS OR ${package_name}_UNITY)
+        set(PYB11_FIXED_FILES ON)
+      else()
+        set(PYB11_FIXED_FILES OFF)
+      endif()
+      set(PYB11_DEPENDS_FILE ${CMAKE_CURRENT_BINARY_DIR}/${module_name}_PYB11_depends.cmake)
+      string(JOIN " " PYB11_STAMP_CONTENTS ${PYB11_GENERATE_ARGS})
+      set(PYB11_LAST_STAMP "")
+      if (EXISTS ${PYB11_STAMP_FILE})
+        file(READ ${PYB11_STAMP_FILE} PYB11_LAST_STAMP)
+      endif()
+      set(PYB11_REGENERATE OFF)
+      if (NOT EXISTS ${CMAKE_CURRENT_BINARY_DIR}/${${package_name}_GENERATED_FILES} OR
+          NOT "${PYB11_LAST_STAMP}" STREQUAL "${PYB11_STAMP_CONTENTS}\n")
+        set(PYB11_REGENERATE ON)
+      elseif (NOT PYB11_FIXED_FILES)
+        if (EXISTS ${PYB11_DEPENDS_FILE})
+          include(${PYB11_DEPENDS_FILE})
+          foreach(item IN LISTS ${module_name}_PYB11_DEPENDS)
+            if (${item} IS_NEWER_THAN ${PYB11_STAMP_FILE})
+              set(PYB11_REGENERATE ON)
+            endif()
+          endforeach()
+        else()
+          set(PYB11_REGENERATE ON)
+        endif()
+      endif()
+      if (PYB11_REGENERATE)
+        message("-- Generating PYB11 code for ${package_name}")
+        set(ENV{PYTHONPATH} "${PYTHON_ENV}")
+        execute_process(
+          COMMAND ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/generate_cpp.py ${PYB11_GENERATE_ARGS} ${PYB11_DEPFILE} ${PYB11_STAMP_FILE}
+          WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
+        )
+        if (DEFINED PYTHONPATH_BAK)
+          set(ENV{PYTHONPATH} "${PYTHONPATH_BAK}")
+        else()
+          unset(ENV{PYTHONPATH})
+        endif()
+      endif()
+      file(STRINGS "${CMAKE_CURRENT_BINARY_DIR}/${${package_name}_GENERATED_FILES}" PYB11_BYPRODUCTS)
+      list(TRANSFORM PYB11_BYPRODUCTS PREPEND "current_${module_name}/")
+      if (NOT PYB11_FIXED_FILES)
+        include(${PYB11_DEPENDS_FILE})
+        foreach(item IN LISTS ${module_name}_PYB11_DEPENDS)
+          set_property(DIRECTORY APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS ${item})
+        endforeach()
+      endif()
+    else()
+      set(PYB11_BYPRODUCTS current_${module_name}/${PYB11_GENERATED_SOURCE} current_${module_name}/PYB11_module_${module_name}.hh)
+    endif()
+
+    add_custom_command(
+      OUTPUT ${PYB11_STAMP_FILE}
+      BYPRODUCTS ${PYB11_BYPRODUCTS}
+      COMMAND ${CMAKE_COMMAND} -E env PYTHONPATH="${PYTHON_ENV}" ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/generate_cpp.py ${PYB11_GENERATE_ARGS} ${PYB11_DEPFILE} ${PYB11_STAMP_FILE}
+      DEPENDS ${FULL_PYB11_SOURCE_PATH}
+      DEPFILE ${PYB11_DEPFILE}
+      WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
+      COMMENT "Generating PYB11 code for ${package_name}"
+    )
+    add_custom_target(${module_name}_src ALL DEPENDS ${PYB11_STAMP_FILE})
+
+  # Otherwise another big branch.  If we're generating multiple output files we need to
+  # do all generation and dependency checking at configure time, since we don't have a
+  # fixed set of resulting targets.  However, if we're only generating one monolithic
+  # pybind11 output we can instead make a custom target and do dependency rebuild
+  # checking at compile time.
+  elseif (${package_name}_MULTIPLE_FILES)
     message("-- Generating PYB11 code for ${package_name}")
 
     # Generate the pybind11 C++ files files and the list of those files
     set(ENV{PYTHONPATH} "${PYTHON_ENV}")
     execute_process(
-      COMMAND ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/generate_cpp.py ${pyb11_module} ${module_name} ${${package_name}_MULTIPLE_FILES} ${${package_name}_GENERATED_FILES} ${${package_name}_ALLOW_SKIPS}
+      COMMAND ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/generate_cpp.py ${PYB11_GENERATE_ARGS}
       WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
     )
 
-    # Generate the dependencies list
-    if (EXISTS ${CMAKE_CURRENT_BINARY_DIR}/${PYB11_SOURCE})
-      set(FULL_PYB11_SOURCE_PATH ${CMAKE_CURRENT_BINARY_DIR}/${PYB11_SOURCE})
+    # Generate the dependencies list (<module_name>_stamp.cmake).  The imports found
+    # in each Python file are cached across all the modules in the build, and where
+    # CMake can defer a call to the end of the configuration we scan all the modules
+    # with one moduleCheck.py run then.
+    string(REPLACE ";" ":" PYB11_CHECK_PATH "${PYTHON_ENV}")
+    set(PYB11_CHECK_ARGS --path ${PYB11_CHECK_PATH} ${FULL_PYB11_SOURCE_PATH} ${CMAKE_CURRENT_BINARY_DIR}/${module_name})
+    if (CMAKE_VERSION VERSION_LESS 3.19)
+      PYB11_check_dependencies(${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR} ${PYB11_CHECK_ARGS})
     else()
-      set(FULL_PYB11_SOURCE_PATH ${CMAKE_CURRENT_SOURCE_DIR}/${PYB11_SOURCE})
+      get_property(PYB11_CHECK_PENDING GLOBAL PROPERTY PYB11_CHECK_ARGS SET)
+      if (NOT PYB11_CHECK_PENDING)
+        set_property(GLOBAL PROPERTY PYB11_CHECK_COMMAND ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR})
+        cmake_language(DEFER DIRECTORY ${CMAKE_SOURCE_DIR} CALL PYB11_check_deferred_dependencies)
+      endif()
+      set_property(GLOBAL APPEND PROPERTY PYB11_CHECK_ARGS ${PYB11_CHECK_ARGS})
     endif()
-    execute_process(
-      COMMAND ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/moduleCheck.py ${FULL_PYB11_SOURCE_PATH} ${module_name}
-      WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
-    )
 
     # Restore the starting environment PYTHONPATH
     if (DEFINED PYTHONPATH_BAK)
@@ -331,8 +608,8 @@ macro(PYB11_GENERATE_BINDINGS package_name module_name PYB11_SOURCE GENERATED_FI
 
     add_custom_target(
       ${module_name}_src ALL
-      COMMAND ${CMAKE_COMMAND} -E env PYTHONPATH="${PYTHON_ENV}" ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/generate_cpp.py ${pyb11_module} ${module_name} ${${package_name}_MULTIPLE_FILES} ${${package_name}_GENERATED_FILES} ${${package_name}_ALLOW_SKIPS}
-      BYPRODUCTS current_${module_name}/${PYB11_GENERATED_SOURCE}
+      COMMAND ${CMAKE_COMMAND} -E env PYTHONPATH="${PYTHON_ENV}" ${PYTHON_EXE} ${PYB11GENERATOR_ROOT_DIR}/cmake/generate_cpp.py ${PYB11_GENERATE_ARGS}
+      BYPRODUCTS current_${module_name}/${PYB11_GENERATED_SOURCE} current_${module_name}/PYB11_module_${module_name}.hh
       WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
     )
 
@@ -349,3 +626,44 @@ macro(PYB11_GENERATE_BINDINGS package_name module_name PYB11_SOURCE GENERATED_FI
   set(${GENERATED_FILES_LIST} "${GENERATED_FILES}")# PARENT_SCOPE)
 
 endmacro()
+
+#-----------------------------------------------------------------------------------
+# PYB11_check_dependencies
+#     - Runs moduleCheck.py on the given modules, each given by
+#       --path <pythonpath> <PYB11_source> <binary_dir>/<module_name>
+#       and reconfigures whenever one of the Python files they import changes
+#     - Used by PYB11_GENERATE_BINDINGS for multiple file output before CMake 3.20
+#
+# Usage:
+#   PYB11_check_dependencies(<python_exe> <PYB11Generator_root> --path <pythonpath> <PYB11_source> <binary_dir>/<module_name> ...)
+#-----------------------------------------------------------------------------------
+function(PYB11_check_dependencies python_exe pyb11_root)
+  execute_process(
+    COMMAND ${python_exe} ${pyb11_root}/cmake/moduleCheck.py --cache ${CMAKE_BINARY_DIR}/PYB11_dependency_cache.json ${ARGN}
+    WORKING_DIRECTORY ${CMAKE_BINARY_DIR}
+  )
+
+  # Read the generated CMake dependencies for PYB11 imported files (each sets <module_name>_FILE_DEPENDS)
+  list(LENGTH ARGN nargs)
+  math(EXPR last "${nargs} - 1")
+  foreach(i RANGE 3 ${last} 4)
+    list(GET ARGN ${i} stamp)
+    get_filename_component(module ${stamp} NAME)
+    include(${stamp}_stamp.cmake)
+    foreach(item IN LISTS ${module}_FILE_DEPENDS)
+      set_property(DIRECTORY APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS ${item})
+    endforeach()
+  endforeach()
+endfunction()
+
+#-----------------------------------------------------------------------------------
+# PYB11_check_deferred_dependencies
+#     - Runs PYB11_check_dependencies on all the modules PYB11_GENERATE_BINDINGS
+#       has collected, at the end of the configuration (CMake 3.19)
+#-----------------------------------------------------------------------------------
+function(PYB11_check_deferred_dependencies)
+  get_property(check_command GLOBAL PROPERTY PYB11_CHECK_COMMAND)
+  get_property(check_args GLOBAL PROPERTY PYB11_CHECK_ARGS)
+  set_property(GLOBAL PROPERTY PYB11_CHECK_ARGS)
+  PYB11_check_dependencies(${check_command} ${check_args})
+endfunction()
@@ -1,4 +1,4 @@
-import sys, os, shutil, filecmp
+import sys, os, shutil, json
 
 # Arguments
 pyb11_mod_name = sys.argv[1]
@@ -6,66 +6,106 @@ mod_name = sys.argv[2]
 multiple_files = eval(sys.argv[3])
 generatedfiles = sys.argv[4]
 allow_skips = eval(sys.argv[5])
+jobs = int(sys.argv[6]) if len(sys.argv) > 6 else 1
+incremental = eval(sys.argv[7]) if len(sys.argv) > 7 else False
+shards = int(sys.argv[8]) if len(sys.argv) > 8 else 0
+target_tu_cost = float(sys.argv[9]) if len(sys.argv) > 9 else 0
+precompiled_header = eval(sys.argv[10]) if len(sys.argv) > 10 else False
+unity = int(sys.argv[11]) if len(sys.argv) > 11 else 0
+template_bindings = eval(sys.argv[12]) if len(sys.argv) > 12 else False
+explicit_instantiation = eval(sys.argv[13]) if len(sys.argv) > 13 else False
+depfile = sys.argv[14] if len(sys.argv) > 14 else None
+stamp = sys.argv[15] if len(sys.argv) > 15 else None
 
-# Prepare output directories
+# Prepare the output directory.  We generate directly into current_<mod>; the
+# manifest alongside it records the digests of what we wrote last time, so only
+# files whose contents change are rewritten and everything else keeps its
+# timestamp.
 current_pth = "current_" + mod_name
-new_pth     = "new_"     + mod_name
 if not os.path.exists(current_pth):
     os.makedirs(current_pth)
+manifest = mod_name + "_PYB11_manifest.json"
+
+# Clean up the shadow tree from older versions which generated into new_<mod>
+new_pth = "new_" + mod_name
 if os.path.exists(new_pth):
     shutil.rmtree(new_pth)
-os.makedirs(new_pth)
 
-# Paths to the main module pybind11 source files
+# Path to the main module pybind11 source file
 current_src = os.path.join(current_pth, mod_name + ".cc")
-new_src     = os.path.join(new_pth,    mod_name + ".cc")
 
-# Generate the source anew 
+# Generate the source
 code = """
 from PYB11Generator import *
 import {pyb11_module}
-PYB11generateModule({pyb11_module}, 
+PYB11generateModule({pyb11_module},
                     modname = \"{mod_name}\",
-                    filename = \"{new_src}\",
+                    filename = \"{current_src}\",
                     multiple_files = {multiple_files},
-                    generatedfiles = \"{generatedfiles}\")
+                    generatedfiles = \"{generatedfiles}\",
+                    jobs = {jobs},
+                    manifest = \"{manifest}\",
+                    incremental = {incremental},
+                    allow_skips = {allow_skips},
+                    shards = {shards},
+                    target_tu_cost = {target_tu_cost},
+                    precompiled_header = {precompiled_header},
+                    unity = {unity},
+                    template_bindings = {template_bindings},
+                    explicit_instantiation = {explicit_instantiation})
 """.format(pyb11_module   = pyb11_mod_name,
            mod_name       = mod_name,
-           new_src        = new_src,
+           current_src    = current_src,
            multiple_files = multiple_files,
-           generatedfiles = generatedfiles)
+           generatedfiles = generatedfiles,
+           jobs           = jobs,
+           manifest       = manifest,
+           incremental    = incremental,
+           allow_skips    = allow_skips,
+           shards         = shards or None,
+           target_tu_cost = target_tu_cost or None,
+           precompiled_header = precompiled_header,
+           unity          = unity or None,
+           template_bindings = template_bindings,
+           explicit_instantiation = explicit_instantiation)
 
 exec(code)
-assert os.path.isfile(new_src)
-
-# Look for any files we want to preserve from the existing generated pybind11 source
-skips = []
-if allow_skips:
-    # Scan to see if any of the current files should be preserved
-    current_files = os.listdir(current_pth)
-    for filename in current_files:
-        with open(os.path.join(current_pth, filename), "r") as f:
-            line = f.readline().strip()
-            if line.startswith("// PYB11skip"):
-                skips.append(filename)
-                print("PYB11Generator WARNING: skipping regenerating {} as requested".format(filename))
-
-# Compare the old and new generated files
-diff = filecmp.dircmp(current_pth, new_pth)
-
-# Copy any new files or changed files
-for filename in diff.right_only + diff.diff_files:
-    if not filename in skips:
-        shutil.copy(os.path.join(new_pth, filename),
-                    os.path.join(current_pth, filename))
 
 # Remove any files not in the new set
-for filename in diff.left_only:
-    if not filename in skips:
-        os.remove(os.path.join(current_pth, filename))
-
-# Clean up the temporary new file path
-shutil.rmtree(new_pth)
+with open(manifest, "r") as f:
+    files = json.load(f)["files"]
+for filename in os.listdir(current_pth):
+    if not filename in files:
+        pth = os.path.join(current_pth, filename)
+        if allow_skips:
+            with open(pth, "r") as f:
+                if f.readline().startswith("// PYB11skip"):
+                    print("PYB11Generator WARNING: skipping regenerating {} as requested".format(filename))
+                    continue
+        os.remove(pth)
 
 assert os.path.isfile(current_src)
-assert not os.path.exists(new_pth)
+
+# Record the Python files the generation depended on, so the build only reruns
+# us when one of them changes.  The same list goes in <mod>_PYB11_depends.cmake,
+# so when the set of generated files can change CMake can instead reconfigure
+# when one of them changes.
+if depfile:
+    from PYB11Generator import PYB11writeDepfile, PYB11importedFiles
+    PYB11writeDepfile(depfile, stamp or current_src, extra = [os.path.abspath(__file__)])
+    deps = sorted(set(PYB11importedFiles() + [os.path.realpath(__file__)]))
+    cmake_depends = "set(" + mod_name + "_PYB11_DEPENDS \n" + "".join(dep + "\n" for dep in deps) + ")\n"
+    cmake_depends_name = mod_name + "_PYB11_depends.cmake"
+    old_cmake_depends = None
+    if os.path.isfile(cmake_depends_name):
+        with open(cmake_depends_name, "r") as f:
+            old_cmake_depends = f.read()
+    if cmake_depends != old_cmake_depends:
+        with open(cmake_depends_name + ".tmp", "w") as f:
+            f.write(cmake_depends)
+        os.replace(cmake_depends_name + ".tmp", cmake_depends_name)
+
+# Stamp the successful generation with the arguments it was made with
+if stamp:
+    with open(stamp, "w") as f:
+        f.write(" ".join(sys.argv[1:14]) + "\n")
@@ -1,34 +1,163 @@
 # Find all the non-system python dependencies of a given python file
 # Based on the original version developed in Spheral.
-from modulefinder import ModuleFinder
-import sys, os
-import filecmp
-
-mod_file = sys.argv[1]
-mod_name = sys.argv[2]
-
-finder = ModuleFinder()
-finder.run_script(mod_file)
-#print("Warning failed imports: ", finder.badmodules.keys())
-
-current_stamp_name = mod_name + "_stamp.cmake"
-tmp_stamp_name = current_stamp_name + ".tmp"
-
-with open(tmp_stamp_name, "w") as newF:
-    newF.write("set("+mod_name+"_FILE_DEPENDS \n")
-
-    for name, mod in finder.modules.items():
-      if (mod.__file__):
-        if not ("lib/python3" in mod.__file__):
-          newF.write(mod.__file__)
-          newF.write('\n')
-
-    newF.write(")\n")
-
-if (os.path.isfile(current_stamp_name)):
-  if (not filecmp.cmp(current_stamp_name, tmp_stamp_name)):
-    os.rename(tmp_stamp_name, current_stamp_name)
-  else:
-    os.remove(tmp_stamp_name)
-else:
-  os.rename(tmp_stamp_name, current_stamp_name)
+#
+# Usage:
+#   moduleCheck.py [--cache <cache_file>] [--path <pythonpath>] <python_file> <module_name> [[--path <pythonpath>] <python_file> <module_name> ...]
+#
+# For each python file we write <module_name>_stamp.cmake, setting
+# <module_name>_FILE_DEPENDS to the python files it imports (directly or
+# indirectly).  <module_name> may include the directory to write the stamp in.
+# The python path searched is given by the last --path before the pair, or
+# PYTHONPATH, with relative entries taken relative to the stamp directory.  Rather than bytecode scanning every import (standard library and
+# site-packages included) we read the import statements with ast, and only
+# follow modules found on the PYTHONPATH.  The imports found in each file are
+# cached in <cache_file> keyed on the file's modification time and content hash,
+# so the cache can be shared by all the modules in a build.
+import sys, os, ast, json, hashlib
+
+# Arguments
+args = sys.argv[1:]
+cache_name = None
+if args[:1] == ["--cache"]:
+    cache_name = args[1]
+    args = args[2:]
+targets = []
+python_path = os.environ.get("PYTHONPATH", "")
+while args:
+    if args[0] == "--path":
+        python_path = args[1]
+        args = args[2:]
+    else:
+        assert len(args) >= 2, "moduleCheck.py expects pairs of <python_file> <module_name>"
+        targets.append((args[0], args[1], python_path))
+        args = args[2:]
+
+# Modules we never look for
+system_modules = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names)
+
+# Load the cache of imports by file
+cache = {}
+if cache_name and os.path.isfile(cache_name):
+    try:
+        with open(cache_name, "r") as f:
+            cache = json.load(f)
+    except ValueError:
+        cache = {}
+cache_modified = False
+
+#-------------------------------------------------------------------------------
+# The imports in a file, as a list of [module, names, level] (in the sense of
+# ast.ImportFrom).
+#-------------------------------------------------------------------------------
+def readImports(filename):
+    global cache_modified
+    stat = os.stat(filename)
+    entry = cache.get(filename)
+    if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["imports"]
+    with open(filename, "rb") as f:
+        source = f.read()
+    sha = hashlib.sha256(source).hexdigest()
+    if not (entry and entry["sha"] == sha):
+        imports = []
+        try:
+            tree = ast.parse(source, filename)
+        except SyntaxError:
+            print("moduleCheck WARNING: unable to parse {}".format(filename))
+            tree = ast.Module(body=[], type_ignores=[])
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    imports.append([alias.name, [], 0])
+            elif isinstance(node, ast.ImportFrom):
+                imports.append([node.module or "", [alias.name for alias in node.names], node.level])
+        entry = {"sha" : sha, "imports" : imports}
+    entry["mtime"] = stat.st_mtime_ns
+    entry["size"] = stat.st_size
+    cache[filename] = entry
+    cache_modified = True
+    return entry["imports"]
+
+#-------------------------------------------------------------------------------
+# The files making up the (dotted) module parts found in the directories dirs,
+# or None if it is not found.
+#-------------------------------------------------------------------------------
+def findModule(dirs, parts):
+    result = []
+    for part in parts:
+        found = None
+        for d in dirs:
+            pth = os.path.join(d, part)
+            if os.path.isfile(os.path.join(pth, "__init__.py")):
+                found = ([os.path.join(pth, "__init__.py")], [pth])
+            elif os.path.isfile(pth + ".py"):
+                found = ([pth + ".py"], [])
+            elif os.path.isdir(pth):                 # namespace package
+                found = ([], [pth])
+            if found:
+                break
+        if found is None:
+            return None
+        result += found[0]
+        dirs = found[1]
+    return result
+
+#-------------------------------------------------------------------------------
+# All the project python files filename depends on, including itself.
+#-------------------------------------------------------------------------------
+def findDependencies(filename, search_path):
+    filename = os.path.abspath(filename)
+    result = [filename]
+    known = set(result)
+    i = 0
+    while i < len(result):
+        current = result[i]
+        i += 1
+        for module, names, level in readImports(current):
+            parts = module.split(".") if module else []
+            if level == 0:
+                if parts[0] in system_modules:
+                    continue
+                dirs = search_path
+            else:
+                base = os.path.dirname(current)
+                for j in range(level - 1):
+                    base = os.path.dirname(base)
+                dirs = [base]
+            # "from x import y" may name a submodule y, or just something defined in x
+            candidates = [parts + [name] for name in names if name != "*"] + [parts]
+            for candidate in candidates:
+                if candidate:
+                    for dep in findModule(dirs, candidate) or []:
+                        if not dep in known:
+                            known.add(dep)
+                            result.append(dep)
+    return [x for x in result if not "lib/python3" in x]
+
+#-------------------------------------------------------------------------------
+# Write the stamp files, only touching those which change.
+#-------------------------------------------------------------------------------
+for mod_file, mod_name, python_path in targets:
+    current_stamp_name = mod_name + "_stamp.cmake"
+    stamp_dir = os.path.dirname(os.path.abspath(current_stamp_name))
+    search_path = [os.path.abspath(os.path.join(stamp_dir, x or ".")) for x in python_path.split(os.pathsep)]
+    stamp = "set(" + os.path.basename(mod_name) + "_FILE_DEPENDS \n"
+    for dep in findDependencies(mod_file, search_path):
+        stamp += dep + "\n"
+    stamp += ")\n"
+
+    if os.path.isfile(current_stamp_name):
+        with open(current_stamp_name, "r") as f:
+            if f.read() == stamp:
+                continue
+    tmp_stamp_name = current_stamp_name + ".tmp"
+    with open(tmp_stamp_name, "w") as newF:
+        newF.write(stamp)
+    os.replace(tmp_stamp_name, current_stamp_name)
+
+# Save the updated cache
+if cache_name and cache_modified:
+    tmp_cache_name = "{}.{}.tmp".format(cache_name, os.getpid())
+    with open(tmp_cache_name, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_cache_name, cache_name)
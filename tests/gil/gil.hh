@@ -0,0 +1,59 @@
+#pragma once
+
+#include <vector>
+#include <cmath>
+#include <string>
+#include <thread>
+#include <chrono>
+
+// A long running computation, safe to run without the GIL
+inline double sumRoots(const size_t n) {
+  double result = 0.0;
+  for (size_t i = 0; i < n; ++i) result += std::sqrt(double(i));
+  return result;
+}
+
+// Cheap enough not to bother releasing the GIL
+inline std::string hello() { return "hello"; }
+
+class Worker {
+public:
+  Worker()          {}
+  virtual ~Worker() {}
+
+  // Long running, and calls back the virtual cheap with the GIL released
+  double work(const size_t n) const { return sumRoots(n); }
+  double callCheap()                { std::vector<double> x(10, 1.0); return this->cheap(x); }
+
+  // Calls the virtual slow from several C++ threads, with the GIL released
+  double callSlow(const size_t nthreads, const size_t ms) {
+    std::vector<std::thread> threads;
+    std::vector<double> results(nthreads, 0.0);
+    for (size_t i = 0; i < nthreads; ++i) {
+      threads.emplace_back([this, &results, i, ms]() { std::vector<double> x(ms, 1.0); results[i] = this->slow(x); });
+    }
+    for (auto& t: threads) t.join();
+    double result = 0.0;
+    for (auto x: results) result += x;
+    return result;
+  }
+
+  // Cheap, and may be overridden in Python
+  virtual double cheap(std::vector<double>& x) { return double(x.size()); }
+
+  // Takes a millisecond per element, and should not need the GIL unless
+  // overridden in Python
+  virtual double slow(std::vector<double>& x) {
+    std::this_thread::sleep_for(std::chrono::milliseconds(x.size()));
+    return double(x.size());
+  }
+};
+
+class Accumulator {
+public:
+  Accumulator(): mTotal(0.0) {}
+  void add(const size_t n)   { mTotal += sumRoots(n); }
+  double total() const       { return mTotal; }
+private:
+  double mTotal;
+};
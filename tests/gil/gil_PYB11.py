@@ -0,0 +1,70 @@
+#-------------------------------------------------------------------------------
+# Releasing the GIL: the module default releases it for everything, with
+# exceptions made by class defaults and the method decorators.
+#-------------------------------------------------------------------------------
+from PYB11Generator import *
+
+PYB11includes = ['"gil.hh"',
+                 '"pybind11/stl.h"']
+
+PYB11release_gil = True
+
+def sumRoots(n = "const size_t"):
+    "Released by the module default"
+    return "double"
+
+@PYB11keepGIL
+def hello():
+    "Keeps the GIL"
+    return "std::string"
+
+class Worker:
+
+    def pyinit(self):
+        return
+
+    @PYB11const
+    def work(self, n = "const size_t"):
+        "Released by the module default"
+        return "double"
+
+    def callCheap(self):
+        "Released by the module default, so cheap is called without the GIL"
+        return "double"
+
+    @PYB11keepGIL
+    @PYB11virtual
+    def cheap(self, x = "std::vector<double>&"):
+        """Keeps the GIL, but the trampoline override must still take it, since
+callCheap calls this without"""
+        return "double"
+
+    def callSlow(self,
+                 nthreads = "const size_t",
+                 ms = "const size_t"):
+        "Released by the module default, and calls slow from nthreads C++ threads"
+        return "double"
+
+    @PYB11virtual
+    def slow(self, x = "std::vector<double>&"):
+        """Unless overridden in Python the C++ version runs without the GIL, so
+the C++ threads calling it run concurrently"""
+        return "double"
+
+class Accumulator:
+    "The class default keeps the GIL, except where asked"
+
+    PYB11release_gil = False
+
+    def pyinit(self):
+        return
+
+    @PYB11releaseGIL
+    def add(self, n = "const size_t"):
+        "Released by the decorator"
+        return "void"
+
+    @PYB11const
+    def total(self):
+        "Keeps the GIL by the class default"
+        return "double"
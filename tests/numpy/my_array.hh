@@ -1,3 +1,8 @@
+#pragma once
+
+#include <vector>
+#include <array>
+
 class Vector {
 public:
   double x, y, z;
@@ -9,11 +14,39 @@ public:
     z(z) {}
 };
 
+// Contiguous storage of Vectors, viewed by NumPy with a structured dtype
 class my_array {
 private:
   std::vector<Vector> mdata;
 public:
-  std::vector<Vector>& data() { return mdata; }
+  my_array(const size_t n = 0): mdata(n), weights(n, 1.0) {}
+  Vector* data()                            { return mdata.data(); }
+  size_t size() const                       { return mdata.size(); }
+  Vector& operator[](const size_t i)        { return mdata[i]; }
+  std::vector<double> weights;
 };
 
-  
+// Storage only exposed through a const pointer, so viewed read-only
+class const_array {
+private:
+  std::vector<double> mdata;
+public:
+  const_array(const size_t n, const double val): mdata(n, val) {}
+  const double* data() const                { return mdata.data(); }
+  size_t size() const                       { return mdata.size(); }
+};
+
+// Members viewed in place as NumPy arrays
+class field {
+public:
+  field(const size_t n): values(n, 0.0), origin{1.0, 2.0, 3.0}, points(n), mIDs(n) {
+    for (size_t i = 0; i < n; ++i) mIDs[i] = static_cast<int>(i);
+  }
+  const std::vector<int>& ids() const { return mIDs; }
+  std::vector<double> values;
+  std::array<double, 3> origin;
+  std::vector<Vector> points;
+  const std::vector<double> weights = {0.5, 0.25, 0.25};
+private:
+  std::vector<int> mIDs;
+};
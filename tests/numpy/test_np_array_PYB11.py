@@ -1,3 +1,7 @@
+#-------------------------------------------------------------------------------
+# NumPy views of C++ storage without copying: classes exposing their data
+# through the buffer protocol, and members viewed as arrays.
+#-------------------------------------------------------------------------------
 from PYB11Generator import *
 
 PYB11includes = ['"my_array.hh"',
@@ -18,13 +22,46 @@ class Vector:
     y = PYB11readwrite()
     z = PYB11readwrite()
 
+@PYB11buffer()
 class my_array:
-    def pyinit(self):
+    "numpy.asarray(a) is a writable array of Vectors, as a structured dtype"
+
+    def pyinit(self, n = ("const size_t", "0")):
         return
 
-    def data(self):
-        return "std::vector<Vector>&"
+    @PYB11const
+    def size(self):
+        return "size_t"
+
+    @PYB11cppname("operator[]")
+    @PYB11returnpolicy("reference_internal")
+    def __getitem__(self, i = "const size_t"):
+        return "Vector&"
+
+    weights = PYB11numpy_view(doc="A writable view of the weights")
+
+@PYB11buffer()
+class const_array:
+    "data() points to const, so numpy.asarray(a) is read-only"
+
+    def pyinit(self,
+               n = "const size_t",
+               val = "const double"):
+        return
+
+    @PYB11const
+    def size(self):
+        return "size_t"
+
+class field:
+    "Views of members: writable unless readonly is set or the storage is const"
+
+    def pyinit(self, n = "const size_t"):
+        return
 
-    @PYB11implementation("[](py::object& obj) -> py::array_t<double> { auto& self = obj.cast<my_array&>(); return py::array_t<double>({self.data().size()}, &(*self.data().begin()), obj); }")
-    def array(self):
-        return "py::array_t<double>"
+    values = PYB11numpy_view(doc="A std::vector<double>")
+    origin = PYB11numpy_view(doc="A std::array<double, 3>")
+    points = PYB11numpy_view(dtype="Vector", doc="A std::vector of a structured dtype")
+    coords = PYB11numpy_view(readonly=True, cppname="points", doc="The same storage, read-only")
+    weights = PYB11numpy_view(doc="A const member, so read-only")
+    ids = PYB11numpy_view(cppname="ids()", doc="A const reference from an accessor, so read-only")
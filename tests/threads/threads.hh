@@ -0,0 +1,25 @@
+#pragma once
+
+#include <vector>
+#include <string>
+
+// Not safe to use from several threads at once
+class Histogram {
+public:
+  Histogram(const size_t nbins): mCounts(nbins, 0) {}
+  void add(const size_t bin)                   { if (bin < mCounts.size()) ++mCounts[bin]; }
+  void addAll(const std::vector<size_t>& bins) { for (auto bin: bins) add(bin); }
+  size_t count(const size_t bin) const         { return mCounts[bin]; }
+  std::string name() const                     { return "Histogram"; }
+private:
+  std::vector<size_t> mCounts;
+};
+
+// Likewise
+class Counter {
+public:
+  Counter(): total(0) {}
+  void increment(const long n) { for (long i = 0; i < n; ++i) ++total; }
+  long value() const           { return total; }
+  long total;
+};
@@ -0,0 +1,51 @@
+#-------------------------------------------------------------------------------
+# Free-threaded Python: the module can be imported without turning the GIL back
+# on, and the classes serialize the calls on each instance.
+#-------------------------------------------------------------------------------
+from PYB11Generator import *
+
+PYB11includes = ['"threads.hh"',
+                 '"pybind11/stl.h"']
+
+PYB11free_threaded = True
+
+@PYB11thread_unsafe("mutex")
+class Histogram:
+    "Guarded by a mutex per instance"
+
+    def pyinit(self, nbins = "const size_t"):
+        return
+
+    def add(self, bin = "const size_t"):
+        return "void"
+
+    @PYB11releaseGIL
+    def addAll(self, bins = "const std::vector<size_t>&"):
+        "Releases the GIL while it holds the mutex"
+        return "void"
+
+    @PYB11const
+    def count(self, bin = "const size_t"):
+        return "size_t"
+
+    @PYB11thread_safe
+    @PYB11const
+    def name(self):
+        "Returns a constant, so needs no guard"
+        return "std::string"
+
+@PYB11thread_unsafe()
+class Counter:
+    "Guarded by a critical section on the Python object"
+
+    def pyinit(self):
+        return
+
+    def increment(self, n = "const long"):
+        return "void"
+
+    @PYB11const
+    def value(self):
+        return "long"
+
+    total = PYB11readwrite(doc="Unguarded, so listed in the report")
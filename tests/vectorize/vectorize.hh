@@ -0,0 +1,19 @@
+#pragma once
+
+#include <cmath>
+
+// A scalar kernel, vectorized over both arguments or only the first
+inline double kernel(const double r, const double h) {
+  const double q = r/h;
+  return q < 2.0 ? std::exp(-q*q)/h : 0.0;
+}
+
+// A class with state, so calls on one instance from several threads need a guard
+class Tally {
+public:
+  Tally(): calls(0) {}
+  double scale(const double x, const double factor) { ++calls; return factor*x; }
+  double weight(const double x) const               { return x*x; }
+  static int sign(const double x)                   { return (x > 0.0) - (x < 0.0); }
+  long calls;
+};
@@ -0,0 +1,49 @@
+#-------------------------------------------------------------------------------
+# NumPy vectorized variants of functions and methods, fully and partially
+# vectorized, with the GIL released for the loop and a thread guard taken.
+#-------------------------------------------------------------------------------
+from PYB11Generator import *
+
+PYB11includes = ['"vectorize.hh"']
+
+PYB11free_threaded = True
+
+@PYB11vectorize()
+def kernel(r = "const double",
+           h = "const double"):
+    "Vectorized over both arguments, as an overload"
+    return "double"
+
+@PYB11pycppname("kernel")
+@PYB11vectorize("r", pyname = "kernel_r")
+@PYB11releaseGIL
+def kernel1(r = "const double",
+            h = "const double"):
+    "Vectorized over r alone, releasing the GIL for the loop"
+    return "double"
+
+@PYB11thread_unsafe("mutex")
+class Tally:
+    "The vectorized scale takes the same mutex as the scalar one"
+
+    def pyinit(self):
+        return
+
+    @PYB11vectorize("x", pyname = "scale_all")
+    @PYB11releaseGIL
+    def scale(self,
+              x = "const double",
+              factor = "const double"):
+        return "double"
+
+    @PYB11vectorize()
+    @PYB11const
+    def weight(self, x = "const double"):
+        return "double"
+
+    @PYB11vectorize()
+    @PYB11static
+    def sign(self, x = "const double"):
+        return "int"
+
+    calls = PYB11readonly()